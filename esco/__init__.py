@@ -6,44 +6,47 @@ Competences, Qualifications and Occupations) data, including support for vector-
 neural search capabilities.
 """
 
+import hashlib
+import json
 import logging
 from pathlib import Path
-from typing import List
+from typing import Dict, Iterable, List, Optional
 
 import pandas as pd
 
+from esco import snapshot
+from esco.util import NS_MAP, from_curie, skills_from_records, to_curie  # noqa: F401
+
 log = logging.getLogger(__name__)
 try:
-    from esco.vector import VectorDB
+    from esco.vector import (
+        CollectionNotFound,
+        LegacyCollection,
+        NumpyVectorDB,
+        VectorDB,
+    )
 except ImportError:
     log.warning("You cannot access VectorDB functionalities: install qdrant...")
 
-NS_MAP = {
-    "esco:": "http://data.europa.eu/esco/skill/",
-    "par-tec:": "http://par-tec.it/esco/skill/",
-}
-
-
-def to_curie(uri: str):
-    """Convert a full URI to a CURIE (Compact URI) format."""
-    for k, v in NS_MAP.items():
-        if uri.startswith(v):
-            return uri.replace(v, k)
-    raise ValueError(f"Unknown prefix for {uri}")
 
-
-def from_curie(curie: str):
-    """Convert a CURIE (Compact URI) to a full URI format."""
-    if curie.startswith(("http://", "https://")):
-        return curie
-    for k, v in NS_MAP.items():
-        if curie.startswith(k):
-            return curie.replace(k, v)
-    raise ValueError(f"Unknown prefix for {curie}")
+def normalize_label(label: str) -> str:
+    """Normalize a label for case and whitespace insensitive lookups."""
+    return " ".join(label.lower().split())
 
 
 def _load_resource(name, index="uri") -> pd.DataFrame:
-    ret = pd.read_json(Path(__file__).parent / f"{name}", orient="record")
+    """
+    Load a table distributed with the package,
+    preferring its binary snapshot when it is up to date.
+    """
+    source = Path(__file__).parent / f"{name}"
+    snapshot_dir = snapshot.snapshot_path(source)
+    if snapshot.is_fresh(snapshot_dir, source):
+        ret = snapshot.read_snapshot(snapshot_dir)
+    else:
+        if snapshot_dir.exists():
+            log.warning("Ignoring stale snapshot %s", snapshot_dir)
+        ret = pd.read_json(source, orient="record")
     return ret.set_index(index)
 
 
@@ -78,6 +81,8 @@ class LocalDB:
         vector_idx_config: dict = None,
     ):
         log.info("Loading the skills from the JSON file")
+        # Incremented on every change of the skills or of the vector index.
+        self.version = 0
         self.skills = load_table("skills")
         self.vector_idx = vector_idx
         self.vector_idx_config = vector_idx_config
@@ -87,11 +92,7 @@ class LocalDB:
 
         if vector_idx_config:
             try:
-                self.vector_idx = VectorDB(
-                    skills=self.skills,
-                    force_recreate=False,
-                    config=vector_idx_config,
-                )
+                self.vector_idx = self._make_vector_idx(force_recreate=False)
             except ImportError:
                 log.warning(
                     "Could not load Qdrant and langchain database. "
@@ -99,35 +100,237 @@ class LocalDB:
                 )
                 self.vector_idx = None
 
+    def _make_vector_idx(self, force_recreate: bool):
+        """
+        Create the vector index for the backend selected in vector_idx_config:
+        - "qdrant" (default): a VectorDB;
+        - "numpy": an in-process exact NumpyVectorDB.
+        """
+        config = self.vector_idx_config or {}
+        backends = {"qdrant": VectorDB, "numpy": NumpyVectorDB}
+        backend = config.get("backend", "qdrant")
+        if backend not in backends:
+            raise ValueError(f"Unknown vector index backend {backend}")
+        return backends[backend](
+            skills=self.skills,
+            force_recreate=force_recreate,
+            config=self.vector_idx_config,
+        )
+
     def validate(self):
-        """Validate the coherence between self.skills and self.vector_idx."""
+        """
+        Validate the coherence between self.skills and self.vector_idx,
+        comparing the number of entries and the content hashes
+        of the indexed skills.
+        """
         if not self.vector_idx:
             return True
-        vector_idx_count = self.vector_idx.qdrant.client.count(
-            collection_name=self.vector_idx.config["collection_name"]
-        ).count
+        vector_idx_count = self.vector_idx.count()
         skills_count = self.skills.shape[0]
         if vector_idx_count != skills_count:
             raise ValueError(
                 f"Skills and vector index have different "
                 f"number of entries: {skills_count} vs {vector_idx_count}"
             )
+        changed, stale = self.vector_idx.diff(self.skills)
+        if changed or stale:
+            raise ValueError(
+                f"Vector index is out of sync: {len(changed)} skills "
+                f"are missing or changed, {len(stale)} are stale, e.g. "
+                f"{(changed + stale)[:3]}"
+            )
 
         return True
 
+    def sync_vector_idx(self, vector_idx_config: dict = None) -> dict:
+        """
+        Update the vector index to match self.skills,
+        upserting and deleting only the skills that changed.
+        The index is created if it does not exist, and recreated
+        if it was created by a version without the FILTER_FIELDS.
+
+        @return the number of upserted and deleted entries.
+        """
+        if vector_idx_config:
+            self.vector_idx_config = vector_idx_config
+            if self.vector_idx:
+                self.vector_idx.close()
+            self.vector_idx = None
+        if not self.vector_idx:
+            try:
+                self.vector_idx = self._make_vector_idx(force_recreate=False)
+            except (FileNotFoundError, CollectionNotFound, LegacyCollection) as e:
+                log.info("Creating the vector index: %s", e)
+                self.vector_idx = self._make_vector_idx(force_recreate=True)
+                self._changed()
+                return {"upserted": self.vector_idx.count(), "deleted": 0}
+        ret = self.vector_idx.sync(self.skills)
+        self._changed()
+        return ret
+
     def create_vector_idx(self, vector_idx_config: dict = None):
         """Create or recreate the vector index for skills search."""
 
         if vector_idx_config:
             self.vector_idx_config = vector_idx_config
         if self.vector_idx:
-            self.vector_idx.qdrant.client.close()
+            self.vector_idx.close()
 
-        self.vector_idx = VectorDB(
-            skills=self.skills,
-            force_recreate=True,
-            config=self.vector_idx_config,
+        self.vector_idx = self._make_vector_idx(force_recreate=True)
+        self._changed()
+
+    @property
+    def skills(self) -> pd.DataFrame:
+        """The skills table. Assigning it rebuilds the lookup indexes."""
+        if self._added:
+            self._skills = pd.concat([self._skills, *self._added])
+            self._added = []
+        return self._skills
+
+    @skills.setter
+    def skills(self, value: pd.DataFrame):
+        self._skills = value
+        self._added = []
+        self._build_indexes()
+        self._changed()
+
+    def _changed(self):
+        """Invalidate the results depending on the skills or the vector index."""
+        self.version += 1
+        self._skills_hash = None
+
+    def skills_hash(self) -> str:
+        """
+        @return a hash of the searchable content of the skills,
+            e.g. to detect results computed on different skills.
+            It is computed once after every change.
+        """
+        if self._skills_hash is None:
+            skills = self.skills
+            h = hashlib.sha256()
+            for row in zip(
+                skills.index.values,
+                skills.label.values,
+                skills.skillType.values,
+                skills.text.values,
+                skills.allLabel.values,
+            ):
+                h.update(json.dumps([*row[:-1], sorted(row[-1])]).encode())
+            self._skills_hash = h.hexdigest()
+        return self._skills_hash
+
+    def _build_indexes(self):
+        """
+        Build a hash index from skill URIs and CURIEs to row positions,
+        and an inverted index from normalized labels to skill URIs.
+        """
+        self._positions = {}
+        self._labels = {}
+        self._index_rows(self._skills)
+
+    def _index_rows(self, skills: pd.DataFrame, start: int = 0, labels: bool = True):
+        """
+        Add skills to the lookup indexes.
+
+        @param start: the row position of the first skill.
+        @param labels: whether to add the skill labels to the label index too.
+        """
+        for pos, (uri, all_label) in enumerate(skills.allLabel.items(), start):
+            self._positions[uri] = pos
+            try:
+                self._positions[to_curie(uri)] = pos
+            except ValueError:
+                log.debug("No CURIE for %s", uri)
+            if labels:
+                # Labels differing only in case or whitespace share a key.
+                for key in {normalize_label(label) for label in all_label}:
+                    self._labels.setdefault(key, []).append(uri)
+
+    def _remove_rows(self, uris: List[str]):
+        """Remove skills from the table and from the lookup indexes."""
+        skills = self.skills
+        first = len(skills)
+        for uri in uris:
+            pos = self._positions.pop(uri)
+            first = min(first, pos)
+            try:
+                self._positions.pop(to_curie(uri), None)
+            except ValueError:
+                log.debug("No CURIE for %s", uri)
+            for key in {normalize_label(label) for label in skills.allLabel.iat[pos]}:
+                self._labels[key].remove(uri)
+                if not self._labels[key]:
+                    del self._labels[key]
+        self._skills = skills.drop(index=uris)
+        # Removing rows shifts the positions of the following ones only.
+        self._index_rows(self._skills.iloc[first:], first, labels=False)
+
+    def add_skills(self, records: Iterable[dict]) -> List[str]:
+        """
+        Add or replace skills in place, updating the lookup indexes
+        and the vector index, without reloading the database.
+
+        @param records: skill dicts, see esco.util.skills_from_records.
+            URIs can be CURIEs, e.g. `par-tec:my-skill`.
+            If a record has no vector and the vector index uses
+            the model of the distributed skills, it is embedded.
+            Otherwise it is embedded when the vector index is built.
+        @return the URIs of the added skills.
+        """
+        new = skills_from_records(
+            {**r, "uri": from_curie(r["uri"])} if r.get("uri") else r for r in records
         )
+        if new.index.has_duplicates:
+            raise ValueError(f"Duplicate skills: {new.index[new.index.duplicated()]}")
+        missing = new.vector.isna()
+        idx = self.vector_idx
+        if missing.any() and idx and idx.model_name == idx.MODEL_NAME:
+            vectors = iter(
+                idx.embedding_function.embed_documents(new.text[missing].tolist())
+            )
+            new["vector"] = pd.Series(
+                [next(vectors) if m else v for v, m in zip(new.vector, missing)],
+                index=new.index,
+            )
+
+        replaced = [uri for uri in new.index if uri in self._positions]
+        if replaced:
+            self._remove_rows(replaced)
+        start = len(self._skills) + sum(map(len, self._added))
+        # Concatenated on the next access to self.skills,
+        # so that many additions copy the table once.
+        self._added.append(new)
+        self._index_rows(new, start)
+        self._changed()
+        if self.vector_idx:
+            self.vector_idx.upsert_skills(new)
+        log.info("Added %s skills, replacing %s", len(new), len(replaced))
+        return new.index.tolist()
+
+    def remove_skills(self, uris: Iterable[str]) -> int:
+        """
+        Remove skills in place from the table, the lookup indexes
+        and the vector index.
+
+        @param uris: URIs or CURIEs. Unknown skills are ignored.
+        @return the number of removed skills.
+        """
+        positions = {self._position(uri) for uri in uris} - {None}
+        removed = [self.skills.index[pos] for pos in sorted(positions)]
+        if removed:
+            self._remove_rows(removed)
+            self._changed()
+            if self.vector_idx:
+                self.vector_idx.delete_skills(removed)
+        return len(removed)
+
+    def _position(self, uri_or_curie: str) -> Optional[int]:
+        """@return the row position of a skill, or None if not found."""
+        pos = self._positions.get(uri_or_curie)
+        if pos is None:
+            # Normalize the URI, raising ValueError on unknown prefixes.
+            pos = self._positions.get(from_curie(uri_or_curie))
+        return pos
 
     @staticmethod
     def load_skills():
@@ -141,11 +344,10 @@ class LocalDB:
 
     def get_label(self, uri_or_curie: str):
         """Retrieve the label for a given ESCO skill URI or CURIE."""
-        uri = from_curie(uri_or_curie)
-        try:
-            return self.skills[self.skills.index == uri]["label"].iloc[0]
-        except IndexError:
+        pos = self._position(uri_or_curie)
+        if pos is None:
             return IndexError(f"URI not found in ESCO {uri_or_curie}")
+        return self.skills["label"].iat[pos]
 
     def get(self, uri_or_curie: str):
         """
@@ -153,22 +355,55 @@ class LocalDB:
 
         Returns a dictionary with skill details or None if not found.
         """
-        uri = from_curie(uri_or_curie)
-        try:
-            return self.skills[self.skills.index == uri].iloc[0].to_dict()
-        except IndexError:
+        pos = self._position(uri_or_curie)
+        if pos is None:
             return None
+        return self.skills.iloc[pos].to_dict()
+
+    def get_many(self, uris: Iterable[str]) -> List[Optional[dict]]:
+        """
+        Retrieve the full skill data for many ESCO skill URIs or CURIEs.
+
+        @return a list of skill details aligned with `uris`,
+            containing None for the entries that are not found.
+        """
+        positions = [self._position(uri) for uri in uris]
+        found = [pos for pos in positions if pos is not None]
+        records = iter(self.skills.iloc[found].to_dict(orient="records"))
+        return [next(records) if pos is not None else None for pos in positions]
 
     def search_products(self, products: List[str]) -> List[dict]:
         """
         @return a dict of skills related to a set of product labels.
         """
-        products = {p.lower() for p in products}
-        ret = self.skills[
-            self.skills.apply(lambda x: bool(x.allLabel & products), axis=1)
-        ]
+        positions = sorted(
+            {
+                self._positions[uri]
+                for product in products
+                for uri in self._labels.get(normalize_label(product), ())
+            }
+        )
+        ret = self.skills.iloc[positions]
         return ret[["label"]].reset_index().to_dict(orient="records")
 
+    def search_products_batch(self, products: Iterable[str]) -> Dict[str, List[dict]]:
+        """
+        Resolve many product labels at once,
+        e.g. all the PRODUCT entities of one or more documents.
+
+        @return a dict mapping each product label to its related skills.
+        """
+        label = self.skills["label"]
+        ret = {}
+        for product in products:
+            if product in ret:
+                continue
+            ret[product] = [
+                {"uri": uri, "label": label.iat[self._positions[uri]]}
+                for uri in self._labels.get(normalize_label(product), ())
+            ]
+        return ret
+
     def search_neural(self, text: str, **params) -> List[dict]:
         """
         @param text: the text to search for.
@@ -182,7 +417,56 @@ class LocalDB:
             raise NotImplementedError("Vector database not loaded")
         return self.vector_idx.search(text, **params)
 
+    def search_many(self, texts: Iterable[str], **params) -> List[List[dict]]:
+        """
+        @param texts: the texts to search for.
+        @param params: additional parameters to pass to the neural database,
+            see search_neural.
+        @return a list of skills for each text, embedding and searching
+            all the texts in a single batch.
+        """
+        if not self.vector_idx:
+            raise NotImplementedError("Vector database not loaded")
+        return self.vector_idx.search_many(texts, **params)
+
     def close(self):
         """Close the vector index if it exists."""
         if self.vector_idx:
             self.vector_idx.close()
+
+
+class AsyncLocalDB(LocalDB):
+    """
+    A LocalDB exposing coroutines for neural search,
+    that can be awaited by asyncio applications
+    without blocking the event loop on inference or I/O.
+
+    Loading the database is still synchronous:
+    create it once when the application starts.
+
+        async with AsyncLocalDB(vector_idx_config=cfg) as db:
+            skills = await db.asearch_neural("python developer")
+    """
+
+    async def asearch_neural(self, text: str, **params) -> List[dict]:
+        """Async version of search_neural."""
+        if not self.vector_idx:
+            raise NotImplementedError("Vector database not loaded")
+        return await self.vector_idx.asearch(text, **params)
+
+    async def asearch_many(self, texts: Iterable[str], **params) -> List[List[dict]]:
+        """Async version of search_many."""
+        if not self.vector_idx:
+            raise NotImplementedError("Vector database not loaded")
+        return await self.vector_idx.asearch_many(texts, **params)
+
+    async def aclose(self):
+        """Close the vector index if it exists."""
+        if self.vector_idx:
+            await self.vector_idx.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
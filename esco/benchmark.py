@@ -0,0 +1,354 @@
+"""
+Benchmarks of the ESCO vector indexes and of the Ner modes.
+
+Queries are embedded once, then every index configuration
+is searched with the same query vectors and compared with
+an exact brute-force baseline, reporting:
+
+- recall@k: the ratio of the baseline top-k skills that are retrieved;
+- p50/p95/p99: the latency of single searches, in milliseconds;
+- qps: the throughput of single searches;
+- batch_qps: the throughput of a single batch search.
+
+Usage:
+
+    python -m esco.benchmark vector -q tests/data/rpolli.txt \
+        -q tests/data/test-ner-skills.yaml \
+        -s '{"backend": "numpy", "quantization": "int8"}' \
+        -s '{"location": ":memory:"}' \
+        -s '{"url": "http://qdrant:6333", "search_params": {"hnsw_ef": 64}}'
+
+Settings are vector_idx_config entries (see LocalDB).
+Qdrant settings default to a temporary collection, that is created
+from the skills and dropped afterwards. Settings with another
+`collection_name` attach to that existing collection, without modifying it.
+
+The `ner` command reports the per-document time of the Ner modes
+(see esco.ner.load_model), and of the sentence search
+if a vector index is configured:
+
+    python -m esco.benchmark ner -q tests/data/rpolli.txt \
+        --model en_core_web_trf_esco_ner --mode full --mode sentencizer \
+        --vector-idx-config '{"backend": "numpy"}'
+"""
+
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Iterable, List
+
+import click
+import numpy as np
+import pandas as pd
+
+from esco import load_table
+
+log = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = [
+    {"backend": "numpy", "quantization": "int8"},
+    {"backend": "numpy", "quantization": "int8", "pca_dim": 96},
+    {"backend": "numpy", "quantization": "binary", "oversampling": 10},
+    {"location": ":memory:"},
+]
+BENCHMARK_COLLECTION = "esco-benchmark"
+
+
+def load_queries(paths: Iterable[Path], min_words: int = 5) -> List[str]:
+    """
+    Load the benchmark queries from text files and NER YAML fixtures.
+
+    Text files are split into paragraphs, like EscoCV does,
+    while YAML files provide the `text` of their `tests` entries.
+
+    @param min_words: the minimum number of words of a query.
+    @return the list of unique queries, in order.
+    """
+    queries = []
+    for path in map(Path, paths):
+        if path.suffix in (".yaml", ".yml"):
+            import yaml  # pylint: disable=import-outside-toplevel
+
+            texts = [t["text"] for t in yaml.safe_load(path.read_text())["tests"]]
+        else:
+            texts = path.read_text().split("\n\n")
+        queries.extend(" ".join(t.split()) for t in texts)
+    return [q for q in dict.fromkeys(queries) if len(q.split()) >= min_words]
+
+
+def percentiles(latencies: Iterable[float]) -> dict:
+    """@return the p50, p95 and p99 latencies in milliseconds."""
+    latencies = np.asarray(list(latencies)) * 1000
+    return {
+        f"p{p}": float(np.percentile(latencies, p)) if latencies.size else None
+        for p in (50, 95, 99)
+    }
+
+
+def _make_index(setting: dict, skills: pd.DataFrame, embeddings: dict):
+    """
+    Create the vector index of a benchmark setting.
+    Only the temporary benchmark collection is recreated.
+    """
+    from esco.vector import NumpyVectorDB, VectorDB  # pylint: disable=import-outside-toplevel
+
+    config = {"embeddings": embeddings, **setting}
+    if config.get("backend", "qdrant") == "numpy":
+        return NumpyVectorDB(skills=skills, config=config)
+    config.setdefault("collection_name", BENCHMARK_COLLECTION)
+    force_recreate = config["collection_name"] == BENCHMARK_COLLECTION
+    return VectorDB(force_recreate=force_recreate, skills=skills, config=config)
+
+
+def _close_index(idx):
+    """Close the index, dropping the temporary benchmark collection."""
+    if idx.config.get("collection_name") == BENCHMARK_COLLECTION:
+        idx.qdrant.client.delete_collection(BENCHMARK_COLLECTION)
+    idx.close()
+
+
+def _search(idx, vectors, k: int):
+    """@return the results and the latency of single searches."""
+    results, latencies = [], []
+    for vector in vectors:
+        ts = time.perf_counter()
+        results.extend(idx.search_many_by_vector([vector], k=k, score_threshold=None))
+        latencies.append(time.perf_counter() - ts)
+    return results, latencies
+
+
+def benchmark_vector(
+    queries: List[str],
+    settings: List[dict] = None,
+    k: int = 10,
+    embeddings: dict = None,
+    skills: pd.DataFrame = None,
+) -> List[dict]:
+    """
+    Compare the recall and the latency of vector index settings
+    with an exact brute-force search.
+
+    @param settings: a list of vector_idx_config, see DEFAULT_SETTINGS.
+    @param embeddings: the embedding backend configuration,
+        see esco.embeddings.get_embeddings. It is shared by all the settings.
+    @return a list of reports, one for the baseline and one for each setting.
+    """
+    from esco.vector import NumpyVectorDB  # pylint: disable=import-outside-toplevel
+
+    skills = load_table("skills") if skills is None else skills
+    embeddings = embeddings or {}
+    settings = DEFAULT_SETTINGS if settings is None else settings
+
+    baseline = NumpyVectorDB(
+        skills=skills, config={"backend": "numpy", "embeddings": embeddings}
+    )
+    ts = time.perf_counter()
+    vectors = baseline.embedding_function.embed_documents(queries)
+    log.info("Embedded %s queries in %.2fs", len(queries), time.perf_counter() - ts)
+    expected, _ = _search(baseline, vectors, k)
+    expected = [{x["uri"] for x in hits} for hits in expected]
+
+    ret = []
+    for setting in [{"backend": "numpy"}] + settings:
+        log.info("Benchmarking %s", setting)
+        is_baseline = setting == {"backend": "numpy"}
+        idx = baseline if is_baseline else _make_index(setting, skills, embeddings)
+        try:
+            results, latencies = _search(idx, vectors, k)
+            ts = time.perf_counter()
+            idx.search_many_by_vector(vectors, k=k, score_threshold=None)
+            batch_time = time.perf_counter() - ts
+        finally:
+            if not is_baseline:
+                _close_index(idx)
+        hits = sum(
+            len(e & {x["uri"] for x in actual}) for e, actual in zip(expected, results)
+        )
+        ret.append(
+            {
+                "setting": json.dumps(setting, sort_keys=True, default=str),
+                "queries": len(vectors),
+                f"recall@{k}": hits / max(sum(map(len, expected)), 1),
+                **percentiles(latencies),
+                "qps": len(vectors) / max(sum(latencies), 1e-9),
+                "batch_qps": len(vectors) / max(batch_time, 1e-9),
+            }
+        )
+    return ret
+
+
+def benchmark_ner(
+    texts: List[str],
+    model: str = "en_core_web_trf_esco_ner",
+    modes: Iterable[str] = None,
+    vector_idx_config: dict = None,
+    batch_size: int = 32,
+) -> List[dict]:
+    """
+    Compare the per-document time of the Ner modes.
+
+    @param modes: a list of esco.ner.MODES, defaulting to all of them.
+    @param vector_idx_config: the LocalDB vector index, used to time
+        the sentence search. Without it, only the NER is timed.
+    @return a list of reports, one for each mode, with:
+        - load_s: the time to load the model, in seconds;
+        - ner_ms: the time of Ner.pipe and of the NER skills, per document;
+        - sentence_ms: the time of the sentence search, per document;
+        - sentences: the number of sentences searched, see
+          EscoCV.sentence_texts;
+        - agreement: the ratio of documents with the same NER skills
+          of the first mode.
+    """
+    # pylint: disable=import-outside-toplevel
+    from esco import LocalDB
+    from esco.cv import resolve_sentence_skills
+    from esco.ner import MODES, Ner
+
+    db = LocalDB(vector_idx_config=vector_idx_config or None)
+    ret, expected = [], None
+    try:
+        for mode in modes or MODES:
+            log.info("Benchmarking the %s mode", mode)
+            ts = time.perf_counter()
+            ner = Ner(db=db, model_name_or_path=model, mode=mode)
+            load_time = time.perf_counter() - ts
+
+            ts = time.perf_counter()
+            cvs = list(ner.pipe(texts, batch_size=batch_size))
+            ner_skills = [cv.ner_skills() for cv in cvs]
+            ner_time = time.perf_counter() - ts
+
+            ts = time.perf_counter()
+            if db.vector_idx is not None:
+                resolve_sentence_skills(cvs)
+            sentence_time = time.perf_counter() - ts
+
+            expected = ner_skills if expected is None else expected
+            ret.append(
+                {
+                    "mode": mode,
+                    "docs": len(cvs),
+                    "load_s": load_time,
+                    "ner_ms": 1000 * ner_time / max(len(cvs), 1),
+                    "sentence_ms": 1000 * sentence_time / max(len(cvs), 1),
+                    "sentences": sum(len(cv.sentence_texts()) for cv in cvs),
+                    "agreement": sum(map(dict.__eq__, ner_skills, expected))
+                    / max(len(cvs), 1),
+                }
+            )
+    finally:
+        db.close()
+    return ret
+
+
+def format_table(rows: List[dict]) -> str:
+    """Format the reports as a plain text table."""
+    if not rows:
+        return ""
+
+    def fmt(value):
+        return f"{value:.3f}" if isinstance(value, float) else str(value)
+
+    columns = list(rows[0])
+    cells = [columns] + [[fmt(row[c]) for c in columns] for row in rows]
+    widths = [max(len(r[i]) for r in cells) for i in range(len(columns))]
+    lines = ["  ".join(c.ljust(w) for c, w in zip(r, widths)) for r in cells]
+    lines.insert(1, "  ".join("-" * w for w in widths))
+    return "\n".join(lines)
+
+
+def _echo(rows: List[dict], output_format: str):
+    if output_format == "json":
+        click.echo(json.dumps(rows, indent=2))
+    else:
+        click.echo(format_table(rows))
+
+
+@click.group()
+def main():
+    """Benchmark the ESCO indexes."""
+
+
+@main.command()
+@click.option(
+    "--queries",
+    "-q",
+    "query_files",
+    multiple=True,
+    required=True,
+    type=click.Path(exists=True),
+    help="Text or NER YAML files with the queries.",
+)
+@click.option(
+    "--setting",
+    "-s",
+    "settings",
+    multiple=True,
+    help="A vector_idx_config as JSON. Can be repeated.",
+)
+@click.option("-k", default=10, help="The number of results of each search.")
+@click.option(
+    "--embeddings",
+    default="{}",
+    help='The embedding backend as JSON, e.g. {"backend": "hashing"}.',
+)
+@click.option(
+    "--format", "output_format", type=click.Choice(["table", "json"]), default="table"
+)
+def vector(query_files, settings, k, embeddings, output_format):
+    """Report recall@k and latency of vector index settings."""
+    queries = load_queries(query_files)
+    rows = benchmark_vector(
+        queries,
+        settings=[json.loads(s) for s in settings] or None,
+        k=k,
+        embeddings=json.loads(embeddings),
+    )
+    _echo(rows, output_format)
+
+
+@main.command()
+@click.option(
+    "--queries",
+    "-q",
+    "query_files",
+    multiple=True,
+    required=True,
+    type=click.Path(exists=True),
+    help="Text or NER YAML files with the documents.",
+)
+@click.option("--model", default="en_core_web_trf_esco_ner", help="The spaCy model.")
+@click.option(
+    "--mode",
+    "modes",
+    multiple=True,
+    type=click.Choice(["full", "senter", "sentencizer"]),
+    help="A Ner mode. Can be repeated. Defaults to all the modes.",
+)
+@click.option(
+    "--vector-idx-config",
+    default=None,
+    help="The LocalDB vector_idx_config as JSON, to time the sentence search.",
+)
+@click.option("--batch-size", default=32, help="Texts processed in a batch.")
+@click.option(
+    "--format", "output_format", type=click.Choice(["table", "json"]), default="table"
+)
+def ner(  # pylint: disable=too-many-arguments
+    query_files, model, modes, vector_idx_config, batch_size, output_format
+):
+    """Report the per-document time of the Ner modes."""
+    rows = benchmark_ner(
+        load_queries(query_files),
+        model=model,
+        modes=modes or None,
+        vector_idx_config=json.loads(vector_idx_config or "null"),
+        batch_size=batch_size,
+    )
+    _echo(rows, output_format)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
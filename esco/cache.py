@@ -0,0 +1,222 @@
+"""
+Caching utilities shared by the esco modules.
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """
+    A bounded mapping that evicts the least recently used entries,
+    counting cache hits and misses.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """@return the value associated to key, marking it as recently used."""
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        """Store a value, evicting the least recently used entries if needed."""
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def items(self):
+        """@return a list of the cached (key, value) pairs, oldest first."""
+        with self._lock:
+            return list(self._data.items())
+
+    def clear(self):
+        """Remove all the entries and reset the counters."""
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    @property
+    def hit_rate(self) -> float:
+        """The ratio of lookups that found an entry."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> dict:
+        """@return the cache counters."""
+        return {
+            "size": len(self),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+        }
+
+
+class ResultCache:
+    """
+    A persistent cache of JSON results in a SQLite database,
+    e.g. the EscoCV results, keyed on a content hash (see `key`).
+
+    When the size of the stored values exceeds max_bytes,
+    the least recently used entries are evicted down to
+    `low_water * max_bytes`, so that evictions are infrequent.
+    The database can be shared by many processes: each process
+    keeps a running total of the stored bytes, that is synchronized
+    with the database when evicting.
+    """
+
+    low_water = 0.9
+
+    def __init__(self, path=":memory:", max_bytes: int = 256 * 2**20):
+        """
+        @param path: the SQLite database file, or ":memory:".
+        @param max_bytes: the maximum size of the stored values.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            str(path), timeout=30, check_same_thread=False, isolation_level=None
+        )
+        if str(path) != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY, value TEXT, size INTEGER, accessed INTEGER)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)"
+        )
+        self._nbytes = self._stored_bytes()
+        log.info("Opened result cache %s with %s entries", path, len(self))
+
+    @staticmethod
+    def key(*parts) -> str:
+        """@return the sha256 of the JSON serialization of parts."""
+        data = json.dumps(parts, sort_keys=True, default=str).encode()
+        return hashlib.sha256(data).hexdigest()
+
+    def get(self, key: str, default=None):
+        """@return the value associated to key, marking it as recently used."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE results SET accessed = ? WHERE key = ?", (time.time_ns(), key)
+            )
+        return json.loads(row[0])
+
+    def put(self, key: str, value):
+        """Store a value, evicting the least recently used entries if needed."""
+        data = json.dumps(value, default=str)
+        with self._lock:
+            replaced = self._conn.execute(
+                "SELECT size FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                (key, data, len(data), time.time_ns()),
+            )
+            self._nbytes += len(data) - (replaced[0] if replaced else 0)
+            if self._nbytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Other processes may have changed the table since the last eviction.
+        self._nbytes = self._stored_bytes()
+        target = int(self.max_bytes * self.low_water)
+        evicted = []
+        # The cursor walks the accessed index, stopping at the last evicted row.
+        cursor = self._conn.execute("SELECT key, size FROM results ORDER BY accessed")
+        for key, size in cursor:
+            if self._nbytes <= target:
+                break
+            evicted.append((key,))
+            self._nbytes -= size
+        cursor.close()
+        self._conn.executemany("DELETE FROM results WHERE key = ?", evicted)
+        log.debug("Evicted %s results", len(evicted))
+
+    def _stored_bytes(self) -> int:
+        return self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()[0]
+
+    @property
+    def nbytes(self) -> int:
+        """
+        The size of the stored values, not including
+        the values stored by other processes since the last eviction.
+        """
+        return self._nbytes
+
+    def clear(self):
+        """Remove all the entries and reset the counters."""
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+            self._nbytes = 0
+            self.hits = self.misses = 0
+
+    def close(self):
+        """Close the database."""
+        self._conn.close()
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def __contains__(self, key):
+        return (
+            self._conn.execute("SELECT 1 FROM results WHERE key = ?", (key,)).fetchone()
+            is not None
+        )
+
+    @property
+    def hit_rate(self) -> float:
+        """The ratio of lookups that found an entry."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> dict:
+        """@return the cache counters."""
+        return {
+            "size": len(self),
+            "nbytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+        }
@@ -11,12 +11,32 @@ Note: Avoid personal data in CV text to prevent NER confusion.
 Usage: Import EscoCV class to process CV text and extract skills.
 """
 
+import json
 import logging
+from typing import Iterable, List
 
 import esco
 
 log = logging.getLogger(__name__)
 
+# The parameters of the neural search of the sentences.
+SENTENCE_SEARCH_PARAMS = {"k": 7, "filter": {"skillType": "skill"}}
+
+
+def sentence_key(text: str, version: int = 0) -> tuple:
+    """
+    @param version: the version of the database, see LocalDB.version,
+        so that the results are searched again when the skills
+        or the vector index change.
+    @return the key of a sentence in the Ner sentence cache,
+        made of the whitespace-normalized text and the search parameters.
+    """
+    return (
+        " ".join(text.split()),
+        json.dumps(SENTENCE_SEARCH_PARAMS, sort_keys=True),
+        version,
+    )
+
 
 def entity_counter(entities: list):
     """
@@ -38,6 +58,111 @@ def entity_counter(entities: list):
     return counter
 
 
+def doc_entities(doc, labels: Iterable[str], offset: int = 0, start: int = 0) -> dict:
+    """
+    @param offset: the position of the Doc in the text, added to the entity offsets.
+    @param start: ignore the entities starting before this text position.
+    @return the entities of a Doc with the given labels, see EscoCV.entities.
+    """
+    ents = [e for e in doc.ents if e.start_char + offset >= start]
+    return {
+        "entities": [
+            {
+                "start": e.start_char + offset,
+                "end": e.end_char + offset,
+                "label": e.label_,
+                "text": e.text,
+                "id": e.ent_id_,
+            }
+            for e in ents
+            if e.label_ in labels
+        ],
+        "count": len(ents),
+    }
+
+
+def resolve_ner_skills(cvs: Iterable["EscoCV"], force=False):
+    """
+    Infer the NER skills of many CVs sharing the same Ner,
+    resolving each distinct entity of the batch only once.
+    The skills are stored in every CV, see EscoCV.ner_skills.
+    """
+    cvs = [cv for cv in cvs if force or cv._ner_skills is None]
+    if not cvs:
+        return
+    db = cvs[0].ner.db
+    counters = [entity_counter(cv.entities()["entities"]) for cv in cvs]
+    entities = [(k, e["label"]) for ents in counters for k, e in ents.items()]
+    products = db.search_products_batch(
+        dict.fromkeys(k for k, label in entities if label == "PRODUCT")
+    )
+    labels = {
+        uri: db.get_label(uri)
+        for uri in {esco.from_curie(k) for k, label in entities if label == "ESCO"}
+    }
+    for cv, ents in zip(cvs, counters):
+        ret = {}
+        for k, e in ents.items():
+            if e["label"] == "ESCO":
+                uri = esco.from_curie(k)
+                ret[uri] = {"label": labels[uri], "count": e["count"], "source": "ner"}
+            elif e["label"] == "PRODUCT":
+                for skill in products[k]:
+                    ret[skill["uri"]] = {"label": skill["label"], "count": e["count"]}
+            else:
+                log.debug("Ignoring other labels: %s", e["label"])
+        cv._ner_skills = ret  # pylint: disable=protected-access
+        cv.save(force=force)
+
+
+def resolve_sentence_skills(cvs: Iterable["EscoCV"], force=False):
+    """
+    Search the skills of the sentences of many CVs sharing the same Ner,
+    embedding and searching each distinct sentence of the batch only once.
+    Sentences found in the Ner sentence cache are not searched at all.
+    The results are stored in every CV, see EscoCV.skills_by_sentence.
+
+    @param force: search the sentences again, even if they are cached,
+        and store the new results in the cache.
+    """
+    # pylint: disable=protected-access
+    cvs = [cv for cv in cvs if force or not cv._sentences_searched]
+    if not cvs:
+        return
+    ner = cvs[0].ner
+    texts = [cv.sentence_texts() for cv in cvs]
+    keys = {
+        txt: sentence_key(txt, ner.db.version) for cv_texts in texts for txt in cv_texts
+    }
+
+    hits = {}
+    if ner.sentence_cache is not None and not force:
+        for key in dict.fromkeys(keys.values()):
+            if (cached := ner.sentence_cache.get(key)) is not None:
+                hits[key] = cached
+    missing = [key for key in dict.fromkeys(keys.values()) if key not in hits]
+
+    # Embed and search all the missing sentences in a single batch,
+    #   retrieving only entries of type "skill".
+    if missing:
+        results = ner.db.search_many(
+            [key[0] for key in missing], **SENTENCE_SEARCH_PARAMS
+        )
+        for key, result in zip(missing, results):
+            hits[key] = result
+            if ner.sentence_cache is not None:
+                ner.sentence_cache.put(key, result)
+    log.debug("Searched %s of %s sentences", len(missing), len(keys))
+
+    for cv, cv_texts in zip(cvs, texts):
+        # Copy the results, so that CVs and the cache do not share them.
+        cv.sentences = [
+            {"text": txt, "skills": [dict(skill) for skill in hits[keys[txt]]]}
+            for txt in cv_texts
+        ]
+        cv._sentences_searched = True
+
+
 class EscoCV:
     """
     A CV skill extractor.
@@ -45,21 +170,97 @@ class EscoCV:
     The text should not contain personal data,
     since this may confuse the NER model
     (e.g., the text "address: Java street" may be recognized as a skill).
+
+    If the Ner has a result cache, the results are stored in it
+    once they are complete, see `save`.
     """
 
-    def __init__(self, ner, text=None, doc=None) -> None:
+    def __init__(self, ner, text=None, doc=None, cached: dict = None) -> None:
+        """
+        @param cached: the results of a previous analysis of the text,
+            see `results`. The text is parsed only if a missing result
+            needs the spaCy Doc. If it contains the "sents" of the text,
+            they are used instead of the Doc sentences,
+            e.g. for long texts processed in windows (see Ner.window_size).
+        """
         self.ner = ner
+        self._doc = doc
+        self.text = doc.text if doc else text
+        if not doc and cached is None:
+            self._doc = self.ner.model(text)
 
-        if doc:
-            self.doc = doc
-            self.text = doc.text
-        else:
-            self.text = text
-            self.doc = self.ner.model(text)
+        cached = cached or {}
+        self._entities = cached.get("entities")
+        self._ner_skills = cached.get("ner_skills")
+        self._all_skills = cached.get("skills")
+        self._sentences_searched = "sentences" in cached
+        self._sents = cached.get("sents")
+        self.sentences = cached.get("sentences", [])
+        self._saved = False
+
+    @property
+    def doc(self):
+        """
+        The spaCy Doc of the text.
+
+        If the CV was restored from the result cache, processed in windows
+        or released, accessing it parses the whole text again:
+        prefer `entities` and `sentence_texts`, that use the stored results.
+        """
+        if self._doc is None:
+            self._doc = self.ner.model(self.text)
+        return self._doc
 
-        self._all_skills = None
-        self._ner_skills = None
-        self.sentences = []
+    @property
+    def cache_key(self):
+        """The key of the results in the Ner result cache, if any."""
+        if self.ner.result_cache is None:
+            return None
+        return self.ner.cache_key(self.text)
+
+    def release(self):
+        """
+        Release the spaCy Doc, keeping the computed results.
+        The text is parsed again only if a missing result needs it.
+        """
+        self.entities()
+        self._doc = None
+
+    def results(self) -> dict:
+        """@return the results computed so far, that can be cached."""
+        ret = {
+            "entities": self.entities(),
+            "ner_skills": self._ner_skills,
+            "skills": self._all_skills,
+        }
+        if self._sentences_searched:
+            ret["sentences"] = self.sentences
+        if self._sents is not None:
+            ret["sents"] = self._sents
+        return {k: v for k, v in ret.items() if v is not None}
+
+    @property
+    def complete(self) -> bool:
+        """
+        True if all the results are computed: the NER skills,
+        and the merged skills if the database has a vector index.
+        """
+        if self.ner.db.vector_idx is None:
+            return self._ner_skills is not None
+        return self._all_skills is not None
+
+    def save(self, force=False):
+        """
+        Store the results in the Ner result cache, if any,
+        once they are complete. They are stored only once,
+        unless force is True, e.g. after recomputing them.
+        """
+        if self.ner.result_cache is None or not self.complete:
+            return
+        if self._saved and not force:
+            return
+        self.ner.result_cache.put(self.cache_key, self.results())
+        self._saved = True
 
     def entities(self):
         """
@@ -73,20 +274,9 @@ class EscoCV:
             - 'id': entity ID
         - 'count': total number of entities found
         """
-        return {
-            "entities": [
-                {
-                    "start": e.start_char,
-                    "end": e.end_char,
-                    "label": e.label_,
-                    "text": e.text,
-                    "id": e.ent_id_,
-                }
-                for e in self.doc.ents
-                if e.label_ in self.ner.labels
-            ],
-            "count": len(self.doc.ents),
-        }
+        if self._entities is None:
+            self._entities = doc_entities(self.doc, self.ner.labels)
+        return self._entities
 
     def ner_skills(self, force=False) -> dict:
         """
@@ -99,66 +289,38 @@ class EscoCV:
             ...
           }
         """
-        if self._ner_skills and not force:
-            return self._ner_skills
-        ret = {}
-        ents = entity_counter(self.entities()["entities"])
-        for k, e in ents.items():
-            if e["label"] == "ESCO":
-                uri = esco.from_curie(k)
-                label = self.ner.db.get_label(uri)
-                ret[uri] = {"label": label, "count": e["count"], "source": "ner"}
-            elif e["label"] == "PRODUCT":
-                product_label = k.lower()
-                skills = self.ner.db.search_products(
-                    {
-                        product_label,
-                    }
-                )
-                for skill in skills:
-                    ret[skill["uri"]] = {"label": skill["label"], "count": e["count"]}
-            else:
-                log.debug("Ignoring other labels: %s", e["label"])
-        self._ner_skills = ret
-        return ret
-
-    def skills_by_sentence(self, force=False):
-        """
-        @param text: the text to search for.
-        @param params: additional parameters to pass to the neural database.
-            Currently supported:
-            - k: the number of entries to retrieve
-            - score_threshold: the score threshold
-        @return a dict of skills related to a set of product labels.
-        """
-        if self.sentences and not force:
-            return self.sentences
+        resolve_ner_skills([self], force=force)
+        return self._ner_skills
 
+    def sentence_texts(self) -> List[str]:
+        """@return the sentences with at least 5 words, used for neural search."""
         if self.ner.tokenizer:
             sentences = self.ner.tokenizer(self.text)
+        elif self._sents is not None:
+            sentences = self._sents
         else:
             sentences = (str(t) for t in self.doc.sents)
 
+        texts = []
         for sentence in sentences:
             txt = str(sentence).strip()
             if not txt:
                 continue
             if len(txt.split()) < 5:
                 continue
+            texts.append(txt)
+        return texts
 
-            skills_ = [
-                s
-                for s in self.ner.db.search_neural(
-                    txt,
-                    k=7,
-                )
-                if self.ner.db.get(s["uri"])["skillType"] == "skill"
-            ]
-            ret = {
-                "text": txt,
-                "skills": skills_,
-            }
-            self.sentences.append(ret)
+    def skills_by_sentence(self, force=False):
+        """
+        @param text: the text to search for.
+        @param params: additional parameters to pass to the neural database.
+            Currently supported:
+            - k: the number of entries to retrieve
+            - score_threshold: the score threshold
+        @return a dict of skills related to a set of product labels.
+        """
+        resolve_sentence_skills([self], force=force)
         return self.sentences
 
     def skills(self, force=False):
@@ -174,9 +336,12 @@ class EscoCV:
             - Skills with labels shorter than 5 characters are skipped.
             - For duplicate skills, count is incremented and score is maximized.
         """
-        if self._all_skills and not force:
+        if self._all_skills is not None and not force:
             return self._all_skills
-        ner_skills = {} | self.ner_skills(force=force)
+        # Copy the skills, so that the NER and sentence results are not updated.
+        ner_skills = {
+            uri: dict(skill) for uri, skill in self.ner_skills(force=force).items()
+        }
         for sentence in self.skills_by_sentence(force=force):
             for skill in sentence["skills"]:
                 uri = skill["uri"]
@@ -187,12 +352,12 @@ class EscoCV:
                     )
                     continue
                 if uri not in ner_skills:
-                    skill.setdefault("count", 1)
-                    ner_skills[uri] = skill
+                    ner_skills[uri] = {"count": 1} | skill
                 else:
                     ner_skills[uri]["count"] += 1
                     ner_skills[uri]["score"] = max(
                         skill.get("score", 0), ner_skills[uri].get("score", 0)
                     )
         self._all_skills = ner_skills
+        self.save(force=force)
         return ner_skills
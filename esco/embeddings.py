@@ -0,0 +1,323 @@
+"""
+Embedding functions used by the ESCO vector indexes.
+
+CachedEmbeddings memoizes the embeddings of recurring texts
+(e.g. boilerplate sentences in CVs and job offers),
+optionally persisting them on disk across restarts.
+
+LazyEmbeddings defers loading the embedding model until the first query.
+
+The embedding backends are selected via `get_embeddings(config)`:
+- "sentence-transformers" encodes texts with a sentence-transformers model;
+- "hashing" is a deterministic encoder that needs no model download,
+  to test and benchmark the search path offline.
+Further backends can be added via `register_backend`.
+"""
+
+import hashlib
+import importlib
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from esco.cache import LRUCache
+
+log = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize a text before embedding it.
+
+    Only whitespaces are collapsed, since the case may be
+    meaningful for the embedding model.
+    """
+    return " ".join(text.split())
+
+
+class LazyEmbeddings(Embeddings):
+    """
+    An embedding function created on first use,
+    e.g. to avoid loading a model in processes that never embed a text.
+    """
+
+    def __init__(self, factory: Callable[[], Embeddings]):
+        self.factory = factory
+        self._embeddings = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        """True if the embedding function was already created."""
+        return self._embeddings is not None
+
+    @property
+    def embeddings(self) -> Embeddings:
+        """The embedding function, created on first access."""
+        if self._embeddings is None:
+            with self._lock:
+                if self._embeddings is None:
+                    self._embeddings = self.factory()
+        return self._embeddings
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+
+class BatchedEmbeddings(Embeddings):
+    """
+    An embedding function encoding the texts in batches of `batch_size`,
+    dispatched on a pool of `workers` threads.
+
+    Threads are effective with encoders releasing the GIL,
+    such as torch or onnxruntime.
+
+    `model_name` identifies the model that produced the vectors.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: str = None,
+        batch_size: int = 64,
+        workers: int = 1,
+    ):
+        if batch_size < 1 or workers < 1:
+            raise ValueError("batch_size and workers must be positive")
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.workers = workers
+
+    @property
+    def loaded(self) -> bool:
+        """True if the wrapped embedding function was already created."""
+        return getattr(self.embeddings, "loaded", True)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed the texts, preserving their order."""
+        batches = [
+            texts[i : i + self.batch_size]
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        if self.workers == 1 or len(batches) < 2:
+            results = map(self.embeddings.embed_documents, batches)
+        else:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                results = list(executor.map(self.embeddings.embed_documents, batches))
+        return [vector for batch in results for vector in batch]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    A deterministic embedding function based on feature hashing
+    of the lowercased words and of their character trigrams.
+
+    It needs no model, and texts sharing words have similar embeddings:
+    use it for tests and benchmarks, not for semantic search.
+    """
+
+    TOKEN_RE = re.compile(r"\w+")
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    @property
+    def model_name(self) -> str:
+        return f"hashing-{self.dim}"
+
+    def _features(self, text: str):
+        for word in self.TOKEN_RE.findall(text.lower()):
+            yield word, 1.0
+            padded = f"<{word}>"
+            for i in range(len(padded) - 2):
+                yield padded[i : i + 3], 0.5
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in self._features(text):
+            digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+            h = int.from_bytes(digest, "little")
+            vector[h % self.dim] += weight if h >> 63 else -weight
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def _sentence_transformer(model_name: str, **kwargs) -> Embeddings:
+    """Create a sentence-transformers embedding function."""
+    from langchain_community.embeddings import SentenceTransformerEmbeddings
+
+    return SentenceTransformerEmbeddings(model_name=model_name, **kwargs)
+
+
+def _hashing(model_name: str = None, **kwargs) -> Embeddings:
+    """
+    Create a hashing embedding function: there is no model to load.
+
+    @param model_name: if set, it must match the name of the hashing model
+        (e.g. `hashing-384`), since hashing vectors are not comparable
+        with the ones of any other model.
+    """
+    ret = HashingEmbeddings(**kwargs)
+    if model_name and model_name != ret.model_name:
+        raise ValueError(
+            f"The hashing backend cannot produce {model_name} embeddings: "
+            f"it produces {ret.model_name}"
+        )
+    return ret
+
+
+EMBEDDING_BACKENDS: Dict[str, Callable[..., Embeddings]] = {}
+
+
+def register_backend(name: str, factory: Callable[..., Embeddings]):
+    """
+    Register an embedding backend.
+
+    @param factory: a callable accepting `model_name` and the backend
+        specific parameters, and returning an Embeddings.
+    """
+    EMBEDDING_BACKENDS[name] = factory
+
+
+register_backend("sentence-transformers", _sentence_transformer)
+register_backend("hashing", _hashing)
+
+
+def _backend_factory(backend: str) -> Callable[..., Embeddings]:
+    """@return the factory of a registered backend or of a `module:callable` path."""
+    if backend in EMBEDDING_BACKENDS:
+        return EMBEDDING_BACKENDS[backend]
+    if ":" in backend:
+        module, name = backend.split(":", 1)
+        return getattr(importlib.import_module(module), name)
+    raise ValueError(f"Unknown embedding backend {backend}")
+
+
+def get_embeddings(config: dict = None) -> Embeddings:
+    """
+    Create the embedding function described by config, e.g.:
+        {"backend": "sentence-transformers", "model_name": "all-MiniLM-L12-v2",
+         "batch_size": 64, "workers": 2}
+
+    The backend is created on first use.
+    Further entries in config are passed to the backend factory,
+    e.g. `{"backend": "hashing", "dim": 384}`.
+
+    @return an Embeddings with a `model_name` attribute,
+        identifying the model that produced the vectors.
+    """
+    config = dict(config or {})
+    backend = config.pop("backend", "sentence-transformers")
+    batch_size = config.pop("batch_size", 64)
+    workers = config.pop("workers", 1)
+    factory = _backend_factory(backend)
+
+    if backend == "hashing":
+        model_name = _hashing(**config).model_name
+    else:
+        model_name = config.get("model_name") or backend
+    return BatchedEmbeddings(
+        LazyEmbeddings(partial(factory, **config)),
+        model_name=model_name,
+        batch_size=batch_size,
+        workers=workers,
+    )
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    An embedding function with a bounded LRU cache
+    keyed on the model name and the normalized text.
+
+    If a path is provided, the cache is loaded from it
+    and can be persisted via `save()`.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: str,
+        maxsize: int = 10000,
+        path: Path = None,
+    ):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = LRUCache(maxsize=maxsize)
+        self.path = Path(path) if path else None
+        if self.path and self.path.exists():
+            self.load(self.path)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed the texts, computing only the ones missing from the cache."""
+        texts = [normalize_text(t) for t in texts]
+        vectors = [self.cache.get((self.model_name, t)) for t in texts]
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        computed = {}
+        if missing:
+            for text, vector in zip(missing, self.embeddings.embed_documents(missing)):
+                computed[text] = np.asarray(vector, dtype=np.float32)
+                self.cache.put((self.model_name, text), computed[text])
+        return [
+            (v if v is not None else computed[t]).tolist()
+            for t, v in zip(texts, vectors)
+        ]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query text, using the cache."""
+        return self.embed_documents([text])[0]
+
+    def stats(self) -> dict:
+        """@return the cache counters."""
+        return self.cache.stats()
+
+    def save(self, path: Path = None):
+        """Persist the cached embeddings of this model to an `.npz` file."""
+        path = Path(path or self.path)
+        items = [
+            (text, vector)
+            for (model_name, text), vector in self.cache.items()
+            if model_name == self.model_name
+        ]
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("wb") as fh:
+            np.savez(
+                fh,
+                model_name=np.array(self.model_name),
+                texts=np.array([t for t, _ in items], dtype=str),
+                vectors=np.array([v for _, v in items], dtype=np.float32),
+            )
+        log.info("Saved %s embeddings to %s", len(items), path)
+
+    def load(self, path: Path):
+        """Load the cached embeddings of this model from an `.npz` file."""
+        with np.load(path, allow_pickle=False) as data:
+            if str(data["model_name"]) != self.model_name:
+                log.warning(
+                    "Ignoring embedding cache %s: created with model %s",
+                    path,
+                    data["model_name"],
+                )
+                return
+            for text, vector in zip(data["texts"], data["vectors"]):
+                self.cache.put((self.model_name, str(text)), vector)
+        log.info("Loaded %s embeddings from %s", len(self.cache), path)
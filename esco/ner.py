@@ -6,14 +6,170 @@ Main component is the Ner class, a spaCy-aware ESCO skill recognizer.
 """
 
 import logging
-from typing import Collection
+from itertools import islice
+from typing import Collection, List, Optional, Tuple
 
 import spacy
+from spacy.tokens import Doc
 
-from esco.cv import EscoCV
+import esco.ruler  # noqa: F401 pylint: disable=unused-import
+from esco.cache import LRUCache, ResultCache
+from esco.cv import SENTENCE_SEARCH_PARAMS, EscoCV, doc_entities, resolve_ner_skills
 
 log = logging.getLogger(__name__)
 
+# The Ner modes: "full" loads every component of the model,
+#   while the other modes exclude the components that are not used
+#   by the NER, and split sentences with a lighter component.
+MODES = ("full", "senter", "sentencizer")
+TRIMMED_COMPONENTS = ("parser", "lemmatizer", "attribute_ruler", "tagger")
+
+# Vector index configuration entries that do not change the search results,
+#   and are not part of the result cache key.
+CONNECTION_CONFIG_KEYS = {
+    "location",
+    "url",
+    "port",
+    "grpc_port",
+    "prefer_grpc",
+    "https",
+    "api_key",
+    "prefix",
+    "timeout",
+    "host",
+    "path",
+    "embedding_cache",
+    "upsert",
+}
+
+
+def qualified_name(obj) -> Optional[str]:
+    """
+    @return the module and qualified name of a function or class,
+        or of the class of an object, that are stable across processes
+        unlike its repr.
+    """
+    if obj is None:
+        return None
+    target = obj if hasattr(obj, "__qualname__") else type(obj)
+    return f"{target.__module__}.{target.__qualname__}"
+
+
+def load_model(model_name_or_path: str, mode: str = "full"):
+    """
+    Load a spaCy model for the Ner.
+
+    @param mode: one of MODES.
+        - full: all the components, sentences are split by the parser;
+        - senter: exclude TRIMMED_COMPONENTS, and split sentences
+          with the statistical `senter`, if the model has one,
+          or with the rule-based `sentencizer`;
+        - sentencizer: exclude TRIMMED_COMPONENTS, and split sentences
+          with the rule-based `sentencizer`.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unsupported mode: {mode}. Use one of {MODES}")
+    if mode == "full":
+        return spacy.load(model_name_or_path)
+
+    nlp = spacy.load(model_name_or_path, exclude=TRIMMED_COMPONENTS)
+    if mode == "senter" and "senter" in nlp.component_names:
+        # Trained pipelines ship the senter disabled.
+        nlp.enable_pipe("senter")
+    elif not {"senter", "sentencizer"} & set(nlp.pipe_names):
+        if mode == "senter":
+            log.warning("No senter in %s, using the sentencizer", model_name_or_path)
+        nlp.add_pipe("sentencizer", first=True)
+    log.info("Loaded %s in %s mode: %s", model_name_or_path, mode, nlp.pipe_names)
+    return nlp
+
+
+def padded_size(lengths: List[List[int]], batch_size: int) -> int:
+    """
+    @param lengths: the lengths of the sequences of each document,
+        e.g. the wordpieces of the spans processed by a transformer.
+    @return the number of slots used by the documents split in batches,
+        where every sequence is padded to the longest one in its batch.
+    """
+    ret = 0
+    for i in range(0, len(lengths), batch_size):
+        batch = [n for doc in lengths[i : i + batch_size] for n in doc]
+        ret += max(batch, default=0) * len(batch)
+    return ret
+
+
+def transformer_lengths(nlp, docs: List[Doc]) -> Optional[List[List[int]]]:
+    """
+    @return the wordpiece lengths of the spans processed by the
+        spacy-transformers component of nlp for each doc, or None
+        if nlp has no such component.
+        Spans are computed by the span getter of the transformer,
+        e.g. strided spans of 128 tokens, and tokenized by its tokenizer,
+        like the spans that the transformer pads in a batch.
+    """
+    if "transformer" not in nlp.pipe_names:
+        return None
+    model = nlp.get_pipe("transformer").model
+    get_spans = model.attrs.get("get_spans")
+    tokenizer = getattr(model, "tokenizer", None)
+    if get_spans is None or tokenizer is None:
+        return None
+    spans = get_spans(docs)
+    ids = iter(tokenizer([s.text for doc in spans for s in doc])["input_ids"])
+    return [[len(next(ids)) for _ in doc] for doc in spans]
+
+
+def split_long_sentences(
+    text: str, sentences: List[Tuple[int, int]], size: int
+) -> List[Tuple[int, int]]:
+    """
+    Split the sentences longer than `size` characters,
+    e.g. bullet lists without sentence punctuation, so that
+    every window of `split_windows` is bounded.
+
+    Sentences are split at the last newline before the limit,
+    or at the last whitespace, or at the limit if there is none.
+
+    @param sentences: the (start, end) character offsets of the sentences.
+    @return the (start, end) character offsets of the split sentences.
+    """
+    ret = []
+    for start, end in sentences:
+        while end - start > size:
+            chunk = text[start : start + size]
+            cut = chunk.rfind("\n")
+            if cut <= 0:
+                cut = max(chunk.rfind(" "), chunk.rfind("\t"))
+            cut = start + (cut if cut > 0 else size)
+            ret.append((start, cut))
+            start = cut
+        ret.append((start, end))
+    return ret
+
+
+def split_windows(
+    sentences: List[Tuple[int, int]], size: int, overlap: int = 1
+) -> List[Tuple[int, int, int]]:
+    """
+    Group consecutive sentences into windows of about `size` characters.
+
+    @param sentences: the (start, end) character offsets of the sentences.
+    @param overlap: the number of sentences of the previous window
+        prepended to each window, to give context to the model.
+    @return a list of (start, own_start, end) character offsets,
+        where own_start is the end of the overlapping context:
+        every text position after it belongs to a single window.
+    """
+    ret, i = [], 0
+    while i < len(sentences):
+        j = i + 1
+        while j < len(sentences) and sentences[j][1] - sentences[i][0] <= size:
+            j += 1
+        context = sentences[max(i - overlap, 0)][0]
+        ret.append((context, sentences[i][0], sentences[j - 1][1]))
+        i = j
+    return ret
+
 
 class Ner:
     """
@@ -21,6 +177,30 @@ class Ner:
 
     It uses a spacy model to recognize entities in a text,
     and then it uses the esco database to infer skills from the entities.
+
+    When processing many texts, `pipe` can group them by length
+    to reduce the padding of transformer batches,
+    see `padding_ratio` to tune the window.
+    Lengths are measured in transformer wordpieces,
+    see `transformer_lengths`.
+
+    The `mode` parameter trims the spaCy components
+    that are not needed by the NER, see `load_model`.
+
+    With a `result_cache`, the results of already analyzed texts
+    are retrieved without running spaCy, see `cache_key`.
+
+    Texts longer than `window_size` characters are split at sentence
+    boundaries, or at whitespaces within longer sentences, into windows,
+    that are processed in batches and merged into a single EscoCV,
+    so that the memory used by the model does not depend on the text length
+    (see `split_windows` and `split_long_sentences`).
+
+    The neural search results of the sentences are cached in memory
+    and shared by all the EscoCVs, so that only new sentences
+    are searched: set `sentence_cache_size=0` to disable it.
+    Results are searched again after the skills or the vector index
+    of the database change, see LocalDB.version.
     """
 
     def __init__(
@@ -29,21 +209,208 @@ class Ner:
         model_name_or_path: str = "en_core_web_trf_esco_ner",
         labels: tuple = ("ESCO", "PRODUCT", "LANGUAGE", "LAW"),
         tokenizer=None,
+        mode: str = "full",
+        result_cache: ResultCache = None,
+        sentence_cache_size: int = 10000,
+        window_size: int = None,
+        window_overlap: int = 1,
     ):
         self.db = db
-        self.model = spacy.load(model_name_or_path)
+        self.model = load_model(model_name_or_path, mode=mode)
+        self.mode = mode
         self.labels = labels
         self.tokenizer = tokenizer
+        self.result_cache = result_cache
+        self.sentence_cache = (
+            LRUCache(maxsize=sentence_cache_size) if sentence_cache_size else None
+        )
+        self.window_size = window_size
+        self.window_overlap = window_overlap
+        self._splitter = None
+        self.padding = {"tokens": 0, "padded": 0, "unsorted_padded": 0}
+        self.padding_unit = None
 
-    def pipe(self, texts) -> Collection[EscoCV]:
+    def pipe(
+        self, texts, batch_size: int = None, bucket_window: int = None
+    ) -> Collection[EscoCV]:
         """
+        The NER skills of each batch are resolved at once,
+        so that every distinct entity is looked up only once per batch.
+
         @param texts a list of texts
+        @param batch_size the number of texts processed by spaCy in a batch
+        @param bucket_window if set, buffer this number of texts
+            and process them sorted by length, so that every batch
+            contains texts of similar length. Results are yielded
+            in the original order.
+        """
+        batch_size = batch_size or self.model.batch_size
+        if self.result_cache is None and not self.window_size:
+            cvs = self._pipe(texts, batch_size, bucket_window)
+        else:
+            cvs = self._prepared_pipe(texts, batch_size, bucket_window)
+        while batch := list(islice(cvs, batch_size)):
+            resolve_ner_skills(batch)
+            yield from batch
+
+    def _prepared_pipe(self, texts, batch_size: int, bucket_window: int = None):
+        """Batch only the texts that are neither cached nor too long."""
+        texts = iter(texts)
+        while chunk := list(islice(texts, max(batch_size, bucket_window or 0))):
+            prepared = [self._prepared(text) for text in chunk]
+            computed = self._pipe(
+                [text for text, cv in zip(chunk, prepared) if cv is None],
+                batch_size,
+                bucket_window,
+            )
+            for cv in prepared:
+                yield next(computed) if cv is None else cv
+
+    def _prepared(self, text: str) -> Optional[EscoCV]:
+        """
+        @return the EscoCV of a cached text, or of a long text
+            processed in windows. Otherwise, None.
+        """
+        if cv := self._cached(text):
+            return cv
+        if self.window_size and len(text) > self.window_size:
+            return self._windowed(text)
+        return None
+
+    def _cached(self, text: str) -> Optional[EscoCV]:
+        """@return the EscoCV of a text in the result cache, if any."""
+        if self.result_cache is None:
+            return None
+        if (cached := self.result_cache.get(self.cache_key(text))) is not None:
+            cv = EscoCV(ner=self, text=text, cached=cached)
+            cv._saved = True  # pylint: disable=protected-access
+            return cv
+        return None
+
+    def _windowed(self, text: str) -> EscoCV:
+        """
+        Process a long text in windows, see `split_windows`.
+        The entities and the sentences of the overlapping context
+        are taken from the previous window: a sentence spanning
+        the context and the window is clipped to the window.
+        """
+        if self._splitter is None:
+            self._splitter = spacy.blank(self.model.lang)
+            self._splitter.add_pipe("sentencizer")
+        spans = [(s.start_char, s.end_char) for s in self._splitter(text).sents]
+        spans = split_long_sentences(text, spans, self.window_size)
+        windows = split_windows(spans, self.window_size, self.window_overlap)
+        log.debug("Processing %s characters in %s windows", len(text), len(windows))
+
+        entities, count, sents = [], 0, []
+        docs = self.model.pipe(text[start:end] for start, _, end in windows)
+        for (start, own_start, _), doc in zip(windows, docs):
+            ents = doc_entities(doc, self.labels, offset=start, start=own_start)
+            entities += ents["entities"]
+            count += ents["count"]
+            sents += [
+                text[max(s.start_char + start, own_start) : s.end_char + start]
+                for s in doc.sents
+                if s.end_char + start > own_start
+            ]
+        return EscoCV(
+            ner=self,
+            text=text,
+            cached={"entities": {"entities": entities, "count": count}, "sents": sents},
+        )
+
+    def _pipe(self, texts, batch_size: int, bucket_window: int = None):
+        if not bucket_window:
+            for doc in self.model.pipe(texts, batch_size=batch_size):
+                yield EscoCV(ner=self, doc=doc)
+            return
+
+        texts = iter(texts)
+        while window := [self.model.make_doc(t) for t in islice(texts, bucket_window)]:
+            lengths = self._lengths(window)
+            order = sorted(range(len(window)), key=lambda i: sum(lengths[i]))
+            self._count_padding(lengths, order, batch_size)
+            docs = [None] * len(window)
+            processed = self.model.pipe(
+                (window[i] for i in order), batch_size=batch_size
+            )
+            for i, doc in zip(order, processed):
+                docs[i] = doc
+            for doc in docs:
+                yield EscoCV(ner=self, doc=doc)
+
+    def _lengths(self, docs: List[Doc]) -> List[List[int]]:
+        """
+        @return the lengths of the sequences padded by the model for each doc:
+            the transformer spans in wordpieces if the model has a transformer,
+            otherwise the whole doc in spaCy tokens.
+        """
+        lengths = transformer_lengths(self.model, docs)
+        self.padding_unit = "tokens" if lengths is None else "wordpieces"
+        return [[len(doc)] for doc in docs] if lengths is None else lengths
+
+    def _count_padding(
+        self, lengths: List[List[int]], order: List[int], batch_size: int
+    ):
+        """Update the padding counters of a window of documents."""
+        sorted_lengths = [lengths[i] for i in order]
+        self.padding["tokens"] += sum(map(sum, lengths))
+        self.padding["padded"] += padded_size(sorted_lengths, batch_size)
+        self.padding["unsorted_padded"] += padded_size(lengths, batch_size)
+        log.debug("Padding ratio: %s", self.padding_ratio())
+
+    def padding_ratio(self) -> dict:
+        """
+        @return the ratio of padding in the batches of `pipe`,
+            with and without sorting the texts by length,
+            and its unit: "wordpieces" for transformer models,
+            otherwise "tokens", that only approximate the padding
+            of the model.
+        """
+        tokens = self.padding["tokens"]
+        return {
+            "unit": self.padding_unit,
+            "padding_ratio": 1 - tokens / self.padding["padded"]
+            if self.padding["padded"]
+            else 0.0,
+            "unsorted_padding_ratio": 1 - tokens / self.padding["unsorted_padded"]
+            if self.padding["unsorted_padded"]
+            else 0.0,
+        }
+
+    def cache_key(self, text: str) -> str:
+        """
+        @return the key of the results of a text in the result cache.
+            It depends on the model, the NER and sentence parameters,
+            on the skills and on the vector index configuration,
+            except the entries in CONNECTION_CONFIG_KEYS.
         """
-        for doc in self.model.pipe(texts):
-            yield EscoCV(ner=self, doc=doc)
+        meta = self.model.meta
+        idx = self.db.vector_idx
+        return ResultCache.key(
+            text,
+            f"{meta.get('lang')}_{meta.get('name')}-{meta.get('version')}",
+            self.mode,
+            self.labels,
+            qualified_name(self.tokenizer),
+            getattr(idx, "model_name", None),
+            getattr(idx, "model_params", None),
+            {
+                k: v
+                for k, v in (getattr(idx, "config", None) or {}).items()
+                if k not in CONNECTION_CONFIG_KEYS
+            },
+            self.db.skills_hash(),
+            SENTENCE_SEARCH_PARAMS,
+            (self.window_size, self.window_overlap) if self.window_size else None,
+        )
 
     def __call__(self, text: str) -> EscoCV:
         """
         @param text a string
         """
+        if cv := self._cached(text):
+            return cv
+        if self.window_size and len(text) > self.window_size:
+            return self._windowed(text)
         return EscoCV(ner=self, text=text)
@@ -0,0 +1,283 @@
+"""
+Bulk skill extraction from JSONL files.
+
+Texts are streamed from a JSONL file, processed in chunks
+by a pool of worker processes, and the results are streamed
+to a JSONL file in the input order.
+
+Every worker loads its own Ner model and LocalDB once.
+The number of chunks in flight is bounded, so memory usage
+does not depend on the input size, and a slow consumer
+stops the input from being read.
+
+Usage:
+
+    python -m esco.pipeline cvs.jsonl skills.jsonl \
+        --model en_core_web_trf_esco_ner --mode sentencizer \
+        --vector-idx-config '{"url": "http://qdrant:6333", "collection_name": "esco"}' \
+        --batch-size 32 --n-process 4
+
+Input lines are JSON objects with a text and an optional id,
+or JSON strings. Output lines contain:
+- id: the input id, or the input line number;
+- ner_skills: the skills inferred from the NER entities;
+- skills: the NER and neural skills, if a vector index is configured;
+- error: the error message, if the text could not be processed.
+
+Already processed texts can be skipped via a --result-cache file.
+
+Local Qdrant indexes cannot be shared between processes:
+with n_process > 1, use a remote Qdrant or the numpy backend.
+"""
+
+import json
+import logging
+import threading
+from itertools import islice
+from multiprocessing import Pool
+from typing import Iterable, Iterator, List
+
+import click
+
+from esco.cache import ResultCache
+from esco.cv import resolve_sentence_skills
+from esco.ner import MODES, Ner
+from esco.result import FORMATS, CvResult, dumps
+
+log = logging.getLogger(__name__)
+
+# The Ner instance of a worker process, see _init_worker.
+_worker_ner = None
+
+
+def make_ner(
+    model: str = "en_core_web_trf_esco_ner",
+    vector_idx_config: dict = None,
+    result_cache: str = None,
+    **ner_params,
+) -> Ner:
+    """
+    Create a Ner backed by a LocalDB with the given vector index.
+
+    @param result_cache: the path of a ResultCache database,
+        that can be shared by many processes.
+    """
+    from esco import LocalDB  # pylint: disable=import-outside-toplevel
+
+    db = LocalDB(vector_idx_config=vector_idx_config or None)
+    if result_cache:
+        ner_params["result_cache"] = ResultCache(result_cache)
+    return Ner(db=db, model_name_or_path=model, **ner_params)
+
+
+def read_records(
+    lines: Iterable[str], text_key: str = "text", id_key: str = "id"
+) -> Iterator[dict]:
+    """
+    Parse JSONL lines into records with an id and a text,
+    skipping empty lines. The id defaults to the line number.
+    """
+    for lineno, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        value = json.loads(line)
+        if isinstance(value, str):
+            yield {"id": lineno, "text": value}
+        else:
+            yield {"id": value.get(id_key, lineno), "text": value[text_key]}
+
+
+def process(
+    ner: Ner, records: List[dict], batch_size: int = None, bucket_window: int = None
+) -> List[dict]:
+    """
+    Extract the skills of a chunk of records.
+    Neural skills are computed only if the database has a vector index:
+    the sentences of the whole chunk are searched in a single batch.
+    The spaCy Docs are released as soon as their results are extracted.
+
+    @param batch_size, bucket_window: see Ner.pipe.
+    @return a list of results, one for each record.
+    """
+    neural = ner.db.vector_idx is not None
+    ret = []
+    cvs = list(
+        ner.pipe(
+            (r["text"] for r in records),
+            batch_size=batch_size,
+            bucket_window=bucket_window,
+        )
+    )
+    if neural:
+        try:
+            resolve_sentence_skills(cvs)
+        except Exception:  # pylint: disable=broad-except
+            # Fall back to searching each text, to report the failing ones.
+            log.exception("Cannot search the sentences of the chunk")
+    for i, record in enumerate(records):
+        result = {"id": record["id"]}
+        try:
+            cv_result = CvResult.from_cv(cvs[i], skills=neural)
+            result |= cv_result.to_dict(keys=("ner_skills", "skills"))
+        except Exception as e:  # pylint: disable=broad-except
+            log.exception("Cannot process %s", record["id"])
+            result["error"] = str(e)
+        cvs[i] = None
+        ret.append(result)
+    return ret
+
+
+def _init_worker(ner_config: dict):
+    """Load the Ner model once per worker process."""
+    global _worker_ner  # pylint: disable=global-statement
+    _worker_ner = make_ner(**ner_config)
+
+
+def _process_chunk(args) -> List[dict]:
+    records, batch_size, bucket_window = args
+    return process(_worker_ner, records, batch_size, bucket_window)
+
+
+def _chunks(records: Iterable[dict], size: int) -> Iterator[List[dict]]:
+    records = iter(records)
+    while chunk := list(islice(records, size)):
+        yield chunk
+
+
+def run_pipeline(
+    records: Iterable[dict],
+    ner_config: dict = None,
+    batch_size: int = 32,
+    n_process: int = 1,
+    max_pending: int = None,
+    bucket_window: int = None,
+) -> Iterator[dict]:
+    """
+    Extract the skills of the records, see process().
+
+    @param ner_config: the parameters of make_ner,
+        e.g. {"model": "en_core_web_trf_esco_ner", "vector_idx_config": {...}}.
+    @param batch_size: the number of records in a chunk,
+        that is processed by spaCy in a single batch.
+    @param n_process: the number of worker processes.
+    @param max_pending: the maximum number of chunks in flight,
+        defaulting to twice n_process.
+    @param bucket_window: group this number of records by length,
+        see Ner.pipe. Chunks contain at least bucket_window records.
+    @return a generator of results, in the order of the records.
+    """
+    ner_config = ner_config or {}
+    chunks = _chunks(records, max(batch_size, bucket_window or 0))
+    if n_process == 1:
+        ner = make_ner(**ner_config)
+        for chunk in chunks:
+            yield from process(ner, chunk, batch_size, bucket_window)
+        if bucket_window:
+            log.info("Padding: %s", ner.padding_ratio())
+        return
+
+    # Pool.imap consumes its input eagerly: bound the chunks in flight
+    #   by acquiring a slot for each chunk, released when its results are yielded.
+    slots = threading.BoundedSemaphore(max_pending or 2 * n_process)
+    stop = threading.Event()
+
+    def feed():
+        for chunk in chunks:
+            while not slots.acquire(timeout=0.1):
+                if stop.is_set():
+                    return
+            yield chunk, batch_size, bucket_window
+
+    with Pool(n_process, initializer=_init_worker, initargs=(ner_config,)) as pool:
+        try:
+            for results in pool.imap(_process_chunk, feed()):
+                slots.release()
+                yield from results
+        finally:
+            stop.set()
+
+
+@click.command()
+@click.argument("source", type=click.File("r"), default="-")
+@click.argument("target", type=click.File("wb"), default="-")
+@click.option("--model", default="en_core_web_trf_esco_ner", help="The spaCy model.")
+@click.option(
+    "--mode",
+    type=click.Choice(MODES),
+    default="full",
+    help="The spaCy components to load, see esco.ner.load_model.",
+)
+@click.option(
+    "--vector-idx-config",
+    default=None,
+    help="The LocalDB vector_idx_config as JSON. Without it, only NER is used.",
+)
+@click.option("--batch-size", default=32, help="Texts processed in a batch.")
+@click.option("--n-process", default=1, help="Worker processes.")
+@click.option("--max-pending", default=None, type=int, help="Batches in flight.")
+@click.option(
+    "--bucket-window",
+    default=None,
+    type=int,
+    help="Texts grouped by length to reduce padding.",
+)
+@click.option(
+    "--window-size",
+    default=None,
+    type=int,
+    help="Process longer texts in windows of this number of characters.",
+)
+@click.option(
+    "--result-cache",
+    default=None,
+    help="A SQLite file caching the results of already processed texts.",
+)
+@click.option(
+    "--output-format",
+    type=click.Choice(FORMATS),
+    default="json",
+    help="Write JSONL, or a stream of msgpack objects.",
+)
+@click.option("--text-key", default="text", help="The key of the input texts.")
+@click.option("--id-key", default="id", help="The key of the input ids.")
+def main(  # pylint: disable=too-many-arguments
+    source,
+    target,
+    model,
+    mode,
+    vector_idx_config,
+    batch_size,
+    n_process,
+    max_pending,
+    bucket_window,
+    window_size,
+    result_cache,
+    output_format,
+    text_key,
+    id_key,
+):
+    """Extract the skills of the texts in SOURCE, writing them to TARGET."""
+    ner_config = {
+        "model": model,
+        "mode": mode,
+        "result_cache": result_cache,
+        "window_size": window_size,
+        "vector_idx_config": json.loads(vector_idx_config or "null"),
+    }
+    results = run_pipeline(
+        read_records(source, text_key=text_key, id_key=id_key),
+        ner_config=ner_config,
+        batch_size=batch_size,
+        n_process=n_process,
+        max_pending=max_pending,
+        bucket_window=bucket_window,
+    )
+    for count, result in enumerate(results, 1):
+        target.write(dumps(result, output_format))
+        if count % 1000 == 0:
+            log.info("Processed %s texts", count)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,222 @@
+"""
+Compact results of the skill extraction.
+
+A CvResult holds the entities and the skills of an EscoCV
+without the spaCy Doc, so that the Doc (and its transformer tensors)
+can be released once the results are extracted:
+
+    result = CvResult.from_cv(cv)
+    cv.release()
+
+Entities and skills are stored in `__slots__` objects,
+that use a fraction of the memory of the equivalent dicts.
+Results are serialized to JSON, or to msgpack if it is installed.
+"""
+
+import json
+from typing import Dict, Iterable, Tuple
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+FORMATS = ("json", "msgpack")
+# The keys of the serialized CvResult.
+KEYS = ("entities", "count", "ner_skills", "sentences", "skills")
+
+
+class Span:
+    """An entity span, see EscoCV.entities."""
+
+    __slots__ = ("start", "end", "label", "text", "id")
+
+    def __init__(
+        self,
+        start: int,
+        end: int,
+        label: str,
+        text: str,
+        id: str = None,  # pylint: disable=redefined-builtin
+    ):
+        self.start = start
+        self.end = end
+        self.label = label
+        self.text = text
+        self.id = id
+
+    def to_dict(self) -> dict:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    def __eq__(self, other):
+        return isinstance(other, Span) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"Span({self.start}, {self.end}, {self.label!r}, {self.text!r})"
+
+
+class SkillHit:
+    """
+    A skill inferred from an entity or found by the neural search.
+    Missing fields are None, and are omitted by to_dict.
+    """
+
+    __slots__ = ("uri", "label", "count", "score", "source")
+
+    def __init__(
+        self,
+        uri: str,
+        label: str,
+        count: int = None,
+        score: float = None,
+        source: str = None,
+    ):
+        self.uri = uri
+        self.label = label
+        self.count = count
+        self.score = score
+        self.source = source
+
+    @classmethod
+    def from_dict(cls, skill: dict, uri: str = None) -> "SkillHit":
+        """@param uri: the skill uri, if it is not in the dict."""
+        return cls(
+            uri=uri or skill["uri"],
+            label=skill["label"],
+            count=skill.get("count"),
+            score=skill.get("score"),
+            source=skill.get("source"),
+        )
+
+    def to_dict(self, uri: bool = True) -> dict:
+        """@param uri: whether to include the uri."""
+        return {
+            k: v
+            for k in self.__slots__[0 if uri else 1 :]
+            if (v := getattr(self, k)) is not None
+        }
+
+    def __eq__(self, other):
+        return isinstance(other, SkillHit) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"SkillHit({self.uri!r}, {self.label!r}, count={self.count})"
+
+
+def _skills(skills: Dict[str, dict]) -> Tuple[SkillHit, ...]:
+    return tuple(SkillHit.from_dict(skill, uri=uri) for uri, skill in skills.items())
+
+
+def _skills_dict(skills: Iterable[SkillHit]) -> Dict[str, dict]:
+    return {skill.uri: skill.to_dict(uri=False) for skill in skills}
+
+
+class CvResult:
+    """
+    The results of an EscoCV, without the spaCy Doc.
+
+    Missing results (e.g. skills, if the database has no vector index)
+    are None, and are omitted by to_dict.
+    """
+
+    __slots__ = ("entities", "entity_count", "ner_skills", "sentences", "skills")
+
+    def __init__(
+        self,
+        entities: Tuple[Span, ...] = (),
+        entity_count: int = 0,
+        ner_skills: Tuple[SkillHit, ...] = None,
+        sentences: Tuple[Tuple[str, Tuple[SkillHit, ...]], ...] = None,
+        skills: Tuple[SkillHit, ...] = None,
+    ):
+        self.entities = entities
+        self.entity_count = entity_count
+        self.ner_skills = ner_skills
+        self.sentences = sentences
+        self.skills = skills
+
+    @classmethod
+    def from_cv(cls, cv, skills: bool = None) -> "CvResult":
+        """
+        Extract the results of an EscoCV, computing the NER skills.
+
+        @param skills: whether to compute the sentence and the merged skills,
+            defaulting to True if the database has a vector index.
+        """
+        if skills is None:
+            skills = cv.ner.db.vector_idx is not None
+        entities = cv.entities()
+        ret = cls(
+            entities=tuple(Span(**e) for e in entities["entities"]),
+            entity_count=entities["count"],
+            ner_skills=_skills(cv.ner_skills()),
+        )
+        if skills:
+            ret.skills = _skills(cv.skills())
+            ret.sentences = tuple(
+                (s["text"], tuple(map(SkillHit.from_dict, s["skills"])))
+                for s in cv.skills_by_sentence()
+            )
+        return ret
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CvResult":
+        """Load a result serialized with to_dict."""
+        ret = cls(
+            entities=tuple(Span(**e) for e in data.get("entities", ())),
+            entity_count=data.get("count", 0),
+        )
+        if "ner_skills" in data:
+            ret.ner_skills = _skills(data["ner_skills"])
+        if "skills" in data:
+            ret.skills = _skills(data["skills"])
+        if "sentences" in data:
+            ret.sentences = tuple(
+                (s["text"], tuple(map(SkillHit.from_dict, s["skills"])))
+                for s in data["sentences"]
+            )
+        return ret
+
+    def to_dict(self, keys: Iterable[str] = KEYS) -> dict:
+        """
+        @param keys: the results to include, see KEYS.
+        @return a dict with the same structure of the EscoCV results,
+            without the missing results.
+        """
+        ret = {}
+        if "entities" in keys:
+            ret["entities"] = [e.to_dict() for e in self.entities]
+        if "count" in keys:
+            ret["count"] = self.entity_count
+        if "ner_skills" in keys and self.ner_skills is not None:
+            ret["ner_skills"] = _skills_dict(self.ner_skills)
+        if "sentences" in keys and self.sentences is not None:
+            ret["sentences"] = [
+                {"text": text, "skills": [s.to_dict() for s in hits]}
+                for text, hits in self.sentences
+            ]
+        if "skills" in keys and self.skills is not None:
+            ret["skills"] = _skills_dict(self.skills)
+        return ret
+
+    def __eq__(self, other):
+        return isinstance(other, CvResult) and all(
+            getattr(self, k) == getattr(other, k) for k in self.__slots__
+        )
+
+
+def dumps(data: dict, fmt: str = "json") -> bytes:
+    """
+    Serialize a result, e.g. CvResult.to_dict().
+
+    @param fmt: one of FORMATS. JSON results are newline-terminated,
+        so that they can be written to a JSONL file,
+        while msgpack results can be concatenated in a stream.
+    """
+    if fmt == "json":
+        return json.dumps(data, default=str).encode() + b"\n"
+    if fmt == "msgpack":
+        if msgpack is None:
+            raise ImportError("msgpack is not installed: `pip install msgpack`")
+        return msgpack.packb(data, default=str)
+    raise ValueError(f"Unsupported format: {fmt}. Use one of {FORMATS}")
@@ -0,0 +1,82 @@
+"""
+The entity ruler of the ESCO skills.
+
+The built-in spaCy `entity_ruler` creates its phrase patterns by processing
+them with every component preceding it in the pipeline, e.g. the transformer,
+tagger, parser and ner of en_core_web_trf. This happens when the patterns
+are added, and again every time the model is loaded.
+
+Phrase patterns matched on the text or on the lowercase text only need
+the tokenizer: the `esco_entity_ruler` factory creates them with the tokenizer
+only, so that adding thousands of ESCO labels does not slow down
+the model generation nor `spacy.load`.
+
+The factory is registered when this module is imported (e.g. by esco.ner),
+or via the `spacy_factories` entry point of the package.
+"""
+
+from typing import Callable, Optional, Union
+
+from spacy.language import Language
+from spacy.pipeline import EntityRuler
+from spacy.pipeline.entityruler import DEFAULT_ENT_ID_SEP
+
+# The token attributes set by the tokenizer, that can be matched
+#   by phrase patterns created without running the pipeline.
+TOKENIZER_ATTRS = ("ORTH", "TEXT", "LOWER")
+
+
+class EscoEntityRuler(EntityRuler):
+    """
+    An EntityRuler creating the phrase patterns with the tokenizer only,
+    if they are matched on TOKENIZER_ATTRS.
+    """
+
+    def add_patterns(self, patterns) -> None:
+        attr = self.phrase_matcher_attr
+        if attr is not None and str(attr).upper() not in TOKENIZER_ATTRS:
+            super().add_patterns(patterns)
+            return
+        with self.nlp.select_pipes(disable=self.nlp.pipe_names):
+            super().add_patterns(patterns)
+
+
+@Language.factory(
+    "esco_entity_ruler",
+    assigns=["doc.ents", "token.ent_type", "token.ent_iob"],
+    default_config={
+        "phrase_matcher_attr": None,
+        "matcher_fuzzy_compare": {"@misc": "spacy.levenshtein_compare.v1"},
+        "validate": False,
+        "overwrite_ents": False,
+        "ent_id_sep": DEFAULT_ENT_ID_SEP,
+        "scorer": {"@scorers": "spacy.entity_ruler_scorer.v1"},
+    },
+    default_score_weights={
+        "ents_f": 1.0,
+        "ents_p": 0.0,
+        "ents_r": 0.0,
+        "ents_per_type": None,
+    },
+)
+def make_esco_entity_ruler(  # pylint: disable=too-many-arguments
+    nlp: Language,
+    name: str,
+    phrase_matcher_attr: Optional[Union[int, str]],
+    matcher_fuzzy_compare: Callable,
+    validate: bool,
+    overwrite_ents: bool,
+    ent_id_sep: str,
+    scorer: Optional[Callable],
+):
+    """Create an EscoEntityRuler, with the parameters of the entity_ruler."""
+    return EscoEntityRuler(
+        nlp,
+        name,
+        phrase_matcher_attr=phrase_matcher_attr,
+        matcher_fuzzy_compare=matcher_fuzzy_compare,
+        validate=validate,
+        overwrite_ents=overwrite_ents,
+        ent_id_sep=ent_id_sep,
+        scorer=scorer,
+    )
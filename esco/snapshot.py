@@ -0,0 +1,127 @@
+"""
+Binary columnar snapshots of the ESCO tables distributed with the package.
+
+Parsing the `vector` column of `esco_s.json.gz` creates a Python list
+of floats for every skill, which dominates the cold start of `LocalDB`.
+A snapshot is a directory stored next to the JSON file, containing:
+
+- `table.json`: the metadata columns, stored column by column;
+- `vector.npy`: the embeddings as a contiguous float32 matrix,
+  that is memory-mapped when the snapshot is loaded;
+- `source.sha256`: the digest of the JSON file the snapshot was created from,
+  used to detect stale snapshots.
+
+Usage:
+    python -m esco.snapshot esco/esco_s.json.gz esco/esco_o.json.gz
+"""
+
+import hashlib
+import json
+import logging
+from pathlib import Path
+
+import click
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+SNAPSHOT_SUFFIX = ".snapshot"
+TABLE_FILE = "table.json"
+VECTOR_FILE = "vector.npy"
+SOURCE_FILE = "source.sha256"
+VECTOR_COLUMN = "vector"
+
+
+def snapshot_path(source: Path) -> Path:
+    """@return the snapshot directory associated with a `.json.gz` file."""
+    source = Path(source)
+    return source.parent / (source.name.split(".")[0] + SNAPSHOT_SUFFIX)
+
+
+def _sha256(path: Path) -> str:
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+def write_snapshot(df: pd.DataFrame, path: Path, source: Path = None) -> Path:
+    """
+    Write a table to a snapshot directory.
+
+    @param df: a table in the same format of the `.json.gz` files,
+        i.e. with the index stored in a column.
+    @param path: the snapshot directory.
+    @param source: the file the table was read from. Its digest is
+        stored in the snapshot to detect stale snapshots.
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    columns = [c for c in df.columns if c != VECTOR_COLUMN]
+    meta = {
+        "rows": len(df),
+        "columns": {c: df[c].tolist() for c in columns},
+    }
+    if VECTOR_COLUMN in df.columns:
+        vectors = np.asarray(df[VECTOR_COLUMN].tolist(), dtype=np.float32)
+        np.save(path / VECTOR_FILE, np.ascontiguousarray(vectors))
+        meta["vector"] = {"dtype": "float32", "shape": list(vectors.shape)}
+    (path / TABLE_FILE).write_text(json.dumps(meta))
+    if source:
+        (path / SOURCE_FILE).write_text(_sha256(source))
+    return path
+
+
+def read_snapshot(path: Path, mmap: bool = True) -> pd.DataFrame:
+    """
+    Read a table from a snapshot directory.
+
+    @param path: the snapshot directory.
+    @param mmap: if True, the embedding matrix is memory-mapped
+        and the `vector` column contains read-only views of its rows.
+    @return the table, with the index stored in a column.
+    """
+    path = Path(path)
+    meta = json.loads((path / TABLE_FILE).read_text())
+    df = pd.DataFrame(meta["columns"])
+    if "vector" in meta:
+        vectors = np.load(path / VECTOR_FILE, mmap_mode="r" if mmap else None)
+        if vectors.shape[0] != meta["rows"]:
+            raise ValueError(
+                f"Corrupted snapshot {path}: {vectors.shape[0]} vectors "
+                f"for {meta['rows']} rows"
+            )
+        df[VECTOR_COLUMN] = list(vectors)
+    return df
+
+
+def is_fresh(path: Path, source: Path) -> bool:
+    """@return True if the snapshot exists and was created from `source`."""
+    path = Path(path)
+    if not (path / TABLE_FILE).exists():
+        return False
+    if not Path(source).exists():
+        return True
+    if not (path / SOURCE_FILE).exists():
+        return False
+    return (path / SOURCE_FILE).read_text().strip() == _sha256(source)
+
+
+def convert(source: Path, target: Path = None) -> Path:
+    """Convert a `.json.gz` table into a snapshot."""
+    source = Path(source)
+    target = Path(target) if target else snapshot_path(source)
+    df = pd.read_json(source, orient="record")
+    log.info("Writing %s rows from %s to %s", len(df), source, target)
+    return write_snapshot(df, target, source=source)
+
+
+@click.command()
+@click.argument("sources", nargs=-1, type=click.Path(exists=True))
+def main(sources):
+    """Convert the `.json.gz` files passed on the command line."""
+    for source in sources:
+        click.echo(convert(source))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -5,6 +5,41 @@ generating text fields and label sets for semantic search.
 
 import pandas as pd
 
+SKILL_COLUMNS = [
+    "uri",
+    "label",
+    "altLabel",
+    "description",
+    "skillType",
+    "narrowers",
+    "text",
+    "allLabel",
+    "vector",
+]
+
+NS_MAP = {
+    "esco:": "http://data.europa.eu/esco/skill/",
+    "par-tec:": "http://par-tec.it/esco/skill/",
+}
+
+
+def to_curie(uri: str):
+    """Convert a full URI to a CURIE (Compact URI) format."""
+    for k, v in NS_MAP.items():
+        if uri.startswith(v):
+            return uri.replace(v, k)
+    raise ValueError(f"Unknown prefix for {uri}")
+
+
+def from_curie(curie: str):
+    """Convert a CURIE (Compact URI) to a full URI format."""
+    if curie.startswith(("http://", "https://")):
+        return curie
+    for k, v in NS_MAP.items():
+        if curie.startswith(k):
+            return curie.replace(k, v)
+    raise ValueError(f"Unknown prefix for {curie}")
+
 
 def is_valid(value):
     """
@@ -33,22 +68,63 @@ def _aggregate_skills(df):
     # Add a lowercase text field for semantic search.
 
     skills["text"] = skills.apply(
-        lambda x: "; ".join(
-            filter(
-                is_valid,
-                [x.label] + [label for label in x.altLabel if label] + [x.description],
-            )
-        ).lower(),
-        axis=1,
+        lambda x: _skill_text(x.label, x.altLabel, x.description), axis=1
     )
     # .. and a set of all the labels for each skill.
 
     skills["allLabel"] = skills.apply(
-        lambda x: {t.lower() for t in x.altLabel} | {x.label.lower()}, axis=1
+        lambda x: _all_labels(x.label, x.altLabel), axis=1
     )
     return skills
 
 
+def _skill_text(label, alt_labels, description):
+    """The lowercase text used for semantic search."""
+    return "; ".join(
+        filter(is_valid, [label] + [x for x in alt_labels if x] + [description])
+    ).lower()
+
+
+def _all_labels(label, alt_labels):
+    """The set of all the lowercase labels of a skill."""
+    return {t.lower() for t in alt_labels} | {label.lower()}
+
+
+def skills_from_records(records) -> pd.DataFrame:
+    """
+    Create a skills table from a list of records,
+    e.g. for custom skills in the `par-tec:` namespace.
+
+    Records must have an `uri` and a `label`, and can have
+    `altLabel`, `description`, `skillType` (default: "skill"),
+    `narrowers` and `vector`. The `text` and `allLabel` columns
+    are computed like for the ESCO skills.
+
+    @return a DataFrame with the same columns of the skills table, indexed by uri.
+    """
+    rows = []
+    for record in records:
+        if not record.get("uri") or not record.get("label"):
+            raise ValueError(f"Skills need an uri and a label: {record}")
+        alt_labels = record.get("altLabel") or []
+        alt_labels = [alt_labels] if isinstance(alt_labels, str) else list(alt_labels)
+        description = record.get("description") or ""
+        rows.append(
+            {
+                "uri": record["uri"],
+                "label": record["label"],
+                "altLabel": alt_labels,
+                "description": description,
+                "skillType": record.get("skillType", "skill"),
+                "narrowers": list(record.get("narrowers") or []),
+                "text": _skill_text(record["label"], alt_labels, description),
+                "allLabel": _all_labels(record["label"], alt_labels),
+                "vector": record.get("vector"),
+            }
+        )
+    return pd.DataFrame(rows, columns=SKILL_COLUMNS).set_index("uri")
+
+
 def _aggregate_occupations(df):
     """
     Aggregate occupations by uri.
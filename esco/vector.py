@@ -1,20 +1,213 @@
 """
 Manages a vector database for ESCO embeddings using Qdrant,
 providing functionalities for storage, retrieval, and search.
+
+An in-process exact index based on NumPy is provided too,
+see NumpyVectorDB.
 """
 
+import asyncio
+import hashlib
+import json
+import logging
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
 from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+from uuid import NAMESPACE_URL, UUID, uuid5
 
+import numpy as np
 import pandas as pd
 from langchain.schema import Document
-from langchain_community.embeddings import SentenceTransformerEmbeddings
 from langchain_community.vectorstores.qdrant import Qdrant
-from qdrant_client.models import Batch
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.models import (
+    Batch,
+    Distance,
+    FieldCondition,
+    Filter,
+    HnswConfigDiff,
+    MatchAny,
+    MatchValue,
+    NamedVector,
+    PayloadSchemaType,
+    PointIdsList,
+    SearchParams,
+    SearchRequest,
+)
+
+from esco.embeddings import CachedEmbeddings, get_embeddings
+from esco.util import to_curie
+
+log = logging.getLogger(__name__)
 
 MODEL_PARAMETERS = {
     "paraphrase-albert-small-v2": {"score_threshold": 0.25, "k": 10},
     "all-MiniLM-L12-v2": {"score_threshold": 0.3, "k": 10},
 }
+DEFAULT_MODEL_PARAMETERS = {"k": 10}
+
+# The model used to compute the embeddings distributed with the package.
+SKILLS_MODEL_NAME = "all-MiniLM-L12-v2"
+
+# Configuration entries consumed by esco, that are not passed to Qdrant.
+ESCO_CONFIG_KEYS = {
+    "backend",
+    "embeddings",
+    "embedding_cache",
+    "search_params",
+    "upsert",
+}
+
+# Configuration entries used to connect to Qdrant.
+QDRANT_CLIENT_KEYS = {
+    "location",
+    "url",
+    "port",
+    "grpc_port",
+    "prefer_grpc",
+    "https",
+    "api_key",
+    "prefix",
+    "timeout",
+    "host",
+    "path",
+}
+
+# Configuration entries describing the payload of the langchain collection.
+QDRANT_STORE_KEYS = {"content_payload_key", "metadata_payload_key", "vector_name"}
+
+# Skill metadata stored in the payload, that can be used to filter searches.
+FILTER_FIELDS = ("skillType", "namespace")
+
+
+class CollectionNotFound(ValueError):
+    """The vector index collection does not exist."""
+
+
+class LegacyCollection(ValueError):
+    """The vector index collection lacks the FILTER_FIELDS in the payload."""
+
+
+def _namespace(uri: str) -> str:
+    """@return the CURIE prefix of a skill URI, e.g. `esco:`."""
+    return to_curie(uri).split(":")[0] + ":"
+
+
+def _qdrant_filter(filter_: dict, metadata_key: str = "metadata") -> Filter:
+    """
+    Convert a metadata filter like `{"skillType": "skill"}`
+    to a Qdrant filter. List values match any of their items.
+    """
+    return Filter(
+        must=[
+            FieldCondition(
+                key=f"{metadata_key}.{key}",
+                match=MatchAny(any=list(value))
+                if isinstance(value, (list, tuple, set))
+                else MatchValue(value=value),
+            )
+            for key, value in filter_.items()
+        ]
+    )
+
+
+def _embedding_function(config: dict):
+    """
+    Create the embedding function described by the `embeddings` entry
+    of config (see esco.embeddings.get_embeddings), e.g.
+    `{"backend": "hashing"}`. The model is loaded on first use.
+
+    If config contains an `embedding_cache` entry, e.g.
+    `{"maxsize": 10000, "path": "embeddings.npz"}`,
+    the embeddings are cached by CachedEmbeddings.
+    """
+    embeddings_config = dict(config.get("embeddings", {}))
+    if embeddings_config.get("backend") != "hashing":
+        embeddings_config.setdefault("model_name", SKILLS_MODEL_NAME)
+    embeddings = get_embeddings(embeddings_config)
+    if cache_config := config.get("embedding_cache"):
+        cache_config = {} if cache_config is True else cache_config
+        embeddings = CachedEmbeddings(embeddings, embeddings.model_name, **cache_config)
+    return embeddings
+
+
+def _embed_skills(skills: pd.DataFrame, embeddings) -> pd.DataFrame:
+    """
+    @return the skills with the vectors computed by the embedding function,
+        if it differs from the model used for the distributed embeddings.
+        Otherwise, only the skills without a vector are embedded,
+        e.g. the ones added to a LocalDB without a vector index.
+    """
+    if embeddings.model_name != SKILLS_MODEL_NAME:
+        log.info("Embedding %s skills with %s", len(skills), embeddings.model_name)
+        return skills.assign(vector=embeddings.embed_documents(skills.text.tolist()))
+    missing = skills.vector.isna().to_numpy()
+    if not missing.any():
+        return skills
+    log.info("Embedding %s skills without vector", missing.sum())
+    vectors = iter(embeddings.embed_documents(skills.text[missing].tolist()))
+    return skills.assign(
+        vector=[next(vectors) if m else v for v, m in zip(skills.vector, missing)]
+    )
+
+
+def content_hashes(skills: pd.DataFrame, model_name: str) -> Dict[str, str]:
+    """
+    Compute a hash of the indexed content of each skill:
+    text, payload and embedding model.
+
+    The vectors are hashed only if they were computed by the model
+    of the index, otherwise they are computed from the text.
+
+    @return a dict mapping the skill URIs to their hashes.
+    """
+    with_vectors = model_name == SKILLS_MODEL_NAME
+    ret = {}
+    for uri, label, skill_type, text, vector in zip(
+        skills.index.values,
+        skills.label.values,
+        skills.skillType.values,
+        skills.text.values,
+        skills.vector.values if with_vectors else [None] * len(skills),
+    ):
+        content = json.dumps([model_name, uri, label, skill_type, text])
+        h = hashlib.sha256(content.encode())
+        if with_vectors:
+            h.update(np.asarray(vector, dtype=np.float32).tobytes())
+        ret[uri] = h.hexdigest()
+    return ret
+
+
+def _diff(expected: Dict[str, str], actual: Dict[str, str]) -> Tuple[list, list]:
+    """
+    Compare the expected content hashes with the indexed ones.
+
+    @return the URIs to upsert and the URIs to delete.
+    """
+    changed = [uri for uri, h in expected.items() if actual.get(uri) != h]
+    stale = [uri for uri in actual if uri not in expected]
+    return changed, stale
+
+
+def _point_id(uri: str) -> str:
+    """
+    @return the Qdrant point id of a skill: the UUID ending ESCO URIs,
+        or a UUID derived from the URI of custom skills.
+    """
+    tail = uri.split("/")[-1]
+    try:
+        return str(UUID(tail))
+    except ValueError:
+        return str(uuid5(NAMESPACE_URL, uri))
+
+
+def _close_embeddings(embeddings):
+    """Persist the embedding cache, if any."""
+    if isinstance(embeddings, CachedEmbeddings) and embeddings.path:
+        embeddings.save()
 
 
 class ReadOnlyQdrant(Qdrant):
@@ -28,6 +221,23 @@ class ReadOnlyQdrant(Qdrant):
         return
 
 
+async def _run_in_executor(func, *args):
+    """
+    Run a blocking function, e.g. an embedding model inference,
+    in the default executor of the running loop.
+    """
+    return await asyncio.get_running_loop().run_in_executor(None, partial(func, *args))
+
+
+def _result(metadata: dict, score: float) -> dict:
+    """@return a search result from the metadata of a point."""
+    return {
+        "uri": metadata.get("uri") or metadata["id"],
+        "label": metadata["label"],
+        "score": score,
+    }
+
+
 class VectorDB:
     """
     A database containing the embeddings of ESCO.
@@ -39,17 +249,37 @@ class VectorDB:
     To connect to a remote qdrant instance, use the following parameters:
         - url: http://localhost:18890
         - collection_name: esco
+
+    Searches can be restricted via a metadata filter on the FILTER_FIELDS, e.g.:
+        - search(text, filter={"skillType": "skill", "namespace": "esco:"})
+
+    The HNSW index can be tuned via the following parameters, e.g.:
+        - hnsw_config: {"m": 16, "ef_construct": 100}, used on creation;
+        - search_params: {"hnsw_ef": 128}, used on search.
+
+    The bulk upload of the skills can be tuned via the `upsert` parameter,
+    see `upsert_skills`, e.g.:
+        - upsert: {"batch_size": 256, "workers": 4, "checkpoint": "upsert.json"}
+
+    Use `sync(skills)` to upsert and delete only the skills
+    whose content changed since they were indexed, see content_hashes.
+
+    The `asearch*` coroutines do not block the event loop:
+    embeddings are computed in an executor, and remote indexes
+    are queried via the Qdrant async client.
     """
 
-    MODEL_NAME = "all-MiniLM-L12-v2"
+    MODEL_NAME = SKILLS_MODEL_NAME
 
     def __init__(
         self, force_recreate=False, model_params=None, skills=None, config=None
     ) -> None:
-        self.model_name = self.MODEL_NAME
-        self.model_params = model_params or MODEL_PARAMETERS.get(self.model_name)
-        self.embedding_function = SentenceTransformerEmbeddings(
-            model_name=self.model_name
+        self.embedding_function = _embedding_function(config or {})
+        self._async_client = None
+        self._closing = None
+        self.model_name = self.embedding_function.model_name
+        self.model_params = model_params or MODEL_PARAMETERS.get(
+            self.model_name, DEFAULT_MODEL_PARAMETERS
         )
         self.config = config or {
             "path": f"qdrant-esco-{self.model_name}",
@@ -61,6 +291,16 @@ class VectorDB:
                 raise FileNotFoundError(f"Vector database not found at {idx_path}")
             Path(idx_path).mkdir(parents=True, exist_ok=True)
 
+        if not force_recreate:
+            # The skills vectors can only be checked if computed by the same model.
+            same_model = self.model_name == SKILLS_MODEL_NAME
+            self.qdrant = self._attach(skills if same_model else None)
+            return
+
+        # Don't drop the collection when resuming an interrupted upload.
+        checkpoint = self.config.get("upsert", {}).get("checkpoint")
+        resume = bool(checkpoint) and Path(checkpoint).exists()
+
         one_document = [
             Document(
                 page_content=skill["text"],
@@ -71,61 +311,922 @@ class VectorDB:
         self.qdrant = ReadOnlyQdrant.from_documents(
             one_document,
             self.embedding_function,
-            force_recreate=force_recreate,
-            **self.config,
+            force_recreate=not resume,
+            **self._client_config(),
+        )
+        if not self._is_local():
+            for field in FILTER_FIELDS:
+                self.qdrant.client.create_payload_index(
+                    collection_name=self.config["collection_name"],
+                    field_name=f"{self.qdrant.metadata_payload_key}.{field}",
+                    field_schema=PayloadSchemaType.KEYWORD,
+                )
+        self._recreate(skills)
+
+    def _is_local(self) -> bool:
+        """True if the database is managed in-process by the Qdrant client."""
+        return (
+            bool(self.config.get("path")) or self.config.get("location") == ":memory:"
+        )
+
+    def _client_config(self) -> dict:
+        """@return the configuration entries to be passed to Qdrant."""
+        ret = {k: v for k, v in self.config.items() if k not in ESCO_CONFIG_KEYS}
+        if isinstance(ret.get("hnsw_config"), dict):
+            ret["hnsw_config"] = HnswConfigDiff(**ret["hnsw_config"])
+        return ret
+
+    def _search_params(self) -> SearchParams:
+        """@return the Qdrant search parameters, if configured."""
+        if search_params := self.config.get("search_params"):
+            return SearchParams(**search_params)
+        return None
+
+    def _attach(self, skills: pd.DataFrame = None) -> ReadOnlyQdrant:
+        """
+        Connect to an existing collection without embedding any document.
+
+        The collection must use cosine distance, and its vectors must have
+        the same dimension of the skills embeddings.
+        The embedding model is loaded on the first query.
+        """
+        collection_name = self.config["collection_name"]
+        client = QdrantClient(
+            **{k: v for k, v in self.config.items() if k in QDRANT_CLIENT_KEYS}
+        )
+        store_config = {k: v for k, v in self.config.items() if k in QDRANT_STORE_KEYS}
+        try:
+            if not client.collection_exists(collection_name):
+                raise CollectionNotFound(
+                    f"Collection {collection_name} not found: "
+                    "create it with force_recreate=True"
+                )
+            vectors = client.get_collection(collection_name).config.params.vectors
+            if vector_name := store_config.get("vector_name"):
+                vectors = vectors[vector_name]
+            if vectors.distance != Distance.COSINE:
+                raise ValueError(
+                    f"Collection {collection_name} uses {vectors.distance} distance"
+                )
+            if skills is not None and vectors.size != len(skills.vector.iloc[0]):
+                raise ValueError(
+                    f"Collection {collection_name} has vectors of size "
+                    f"{vectors.size}, while skills have {len(skills.vector.iloc[0])}"
+                )
+
+            # Check that points have the payload expected by search().
+            metadata_key = store_config.get("metadata_payload_key", "metadata")
+            points, _ = client.scroll(collection_name, limit=1, with_payload=True)
+            for point in points:
+                metadata = point.payload.get(metadata_key) or {}
+                if {"uri", "label"} - set(metadata):
+                    raise ValueError(
+                        f"Collection {collection_name} has unexpected payload: "
+                        f"{point.payload}"
+                    )
+                if missing := set(FILTER_FIELDS) - set(metadata):
+                    # Filtered searches would silently return no hits.
+                    raise LegacyCollection(
+                        f"Collection {collection_name} lacks {sorted(missing)} "
+                        "in payload: recreate it with force_recreate=True"
+                    )
+        except Exception:
+            client.close()
+            raise
+
+        return ReadOnlyQdrant(
+            client=client,
+            collection_name=collection_name,
+            embeddings=self.embedding_function,
+            **store_config,
         )
-        if force_recreate:
-            self._recreate(skills)
 
     def _recreate(self, skills: pd.DataFrame):
         """
         Recreates the vector database by upserting skill embeddings from the
         provided DataFrame, raising an error if the operation fails.
         """
-        points = Batch(
-            ids=[x.split("/")[-1] for x in skills.index.values],
+        return self.upsert_skills(skills, **self.config.get("upsert", {}))
+
+    def _points(self, skills: pd.DataFrame, hashes: Dict[str, str]) -> Batch:
+        """
+        @param hashes: the content hashes of the skills, see content_hashes.
+        @return the points representing the skills.
+        """
+        return Batch(
+            ids=[_point_id(x) for x in skills.index.values],
             payloads=[
-                {"metadata": {"label": label, "uri": i}, "page_content": t}
-                for t, label, i in zip(
-                    skills.text.values, skills.label.values, skills.index.values
+                {
+                    "metadata": {
+                        "label": label,
+                        "uri": i,
+                        "skillType": skill_type,
+                        "namespace": _namespace(i),
+                        "hash": hashes[i],
+                    },
+                    "page_content": t,
+                }
+                for t, label, i, skill_type in zip(
+                    skills.text.values,
+                    skills.label.values,
+                    skills.index.values,
+                    skills.skillType.values,
                 )
             ],
-            vectors=skills.vector.values,
+            vectors=skills.vector.tolist(),
         )
+
+    def _upsert_chunk(self, skills: pd.DataFrame, hashes: Dict[str, str]):
+        """Upserts a chunk of skills, raising an error if the operation fails."""
         ret = self.qdrant.client.upsert(
-            collection_name=self.config["collection_name"], points=points
+            collection_name=self.config["collection_name"],
+            points=self._points(skills, hashes),
         )
         if ret.status.value != "completed":
             raise ValueError(f"Could not add points to Qdrant: {ret}")
         return ret
 
-    def scroll(self, limit=10000):  # pylint: disable=unused-argument
+    def upsert_skills(
+        self,
+        skills: pd.DataFrame,
+        batch_size: int = 256,
+        workers: int = 4,
+        checkpoint: Path = None,
+    ) -> int:
+        """
+        Upserts the skill embeddings in chunks of `batch_size` points,
+        sending up to `workers` concurrent requests and logging the throughput.
+
+        Local databases are not thread-safe, so they use a single worker.
+        If the index uses another model than the skills vectors,
+        the skills are embedded first.
+
+        @param checkpoint: a JSON file recording the completed chunks.
+            If the upload fails, calling this method again with the same
+            skills and batch_size resumes from the missing chunks.
+            The file is removed when the upload completes.
+        @return the number of upserted points.
+        """
+        if self._is_local():
+            workers = 1
+        # Hash the skills as they are compared by diff(),
+        #   i.e. before embedding the ones without a vector.
+        hashes = content_hashes(skills, self.model_name)
+        skills = _embed_skills(skills, self.embedding_function)
+        state = {
+            "collection_name": self.config["collection_name"],
+            "size": len(skills),
+            "batch_size": batch_size,
+        }
+        done = set()
+        if checkpoint and Path(checkpoint).exists():
+            saved = json.loads(Path(checkpoint).read_text())
+            if {k: saved.get(k) for k in state} == state:
+                done = set(saved["done"])
+                log.info("Resuming upload: %s chunks already completed", len(done))
+            else:
+                log.warning("Ignoring checkpoint %s for different data", checkpoint)
+
+        todo = [i for i in range(0, len(skills), batch_size) if i not in done]
+        upserted, ts_start = 0, time.time()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = {}
+            while todo or pending:
+                # Bound the number of in-flight chunks.
+                while todo and len(pending) < 2 * workers:
+                    start = todo.pop(0)
+                    chunk = skills[start : start + batch_size]
+                    pending[executor.submit(self._upsert_chunk, chunk, hashes)] = start
+                completed, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    start = pending.pop(future)
+                    future.result()
+                    done.add(start)
+                    upserted += min(batch_size, len(skills) - start)
+                    if checkpoint:
+                        Path(checkpoint).write_text(
+                            json.dumps(state | {"done": sorted(done)})
+                        )
+                log.info(
+                    "Upserted %s points (%.0f points/s)",
+                    upserted,
+                    upserted / max(time.time() - ts_start, 1e-6),
+                )
+
+        if checkpoint:
+            Path(checkpoint).unlink(missing_ok=True)
+        return upserted
+
+    def delete_skills(self, uris: Iterable[str]) -> int:
+        """
+        Deletes the points of the given skills.
+
+        @return the number of deleted points.
+        """
+        ids = [_point_id(uri) for uri in uris]
+        if ids:
+            self.qdrant.client.delete(
+                collection_name=self.config["collection_name"],
+                points_selector=PointIdsList(points=ids),
+            )
+        return len(ids)
+
+    def hashes(self) -> Dict[str, str]:
+        """
+        @return a dict mapping the indexed skill URIs to their content hash,
+            that is None for points indexed without a hash.
+        """
+        metadata_key = self.qdrant.metadata_payload_key
+        ret = {}
+        for points in self.iter_points(
+            with_payload=[f"{metadata_key}.uri", f"{metadata_key}.hash"]
+        ):
+            for point in points:
+                metadata = point.payload.get(metadata_key) or {}
+                ret[metadata.get("uri")] = metadata.get("hash")
+        return ret
+
+    def diff(self, skills: pd.DataFrame) -> Tuple[list, list]:
+        """
+        Compare the skills with the indexed ones via their content hashes.
+
+        @return the URIs of the skills that are missing or changed
+            and the URIs of the indexed skills that are not in skills.
+        """
+        return _diff(content_hashes(skills, self.model_name), self.hashes())
+
+    def sync(self, skills: pd.DataFrame, **upsert_params) -> dict:
+        """
+        Update the index to match the skills, upserting the changed ones
+        and deleting the stale ones. Unchanged skills are not embedded.
+
+        @param upsert_params: see upsert_skills.
+        @return the number of upserted and deleted points.
+        """
+        changed, stale = self.diff(skills)
+        upserted = 0
+        if changed:
+            upserted = self.upsert_skills(
+                skills.loc[changed],
+                **{**self.config.get("upsert", {}), **upsert_params},
+            )
+        deleted = self.delete_skills(stale)
+        log.info("Synced the index: %s upserted, %s deleted", upserted, deleted)
+        return {"upserted": upserted, "deleted": deleted}
+
+    def scroll(self, limit=10000, offset=None, **params):
         """
         Retrieves a specified number of documents from the vector database,
         defaulting to 10,000, using the Qdrant client.
+
+        @return a tuple with the points and the offset of the next page,
+            see iter_points to page through the whole collection.
         """
         return self.qdrant.client.scroll(
-            collection_name=self.config["collection_name"], limit=10000
+            collection_name=self.config["collection_name"],
+            limit=limit,
+            offset=offset,
+            **params,
         )
 
+    def iter_points(
+        self,
+        batch_size: int = 256,
+        with_payload=True,
+        with_vectors=False,
+        scroll_filter=None,
+    ):
+        """
+        Pages through the collection using the Qdrant offset cursor,
+        so that memory usage does not depend on the collection size.
+
+        @param with_payload: True, False or the list of payload keys to fetch.
+        @param with_vectors: whether to fetch the vectors.
+        @param scroll_filter: a Qdrant filter or a metadata filter dict,
+            see FILTER_FIELDS.
+        @return a generator of lists of at most batch_size points.
+        """
+        if isinstance(scroll_filter, dict):
+            scroll_filter = _qdrant_filter(
+                scroll_filter, self.qdrant.metadata_payload_key
+            )
+        offset = None
+        while True:
+            points, offset = self.scroll(
+                limit=batch_size,
+                offset=offset,
+                with_payload=with_payload,
+                with_vectors=with_vectors,
+                scroll_filter=scroll_filter,
+            )
+            if points:
+                yield points
+            if offset is None:
+                return
+
+    def count(self) -> int:
+        """Returns the number of points in the collection."""
+        return self.qdrant.client.count(
+            collection_name=self.config["collection_name"]
+        ).count
+
     def search(self, text, **params):
         """
         Performs a similarity search in the vector database using the provided text
         and additional parameters, returning the matching documents with their
         metadata and similarity scores.
+
+        @param params: the parameters of similarity_search_with_score, e.g.
+            k, score_threshold and filter. A dict filter is applied
+            to the skill metadata, see FILTER_FIELDS.
         """
-        params = {**self.model_params, **params}
+        params = {**self.model_params, "search_params": self._search_params(), **params}
+        if isinstance(params.get("filter"), dict):
+            params["filter"] = _qdrant_filter(
+                params["filter"], self.qdrant.metadata_payload_key
+            )
         return [
-            {
-                "uri": x[0].metadata.get("uri") or x[0].metadata["id"],
-                "label": x[0].metadata["label"],
-                "score": x[1],
-            }
+            _result(x[0].metadata, x[1])
             for x in self.qdrant.similarity_search_with_score(text, **params)
         ]
 
+    def search_many(self, texts, **params):
+        """
+        Performs a similarity search for each of the provided texts,
+        embedding them in a single batch and sending a single batch
+        request to Qdrant.
+
+        @param params: k, score_threshold and filter, see search().
+        @return a list of results for each text, in the same order.
+        """
+        texts = list(texts)
+        if not texts:
+            return []
+        return self.search_many_by_vector(
+            self.embedding_function.embed_documents(texts), **params
+        )
+
+    def search_many_by_vector(self, vectors, **params):
+        """
+        Performs a similarity search for each of the provided embeddings
+        with a single batch request to Qdrant.
+
+        @param params: k, score_threshold and filter, see search().
+        @return a list of results for each embedding, in the same order.
+        """
+        requests = self._search_requests(vectors, params)
+        if not requests:
+            return []
+        return self._results(
+            self.qdrant.client.search_batch(
+                collection_name=self.config["collection_name"], requests=requests
+            )
+        )
+
+    def _search_requests(self, vectors, params: dict) -> List[SearchRequest]:
+        """@return the Qdrant requests to search the embeddings."""
+        params = {**self.model_params, **params}
+        vector_name = self.qdrant.vector_name
+        filter_ = params.get("filter")
+        if isinstance(filter_, dict):
+            filter_ = _qdrant_filter(filter_, self.qdrant.metadata_payload_key)
+        return [
+            SearchRequest(
+                vector=NamedVector(name=vector_name, vector=list(vector))
+                if vector_name
+                else list(vector),
+                limit=params["k"],
+                score_threshold=params.get("score_threshold"),
+                filter=filter_,
+                params=self._search_params(),
+                with_payload=True,
+            )
+            for vector in vectors
+        ]
+
+    def _results(self, batch) -> List[List[dict]]:
+        """@return the search results of a batch of Qdrant responses."""
+        metadata_key = self.qdrant.metadata_payload_key
+        return [
+            [
+                _result(point.payload.get(metadata_key) or {}, point.score)
+                for point in hits
+            ]
+            for hits in batch
+        ]
+
+    @property
+    def async_client(self) -> AsyncQdrantClient:
+        """
+        The async client of a remote index, created on first use.
+
+        Local indexes cannot be opened by more than one client,
+        so they are searched via the sync client in an executor.
+        """
+        if self._is_local():
+            return None
+        if self._async_client is None:
+            self._async_client = AsyncQdrantClient(
+                **{k: v for k, v in self.config.items() if k in QDRANT_CLIENT_KEYS}
+            )
+        return self._async_client
+
+    async def asearch(self, text, **params):
+        """
+        Async version of search(): the text is embedded in an executor.
+
+        @param params: k, score_threshold and filter, see search().
+        """
+        vector = await _run_in_executor(self.embedding_function.embed_query, text)
+        return (await self.asearch_many_by_vector([vector], **params))[0]
+
+    async def asearch_many(self, texts, **params):
+        """
+        Async version of search_many(): the texts are embedded in an executor.
+
+        @param params: k, score_threshold and filter, see search().
+        @return a list of results for each text, in the same order.
+        """
+        texts = list(texts)
+        if not texts:
+            return []
+        vectors = await _run_in_executor(self.embedding_function.embed_documents, texts)
+        return await self.asearch_many_by_vector(vectors, **params)
+
+    async def asearch_many_by_vector(self, vectors, **params):
+        """
+        Async version of search_many_by_vector().
+
+        @return a list of results for each embedding, in the same order.
+        """
+        if self.async_client is None:
+            return await _run_in_executor(
+                partial(self.search_many_by_vector, vectors, **params)
+            )
+        requests = self._search_requests(vectors, params)
+        if not requests:
+            return []
+        return self._results(
+            await self.async_client.search_batch(
+                collection_name=self.config["collection_name"], requests=requests
+            )
+        )
+
     def close(self):
         """
         function to close client
+
+        The async client, if any, is closed too: in the running loop
+        when called by a coroutine, otherwise in a new loop.
+        Prefer aclose() in async code, to wait for it.
         """
+        self._close_async_client()
+        _close_embeddings(self.embedding_function)
         self.qdrant.client.close()
+
+    def _close_async_client(self):
+        client, self._async_client = self._async_client, None
+        if client is None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        try:
+            if loop is None:
+                asyncio.run(client.close())
+            else:
+                self._closing = loop.create_task(client.close())
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            log.warning("Cannot close the async client: %s", e)
+
+    async def aclose(self):
+        """Close the async client, if any, and the index."""
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
+        self.close()
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """@return the positions of the k highest scores, sorted by score."""
+    if k < len(scores):
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(len(scores))
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """@return the vectors scaled to unit norm along the last axis."""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _mapped_matrix(skills: pd.DataFrame) -> Optional[np.memmap]:
+    """
+    @return the memory-mapped matrix whose rows are the skills vectors,
+        in the same order, e.g. when the skills are loaded from a snapshot.
+    """
+    if not len(skills):
+        return None
+    matrix = getattr(skills.vector.iloc[0], "base", None)
+    if not isinstance(matrix, np.memmap) or matrix.shape[0] != len(skills):
+        return None
+    offsets = [
+        v.ctypes.data if getattr(v, "base", None) is matrix else -1
+        for v in skills.vector
+    ]
+    expected = matrix.ctypes.data + np.arange(len(skills)) * matrix.strides[0]
+    return matrix if np.array_equal(offsets, expected) else None
+
+
+def _spill(vectors: np.ndarray) -> np.ndarray:
+    """
+    @return a read-only memory-mapped copy of the vectors,
+        backed by an anonymous temporary file,
+        so that they are paged in from disk instead of kept in memory.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if not vectors.size:
+        return vectors
+    with tempfile.TemporaryFile() as f:
+        vectors.tofile(f)
+        f.flush()
+        return np.memmap(f, dtype=np.float32, mode="r", shape=vectors.shape)
+
+
+# Popcount of every byte value, to compute hamming distances of binary codes.
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(1)
+
+
+class Quantizer:
+    """
+    Compresses normalized embeddings into int8 or binary codes,
+    optionally projecting them on their first `pca_dim` principal components.
+
+    Codes are used to approximate the similarity scores:
+    - int8 codes store every component scaled to [-127, 127];
+    - binary codes store the sign of every component,
+      and similarity is derived from the hamming distance.
+    """
+
+    # Rows scored at once, to bound the memory used to decode int8 codes.
+    CHUNK_SIZE = 4096
+
+    def __init__(self, kind: str = "int8", pca_dim: int = None):
+        if kind not in ("int8", "binary"):
+            raise ValueError(f"Unknown quantization {kind}")
+        self.kind = kind
+        self.pca_dim = pca_dim
+        self.mean = None
+        self.components = None
+        self.scale = None
+        self.bits = None
+
+    def fit(self, vectors: np.ndarray) -> "Quantizer":
+        """Compute the projection and the scale from the vectors."""
+        if self.pca_dim:
+            self.mean = vectors.mean(axis=0)
+            _, _, vt = np.linalg.svd(vectors - self.mean, full_matrices=False)
+            self.components = np.ascontiguousarray(vt[: self.pca_dim].T)
+        projected = self.project(vectors)
+        self.bits = projected.shape[1]
+        max_abs = np.abs(projected).max(axis=0)
+        self.scale = (np.where(max_abs == 0, 1, max_abs) / 127).astype(np.float32)
+        return self
+
+    def project(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        @return the vectors projected on the principal components, if any,
+            and normalized so that the scores approximate cosine similarities.
+        """
+        if self.components is None:
+            return vectors
+        return _normalize((vectors - self.mean) @ self.components)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """@return the codes of the vectors."""
+        projected = self.project(vectors)
+        if self.kind == "binary":
+            return np.packbits(projected > 0, axis=-1)
+        return np.clip(np.rint(projected / self.scale), -127, 127).astype(np.int8)
+
+    def scores(self, codes: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        """@return the approximate similarity between the queries and the codes."""
+        projected = self.project(queries)
+        ret = np.empty((len(queries), len(codes)), dtype=np.float32)
+        if self.kind == "binary":
+            query_codes = np.packbits(projected > 0, axis=-1)
+            for i, query_code in enumerate(query_codes):
+                distance = _POPCOUNT[codes ^ query_code].sum(axis=1)
+                ret[i] = 1 - 2 * distance / self.bits
+            return ret
+        scaled = (projected * self.scale).astype(np.float32)
+        for start in range(0, len(codes), self.CHUNK_SIZE):
+            chunk = codes[start : start + self.CHUNK_SIZE].astype(np.float32)
+            ret[:, start : start + len(chunk)] = scaled @ chunk.T
+        return ret
+
+    @property
+    def nbytes(self) -> int:
+        """The memory used by the projection."""
+        if self.components is None:
+            return self.scale.nbytes
+        return self.mean.nbytes + self.components.nbytes + self.scale.nbytes
+
+
+class NumpyVectorDB:
+    """
+    An in-process exact index of the ESCO embeddings.
+
+    The skill embeddings are kept in a normalized float32 matrix,
+    so that a cosine similarity search is a single matrix-vector product
+    followed by a partial top-k selection.
+
+    To reduce memory, embeddings can be stored as quantized codes
+    (see Quantizer) via the following parameters:
+        - quantization: "int8" or "binary";
+        - pca_dim: the number of principal components to keep;
+        - oversampling: the approximate search retrieves `oversampling * k`
+          candidates, that are rescored using the full vectors (default: 4);
+        - rescore: whether to rescore the candidates (default: True).
+    Rescoring needs the full vectors, that are memory-mapped instead of
+    kept in memory: when the skills are loaded from a snapshot,
+    the snapshot matrix is used without copying it, otherwise the vectors
+    are written to a temporary file. Only the rescored candidates are read.
+
+    Results have the same schema of VectorDB.search.
+    Use it via `LocalDB(vector_idx_config={"backend": "numpy"})`.
+    """
+
+    MODEL_NAME = VectorDB.MODEL_NAME
+
+    def __init__(
+        self, force_recreate=False, model_params=None, skills=None, config=None
+    ) -> None:  # pylint: disable=unused-argument
+        self.config = config or {"backend": "numpy"}
+        self.embedding_function = _embedding_function(self.config)
+        self.model_name = self.embedding_function.model_name
+        self.model_params = model_params or MODEL_PARAMETERS.get(
+            self.model_name, DEFAULT_MODEL_PARAMETERS
+        )
+        self._hashes = content_hashes(skills, self.model_name)
+        skills = _embed_skills(skills, self.embedding_function)
+
+        vectors = _normalize(np.asarray(skills.vector.tolist(), dtype=np.float32))
+        self.quantizer = None
+        self.oversampling = self.config.get("oversampling", 4)
+        self.rescore = self.config.get("rescore", True)
+        if kind := self.config.get("quantization"):
+            self.quantizer = Quantizer(kind, self.config.get("pca_dim")).fit(vectors)
+        self._set_rows(self._rows(skills, vectors))
+
+    def _rows(self, skills: pd.DataFrame, vectors: np.ndarray) -> dict:
+        """@return the arrays indexing the skills, whose vectors are normalized."""
+        rows = {
+            "uris": skills.index.to_numpy(),
+            "labels": skills.label.to_numpy(),
+            "skillType": skills.skillType.to_numpy(),
+            "namespace": np.array([_namespace(uri) for uri in skills.index]),
+        }
+        if self.quantizer is None:
+            rows["matrix"] = vectors
+            return rows
+        rows["codes"] = self.quantizer.encode(vectors)
+        if self.rescore:
+            mapped = _mapped_matrix(skills)
+            rows["vectors"] = vectors if mapped is None else mapped
+        return rows
+
+    def _get_rows(self) -> dict:
+        return {
+            "uris": self.uris,
+            "labels": self.labels,
+            **self.metadata,
+            **(
+                {"matrix": self.matrix}
+                if self.quantizer is None
+                else {"codes": self.codes}
+            ),
+            **({"vectors": self.vectors} if self.vectors is not None else {}),
+        }
+
+    def _set_rows(self, rows: dict):
+        self.uris = rows["uris"]
+        self.labels = rows["labels"]
+        self.metadata = {k: rows[k] for k in FILTER_FIELDS}
+        self.matrix = rows.get("matrix")
+        self.codes = rows.get("codes")
+        self.vectors = rows.get("vectors")
+        if self.vectors is not None and not isinstance(self.vectors, np.memmap):
+            self.vectors = _spill(self.vectors)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        The memory used by the embeddings index,
+        excluding the memory-mapped vectors used for rescoring.
+        """
+        if self.quantizer is None:
+            return self.matrix.nbytes
+        return self.codes.nbytes + self.quantizer.nbytes
+
+    def count(self) -> int:
+        """Returns the number of indexed skills."""
+        return len(self.uris)
+
+    def upsert_skills(self, skills: pd.DataFrame, **params) -> int:  # pylint: disable=unused-argument
+        """
+        Adds or replaces the given skills in place.
+        Quantized indexes encode them with the existing projection.
+
+        @return the number of upserted skills.
+        """
+        self.delete_skills(skills.index)
+        self._hashes.update(content_hashes(skills, self.model_name))
+        skills = _embed_skills(skills, self.embedding_function)
+        vectors = _normalize(np.asarray(skills.vector.tolist(), dtype=np.float32))
+        current, new = self._get_rows(), self._rows(skills, vectors)
+        self._set_rows({k: np.concatenate([current[k], new[k]]) for k in current})
+        return len(skills)
+
+    def delete_skills(self, uris: Iterable[str]) -> int:
+        """
+        Deletes the given skills.
+
+        @return the number of deleted skills.
+        """
+        uris = set(uris)
+        keep = ~np.isin(self.uris, list(uris))
+        if keep.all():
+            return 0
+        self._set_rows({k: v[keep] for k, v in self._get_rows().items()})
+        for uri in uris:
+            self._hashes.pop(uri, None)
+        return int((~keep).sum())
+
+    def hashes(self) -> Dict[str, str]:
+        """@return a dict mapping the indexed skill URIs to their content hash."""
+        return dict(self._hashes)
+
+    def diff(self, skills: pd.DataFrame) -> Tuple[list, list]:
+        """
+        Compare the skills with the indexed ones via their content hashes.
+
+        @return the URIs of the skills that are missing or changed
+            and the URIs of the indexed skills that are not in skills.
+        """
+        return _diff(content_hashes(skills, self.model_name), self._hashes)
+
+    def sync(self, skills: pd.DataFrame, **params) -> dict:  # pylint: disable=unused-argument
+        """
+        Update the index to match the skills, see VectorDB.sync.
+
+        @return the number of upserted and deleted skills.
+        """
+        changed, stale = self.diff(skills)
+        upserted = self.upsert_skills(skills.loc[changed]) if changed else 0
+        return {"upserted": upserted, "deleted": self.delete_skills(stale)}
+
+    def search(self, text, **params):
+        """
+        Performs an exact similarity search using the provided text
+        and additional parameters, returning the matching skills
+        with their similarity scores.
+        """
+        params = {**self.model_params, **params}
+        return self.search_by_vector(
+            self.embedding_function.embed_query(text), **params
+        )
+
+    def search_many(self, texts, **params):
+        """
+        Performs an exact similarity search for each of the provided texts,
+        embedding them in a single batch.
+
+        @return a list of results for each text, in the same order.
+        """
+        params = {**self.model_params, **params}
+        texts = list(texts)
+        if not texts:
+            return []
+        return self.search_many_by_vector(
+            self.embedding_function.embed_documents(texts), **params
+        )
+
+    async def asearch(self, text, **params):
+        """Async version of search(), running it in an executor."""
+        return await _run_in_executor(partial(self.search, text, **params))
+
+    async def asearch_many(self, texts, **params):
+        """Async version of search_many(), running it in an executor."""
+        return await _run_in_executor(partial(self.search_many, list(texts), **params))
+
+    def search_by_vector(self, vector, k=4, score_threshold=None, filter=None):  # pylint: disable=redefined-builtin
+        """
+        Returns the k skills most similar to the given embedding,
+        discarding the ones scoring below score_threshold.
+        """
+        return self.search_many_by_vector([vector], k, score_threshold, filter)[0]
+
+    def _mask(self, filter_: dict) -> np.ndarray:
+        """@return a boolean mask of the skills matching the metadata filter."""
+        mask = np.ones(len(self.uris), dtype=bool)
+        for key, value in filter_.items():
+            if key not in self.metadata:
+                raise ValueError(f"Unsupported filter field: {key}")
+            values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+            mask &= np.isin(self.metadata[key], values)
+        return mask
+
+    def search_many_by_vector(self, vectors, k=4, score_threshold=None, filter=None):  # pylint: disable=redefined-builtin
+        """
+        Returns the k skills most similar to each of the given embeddings,
+        computing all the scores with a single matrix product.
+        Skills not matching the metadata filter are excluded.
+        """
+        queries = _normalize(np.asarray(vectors, dtype=np.float32))
+        if self.quantizer is None:
+            scores = queries @ self.matrix.T
+        else:
+            scores = self.quantizer.scores(self.codes, queries)
+        if filter:
+            scores[:, ~self._mask(filter)] = -np.inf
+
+        ret = []
+        for query, row in zip(queries, scores):
+            if self.vectors is None:
+                top = _top_k(row, k)
+                top_scores = row[top]
+            else:
+                top, top_scores = self._rescore(query, row, k)
+            ret.append(
+                [
+                    {
+                        "uri": self.uris[i],
+                        "label": self.labels[i],
+                        "score": float(score),
+                    }
+                    for i, score in zip(top, top_scores)
+                    if np.isfinite(score)
+                    and (score_threshold is None or score >= score_threshold)
+                ]
+            )
+        return ret
+
+    def _rescore(self, query: np.ndarray, approx: np.ndarray, k: int):
+        """
+        Rescore the best candidates of an approximate search
+        using the full vectors.
+
+        @return the positions and the exact scores of the best k candidates.
+        """
+        candidates = _top_k(approx, k * self.oversampling)
+        candidates = candidates[np.isfinite(approx[candidates])]
+        if not len(candidates):
+            return candidates, approx[candidates]
+        full = _normalize(np.asarray(self.vectors[candidates], dtype=np.float32))
+        exact = full @ query
+        best = _top_k(exact, k)
+        return candidates[best], exact[best]
+
+    def close(self):
+        """Persist the embedding cache, if any: the index lives in memory."""
+        _close_embeddings(self.embedding_function)
+
+    async def aclose(self):
+        """Async version of close()."""
+        self.close()
+
+
+def recall_report(skills: pd.DataFrame, settings: list, k: int = 10, queries=None):
+    """
+    Compare the recall@k of quantized NumpyVectorDB configurations
+    against the exact search.
+
+    @param settings: a list of NumpyVectorDB configurations,
+        e.g. [{"quantization": "int8", "pca_dim": 192}].
+    @param queries: the query embeddings. Defaults to the skills embeddings.
+    @return a list of dicts with the settings, the recall@k
+        and the memory used by the index.
+    """
+    queries = skills.vector.tolist() if queries is None else queries
+    exact = NumpyVectorDB(skills=skills, config={"backend": "numpy"})
+    expected = [
+        {x["uri"] for x in hits} for hits in exact.search_many_by_vector(queries, k=k)
+    ]
+    ret = []
+    for setting in settings:
+        idx = NumpyVectorDB(skills=skills, config={"backend": "numpy", **setting})
+        actual = idx.search_many_by_vector(queries, k=k)
+        hits = sum(len(e & {x["uri"] for x in a}) for e, a in zip(expected, actual))
+        ret.append(
+            {
+                **setting,
+                f"recall@{k}": hits / sum(len(e) for e in expected),
+                "nbytes": idx.nbytes,
+                "compression": exact.nbytes / idx.nbytes,
+            }
+        )
+    return ret
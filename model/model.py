@@ -18,8 +18,11 @@ import click
 import pandas as pd
 import spacy
 
-from esco import to_curie
+import esco.ruler  # noqa: F401 pylint: disable=unused-import
+from esco import snapshot, to_curie
+from esco.embeddings import get_embeddings
 from esco.sparql import SparqlClient
+from esco.vector import SKILLS_MODEL_NAME
 
 log = logging.getLogger(__name__)
 
@@ -52,13 +55,66 @@ def make_pattern(id_: str, kn: dict):
     return to_curie(id_), patterns
 
 
-def esco_matcher(skills):
+def make_phrase_pattern(id_: str, kn: dict):
+    """Like make_pattern, but for a phrase-based entity_ruler (see esco_ruler).
+
+    Labels are phrases matched on the lowercase text,
+    while short labels (e.g. "C", "R", "Go") stay case-sensitive
+    token patterns, like in make_pattern.
+    """
+    altLabel = [kn["altLabel"]] if isinstance(kn["altLabel"], str) else kn["altLabel"]
+    patterns = []
+    for label in [kn["label"], *altLabel]:
+        candidate = [{"TEXT": label}] if len(label) <= 3 else label.lower()
+        if candidate not in patterns:
+            patterns.append(candidate)
+
+    return to_curie(id_), patterns
+
+
+def esco_matcher(skills, phrase: bool = False):
     """
     Create the patterns for the matcher
+
+    @param phrase: create the patterns for a phrase-based ruler,
+        see make_phrase_pattern.
+    """
+    make = make_phrase_pattern if phrase else make_pattern
+    return dict(make(id_, kni) for id_, kni in skills.to_dict(orient="index").items())
+
+
+def esco_patterns(m: dict):
+    """
+    Create the entity_ruler patterns from the output of esco_matcher.
+    """
+    return [
+        {"label": "ESCO", "pattern": pattern, "id": k}
+        for k, p in m.items()
+        for pattern in p
+    ]
+
+
+def esco_ruler(nlp, patterns: list, phrase: bool = True, **add_pipe_kwargs):
+    """
+    Add an esco_entity_ruler with the ESCO patterns to the pipeline.
+
+    Phrase patterns are matched by a PhraseMatcher on the LOWER attribute,
+    that scales better than the token Matcher with many patterns.
+    They are created with the tokenizer only, even when the ruler
+    follows the transformer, see esco.ruler.
+
+    @param patterns: the output of esco_patterns.
+    @param phrase: whether to match the phrase patterns on LOWER.
+    @return the entity_ruler.
     """
-    return dict(
-        make_pattern(id_, kni) for id_, kni in skills.to_dict(orient="index").items()
+    config = {"phrase_matcher_attr": "LOWER"} if phrase else {}
+    ruler = nlp.add_pipe(
+        "esco_entity_ruler",
+        config=config,
+        **{"name": "entity_ruler", **add_pipe_kwargs},
     )
+    ruler.add_patterns(patterns)
+    return ruler
 
 
 @click.command()
@@ -66,13 +122,50 @@ def esco_matcher(skills):
 @click.option("--embeddings", default=True, help="Generate the text embeddings")
 @click.option("--ner", default=True, help="Generate the NER model")
 @click.option("--sparql", default="http://virtuoso:8890/sparql", help="Sparql URL")
-def main(esco, embeddings, ner, sparql):  # pylint: disable=too-many-locals
+@click.option(
+    "--embedding-backend",
+    default="sentence-transformers",
+    help="The embedding backend, see esco.embeddings.get_embeddings. "
+    f"It must produce {SKILLS_MODEL_NAME} embeddings.",
+)
+@click.option("--batch-size", default=64, help="Texts embedded in a batch")
+@click.option("--workers", default=1, help="Threads used to embed the texts")
+@click.option(
+    "--phrase-matcher/--token-matcher",
+    default=True,
+    help="Match the labels with a PhraseMatcher or with the token Matcher",
+)
+def main(  # pylint: disable=too-many-locals,too-many-arguments
+    esco,
+    embeddings,
+    ner,
+    sparql,
+    embedding_backend,
+    batch_size,
+    workers,
+    phrase_matcher,
+):
     """Generate the esco matching model."""
     outdir = Path("generated")
     model_dir = outdir / "en_core_web_trf_esco_ner"
     meta_json = model_dir / "meta.json"
     sparql = SparqlClient(url=sparql)
 
+    if embeddings:
+        # The distributed vectors are searched with SKILLS_MODEL_NAME queries:
+        # backends that cannot produce them, e.g. hashing, are rejected.
+        try:
+            f = get_embeddings(
+                {
+                    "backend": embedding_backend,
+                    "model_name": SKILLS_MODEL_NAME,
+                    "batch_size": batch_size,
+                    "workers": workers,
+                }
+            )
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint="--embedding-backend") from e
+
     log.info("Update the esco.json.gz file")
     esco = sparql.load_esco()
     esco.to_json("esco/esco.json.gz", orient="records", compression="gzip")
@@ -86,16 +179,16 @@ def main(esco, embeddings, ner, sparql):  # pylint: disable=too-many-locals
     df_occupations = pd.read_json(occupations_file, compression="gzip")
     if "uri" not in df_occupations.columns:
         raise ValueError("Missing uri")
+    snapshot.convert(occupations_file)
 
     if embeddings:
         skills_file = "esco/esco_s.json.gz"
         log.info("Generate the text embeddings")
-        from langchain_community.embeddings import SentenceTransformerEmbeddings
-
-        f = SentenceTransformerEmbeddings(model_name="all-MiniLM-L12-v2")
         skills = sparql.load_skills()
-        log.info(f"Generating the embeddings for {len(skills)} skills")
-        skills["vector"] = f.embed_documents(skills.text.values)
+        log.info(
+            f"Generating the embeddings for {len(skills)} skills with {f.model_name}"
+        )
+        skills["vector"] = f.embed_documents(skills.text.tolist())
         skills.reset_index().to_json(skills_file, orient="records", compression="gzip")
 
         log.info("Validate text embeddings")
@@ -103,6 +196,9 @@ def main(esco, embeddings, ner, sparql):  # pylint: disable=too-many-locals
         if {"uri", "vector"} - set(df_esco_skills.columns):
             raise ValueError("Missing uri or vector")
 
+        log.info("Generate the skills snapshot")
+        snapshot.convert(skills_file)
+
     if not ner:
         log.warning("Skipping the model generation")
         return
@@ -112,26 +208,23 @@ def main(esco, embeddings, ner, sparql):  # pylint: disable=too-many-locals
     log.info(f"Loaded {len(skills)} skills")
 
     log.info("Generating the esco matcher")
-    m = esco_matcher(skills)
+    m = esco_matcher(skills, phrase=phrase_matcher)
 
     log.info("Validate the matcher")
     nlp_test = spacy.blank("en")
     m1 = spacy.matcher.Matcher(nlp_test.vocab, validate=True)
     for pid, patterns in m.items():
-        m1.add(pid, patterns)
+        # Phrase patterns are strings, and don't need validation.
+        if token_patterns := [p for p in patterns if isinstance(p, list)]:
+            m1.add(pid, token_patterns)
 
     log.info("Generating the patterns")
-    esco_p = [
-        {"label": "ESCO", "pattern": pattern, "id": k}
-        for k, p in m.items()
-        for pattern in p
-    ]
+    esco_p = esco_patterns(m)
     outdir.mkdir(exist_ok=True)
     (outdir / "esco_patterns.json").write_text(json.dumps(esco_p, indent=2))
     log.info("Loading the spacy model")
     nlp_e = spacy.load("en_core_web_trf")
-    ruler = nlp_e.add_pipe("entity_ruler", after="ner")
-    ruler.add_patterns(esco_p)
+    esco_ruler(nlp_e, esco_p, phrase=phrase_matcher, after="ner")
     log.info("Saving the model")
     nlp_e.to_disk(model_dir.as_posix())
 
@@ -0,0 +1,131 @@
+"""
+Compare the token-based and the phrase-based ESCO entity rulers.
+
+Both rulers are built from the skills distributed with the package
+at the end of a pipeline (by default, a blank one),
+and process the same texts, reporting:
+
+- patterns: the number of patterns of the ruler;
+- build_s: the time to add the patterns, in seconds;
+- load_s: the time to load the pipeline saved to disk, in seconds;
+- docs_per_s: the best throughput over the repetitions;
+- entities: the number of matched entities;
+
+and the entities matched by only one of the rulers.
+
+Build and load times depend on the components preceding the ruler:
+use `--model en_core_web_trf` to measure them on the NER pipeline.
+
+Usage:
+
+    python model/ruler_benchmark.py tests/data/rpolli.txt tests/data/test-ner-skills.yaml
+"""
+
+import json
+import logging
+import time
+from tempfile import TemporaryDirectory
+from typing import List, Tuple
+
+import click
+import pandas as pd
+import spacy
+
+from esco import load_table
+from esco.benchmark import format_table, load_queries
+from model import esco_matcher, esco_patterns, esco_ruler
+
+log = logging.getLogger(__name__)
+
+RULERS = {"token": False, "phrase": True}
+
+
+def make_nlp(skills: pd.DataFrame, phrase: bool, model: str = None):
+    """
+    @param model: the pipeline preceding the ruler, defaulting to a blank one.
+    @return the pipeline with the ESCO ruler, and its build time.
+    """
+    nlp = spacy.load(model) if model else spacy.blank("en")
+    ts = time.perf_counter()
+    esco_ruler(nlp, esco_patterns(esco_matcher(skills, phrase=phrase)), phrase=phrase)
+    return nlp, time.perf_counter() - ts
+
+
+def load_time(nlp) -> float:
+    """@return the time to load the pipeline saved to disk."""
+    with TemporaryDirectory() as path:
+        nlp.to_disk(path)
+        ts = time.perf_counter()
+        spacy.load(path)
+        return time.perf_counter() - ts
+
+
+def match(nlp, texts: List[str]) -> set:
+    """@return the (text index, start, end, text, id) of the matched entities."""
+    return {
+        (i, e.start_char, e.end_char, e.text, e.ent_id_)
+        for i, doc in enumerate(nlp.pipe(texts))
+        for e in doc.ents
+    }
+
+
+def benchmark_rulers(
+    texts: List[str], skills: pd.DataFrame = None, repeat: int = 3, model: str = None
+) -> Tuple[List[dict], dict]:
+    """
+    @param model: the pipeline preceding the ruler, see make_nlp.
+    @return a report for each ruler, and the entities
+        matched by only one of them.
+    """
+    skills = load_table("skills") if skills is None else skills
+    rows, found = [], {}
+    for name, phrase in RULERS.items():
+        log.info("Benchmarking the %s ruler", name)
+        nlp, build_time = make_nlp(skills, phrase, model)
+        elapsed = []
+        for _ in range(repeat):
+            ts = time.perf_counter()
+            found[name] = match(nlp, texts)
+            elapsed.append(time.perf_counter() - ts)
+        rows.append(
+            {
+                "ruler": name,
+                "patterns": len(nlp.get_pipe("entity_ruler")),
+                "build_s": build_time,
+                "load_s": load_time(nlp),
+                "docs_per_s": len(texts) / max(min(elapsed), 1e-9),
+                "entities": len(found[name]),
+            }
+        )
+    diff = {
+        f"only_{name}": sorted(found[name] - found[other])
+        for name, other in (("token", "phrase"), ("phrase", "token"))
+    }
+    return rows, diff
+
+
+@click.command()
+@click.argument("files", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option("--repeat", default=3, help="Repetitions of the matching.")
+@click.option("--model", default=None, help="The pipeline preceding the ruler.")
+@click.option(
+    "--format", "output_format", type=click.Choice(["table", "json"]), default="table"
+)
+def main(files, repeat, model, output_format):
+    """Compare the ESCO rulers on the texts in FILES."""
+    rows, diff = benchmark_rulers(
+        load_queries(files, min_words=1), repeat=repeat, model=model
+    )
+    if output_format == "json":
+        click.echo(json.dumps({"rulers": rows, **diff}, indent=2))
+        return
+    click.echo(format_table(rows))
+    for key, entities in diff.items():
+        click.echo(f"\n{key}: {len(entities)}")
+        for _, start, end, text, id_ in entities:
+            click.echo(f"  {text!r} [{start}:{end}] {id_}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -6,6 +6,7 @@ This module tests the addition of the ESCO entity recognizer and validates the m
 
 from pathlib import Path
 
+import pandas as pd
 import pytest
 import spacy
 from spacy.language import Language
@@ -58,6 +59,36 @@ def test_esco_matcher():
             m1.add(pid, patterns)
 
 
+def test_phrase_ruler_matches_multiword_labels():
+    """
+    Test that the phrase-based ruler matches the labels of the token-based one,
+    plus the multi-word labels that a single LOWER token cannot match,
+    keeping short labels case-sensitive.
+    """
+    from ruler_benchmark import benchmark_rulers
+
+    skills = pd.DataFrame(
+        [
+            {"label": "Haskell", "altLabel": ["Haskell"]},
+            {"label": "machine learning", "altLabel": ["ML"]},
+            {"label": "R", "altLabel": []},
+        ],
+        index=[
+            "http://data.europa.eu/esco/skill/1",
+            "http://data.europa.eu/esco/skill/2",
+            "http://data.europa.eu/esco/skill/3",
+        ],
+    )
+    texts = ["I use HASKELL and R for Machine Learning.", "r is not R here."]
+    rows, diff = benchmark_rulers(texts, skills=skills, repeat=1)
+    assert [row["ruler"] for row in rows] == ["token", "phrase"]
+    assert diff == {
+        "only_token": [],
+        "only_phrase": [(0, 24, 40, "Machine Learning", "esco:2")],
+    }
+    assert rows[1]["entities"] == 4
+
+
 def test_model():
     """
     Test the ESCO NER model with a sample text.
@@ -7,6 +7,10 @@ from pathlib import Path
 from tempfile import mkdtemp
 
 import pytest
+import spacy
+
+HASKELL = "http://data.europa.eu/esco/skill/000f1d3d-220f-4789-9c0a-cc742521fb02"
+PYTHON = "http://data.europa.eu/esco/skill/ccd0a1d9-afda-43d9-b901-96344886e14d"
 
 
 @pytest.fixture(scope="module")
@@ -23,3 +27,29 @@ def tmpdir():
     dpath.mkdir(exist_ok=False, parents=True)
     yield dpath
     shutil.rmtree(dpath.as_posix())
+
+
+@pytest.fixture(scope="module")
+def model_path(tmpdir):
+    """
+    Create a small spaCy pipeline recognizing a few ESCO and PRODUCT entities,
+    to test the Ner class without downloading the ESCO NER model.
+
+    Yields:
+        str: The path to the pipeline.
+    """
+    nlp = spacy.blank("en")
+    nlp.add_pipe("sentencizer")
+    nlp.add_pipe("entity_ruler").add_patterns(
+        [
+            {
+                "label": "ESCO",
+                "pattern": [{"LOWER": "haskell"}],
+                "id": "esco:" + HASKELL.split("/")[-1],
+            },
+            {"label": "PRODUCT", "pattern": [{"LOWER": "python"}]},
+        ]
+    )
+    path = tmpdir / "ner-model"
+    nlp.to_disk(path)
+    yield path.as_posix()
@@ -0,0 +1,143 @@
+"""
+Module for Testing the benchmark harness.
+
+The benchmarks use the hashing embeddings and a subset of the skills,
+so that they do not need to download any model.
+"""
+
+import json
+from pathlib import Path
+
+from click.testing import CliRunner
+
+import esco
+from esco.benchmark import (
+    benchmark_ner,
+    benchmark_vector,
+    format_table,
+    load_queries,
+    main,
+)
+
+TESTDIR = Path(__file__).parent
+DATADIR = TESTDIR / "data"
+QUERY_FILES = [DATADIR / "rpolli.txt", DATADIR / "test-ner-skills.yaml"]
+EMBEDDINGS = {"backend": "hashing"}
+
+
+def test_load_queries():
+    """
+    Tests that queries are loaded from text and YAML files,
+    skipping short and duplicate ones.
+    """
+    queries = load_queries(QUERY_FILES)
+    assert queries
+    assert len(queries) == len(set(queries))
+    assert all(len(q.split()) >= 5 for q in queries)
+    assert any(q.startswith("I am an help desk agent") for q in queries)
+
+
+def test_benchmark_vector():
+    """
+    Tests that every setting is compared with the exact baseline.
+    """
+    skills = esco.load_table("skills")[:100]
+    queries = load_queries(QUERY_FILES)[:10]
+    rows = benchmark_vector(
+        queries,
+        settings=[
+            {"backend": "numpy", "quantization": "int8"},
+            {"location": ":memory:", "search_params": {"hnsw_ef": 32}},
+        ],
+        k=5,
+        embeddings=EMBEDDINGS,
+        skills=skills,
+    )
+    baseline, int8, qdrant = rows
+    assert baseline["recall@5"] == 1
+    assert qdrant["recall@5"] == 1
+    assert 0 < int8["recall@5"] <= 1
+    for row in rows:
+        assert row["queries"] == 10
+        assert row["p50"] <= row["p95"] <= row["p99"]
+        assert row["qps"] > 0
+
+    table = format_table(rows).splitlines()
+    assert table[0].split() == list(baseline)
+    assert len(table) == 2 + len(rows)
+
+
+def test_benchmark_vector_keeps_named_collections(tmp_path):
+    """
+    Tests that a setting naming its own collection is benchmarked
+    without recreating the collection.
+    """
+    from esco.vector import VectorDB  # pylint: disable=import-outside-toplevel
+
+    skills = esco.load_table("skills")[:100]
+    config = {
+        "path": tmp_path / "qdrant",
+        "collection_name": "esco-skills",
+        "embeddings": EMBEDDINGS,
+    }
+    VectorDB(force_recreate=True, skills=skills[:50], config=config).close()
+
+    rows = benchmark_vector(
+        load_queries(QUERY_FILES)[:5],
+        settings=[{"path": config["path"], "collection_name": "esco-skills"}],
+        k=5,
+        embeddings=EMBEDDINGS,
+        skills=skills,
+    )
+    assert len(rows) == 2
+    idx = VectorDB(skills=skills, config=config)
+    try:
+        assert idx.count() == 50
+    finally:
+        idx.close()
+
+
+def test_benchmark_cli():
+    """
+    Tests the command line interface with JSON output.
+    """
+    result = CliRunner().invoke(
+        main,
+        [
+            "vector",
+            "-q",
+            str(QUERY_FILES[1]),
+            "-s",
+            '{"backend": "numpy", "quantization": "binary"}',
+            "--embeddings",
+            json.dumps(EMBEDDINGS),
+            "--format",
+            "json",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    rows = json.loads(result.output)
+    assert [json.loads(row["setting"]) for row in rows] == [
+        {"backend": "numpy"},
+        {"backend": "numpy", "quantization": "binary"},
+    ]
+
+
+def test_benchmark_ner(model_path):
+    """
+    Tests that every Ner mode is timed, with the same NER skills.
+    """
+    texts = load_queries(QUERY_FILES)[:10]
+    rows = benchmark_ner(
+        texts,
+        model=model_path,
+        vector_idx_config={"backend": "numpy", "embeddings": EMBEDDINGS},
+        batch_size=4,
+    )
+    assert [row["mode"] for row in rows] == ["full", "senter", "sentencizer"]
+    for row in rows:
+        assert row["docs"] == 10
+        assert row["ner_ms"] > 0
+        assert row["sentence_ms"] > 0
+        assert row["sentences"] >= 10
+        assert row["agreement"] == 1
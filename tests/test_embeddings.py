@@ -0,0 +1,165 @@
+"""
+Unit tests for the embedding functions and their cache.
+
+The tests use a fake embedding function counting the embedded texts,
+so that they do not need to download any model.
+"""
+
+from typing import List
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from esco.cache import LRUCache
+from esco.embeddings import (
+    BatchedEmbeddings,
+    CachedEmbeddings,
+    HashingEmbeddings,
+    get_embeddings,
+)
+
+
+class CountingEmbeddings(Embeddings):
+    """A fake embedding function recording the embedded texts."""
+
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.embedded.extend(texts)
+        return [[float(len(t)), float(t.count(" ")), 1.0] for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+@pytest.fixture
+def embeddings():
+    yield CachedEmbeddings(CountingEmbeddings(), "fake-model", maxsize=3)
+
+
+def test_lru_cache_evicts_least_recently_used():
+    """
+    Test that the least recently used entry is evicted first.
+    """
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert "b" not in cache
+    assert cache.get("b") is None
+    assert cache.stats() | {"hit_rate": None} == {
+        "size": 2,
+        "maxsize": 2,
+        "hits": 1,
+        "misses": 1,
+        "hit_rate": None,
+    }
+
+
+def test_cached_embeddings_embed_once(embeddings):
+    """
+    Test that recurring texts are embedded only once,
+    ignoring whitespaces differences.
+    """
+    texts = ["team player", "strong  communication skills ", "team player"]
+    first = embeddings.embed_documents(texts)
+    second = embeddings.embed_query("strong communication skills")
+
+    assert embeddings.embeddings.embedded == [
+        "team player",
+        "strong communication skills",
+    ]
+    assert first[0] == first[2]
+    assert first[1] == second
+    assert embeddings.stats()["hits"] == 1
+
+
+def test_cached_embeddings_are_bounded(embeddings):
+    """
+    Test that the cache does not grow beyond its maximum size,
+    even when a single batch contains more texts.
+    """
+    texts = [f"sentence number {i}" for i in range(5)]
+    ret = embeddings.embed_documents(texts)
+    assert len(ret) == 5
+    assert len(embeddings.cache) == 3
+
+
+def test_cached_embeddings_persistence(tmpdir):
+    """
+    Test that the cache can be saved and loaded back,
+    and that caches of a different model are ignored.
+    """
+    path = tmpdir / "embeddings.npz"
+    embeddings = CachedEmbeddings(CountingEmbeddings(), "fake-model", path=path)
+    expected = embeddings.embed_documents(["python developer", "java developer"])
+    embeddings.save()
+
+    reloaded = CachedEmbeddings(CountingEmbeddings(), "fake-model", path=path)
+    assert reloaded.embed_documents(["python developer", "java developer"]) == (
+        expected
+    )
+    assert reloaded.embeddings.embedded == []
+
+    other = CachedEmbeddings(CountingEmbeddings(), "other-model", path=path)
+    other.embed_query("python developer")
+    assert other.embeddings.embedded == ["python developer"]
+
+
+def test_batched_embeddings_preserve_order():
+    """
+    Test that texts are embedded in batches of the given size,
+    and that the results follow the input order.
+    """
+    counting = CountingEmbeddings()
+    batches = []
+    counting_embed = counting.embed_documents
+    counting.embed_documents = lambda texts: batches.append(texts) or counting_embed(
+        texts
+    )
+    embeddings = BatchedEmbeddings(counting, batch_size=2, workers=3)
+    texts = [f"text {'x' * i}" for i in range(5)]
+
+    assert embeddings.embed_documents(texts) == CountingEmbeddings().embed_documents(
+        texts
+    )
+    assert sorted(len(b) for b in batches) == [1, 2, 2]
+
+
+def test_hashing_embeddings():
+    """
+    Test that the hashing embeddings are deterministic and normalized,
+    and that texts sharing words are closer.
+    """
+    embeddings = HashingEmbeddings(dim=64)
+    python, python_dev, cooking = np.array(
+        embeddings.embed_documents(
+            ["Python programming", "python developer", "cooking pasta"]
+        )
+    )
+    assert embeddings.embed_query("Python programming") == python.tolist()
+    assert np.linalg.norm(python) == pytest.approx(1)
+    assert python @ python_dev > python @ cooking
+
+
+def test_get_embeddings():
+    """
+    Test the backend selection.
+    """
+    embeddings = get_embeddings({"backend": "hashing", "dim": 32, "batch_size": 8})
+    assert embeddings.model_name == "hashing-32"
+    assert not embeddings.loaded
+    assert len(embeddings.embed_query("python")) == 32
+    assert embeddings.loaded
+
+    sentence_transformers = get_embeddings({"model_name": "all-MiniLM-L12-v2"})
+    assert sentence_transformers.model_name == "all-MiniLM-L12-v2"
+    assert not sentence_transformers.loaded
+
+    with pytest.raises(ValueError):
+        get_embeddings({"backend": "unknown"})
+    with pytest.raises(ValueError, match="hashing"):
+        get_embeddings({"backend": "hashing", "model_name": "all-MiniLM-L12-v2"})
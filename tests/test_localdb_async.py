@@ -0,0 +1,119 @@
+"""
+Module for Testing the async search API.
+
+The indexes use the hashing embeddings, so that the tests
+do not need to download any model. The tests run concurrent searches
+and verify that they return the same results of the sync API.
+"""
+
+import asyncio
+from uuid import uuid4
+
+import pytest
+
+from esco import AsyncLocalDB
+
+TEXTS = ["haskell", "python programming", "manage a team", "cooking"]
+
+
+@pytest.fixture(
+    params=[
+        {"backend": "numpy"},
+        {"path": -1, "collection_name": "deleteme-esco-skills"},
+        {"url": "http://qdrant:6333", "collection_name": "deleteme-esco-skills"},
+    ],
+    ids=["numpy", "qdrant-path", "qdrant-url"],
+)
+def async_db(tmpdir, request):
+    """
+    Fixture to create an AsyncLocalDB with the first 10 skills.
+    Tests close it via `async with`, in the loop using the async client.
+    """
+    config = request.param | {"embeddings": {"backend": "hashing"}}
+    if config.get("path") == -1:
+        config |= {"path": tmpdir / f"deleteme-{uuid4()}"}
+    db = AsyncLocalDB()
+    db.skills = db.skills[:10]
+    db.create_vector_idx(config)
+    yield db
+
+
+def test_asearch_neural_matches_search_neural(async_db):
+    """
+    Tests that concurrent async searches return the same results
+    of the sync searches.
+    """
+
+    expected = [async_db.search_neural(text, k=3, score_threshold=-1) for text in TEXTS]
+
+    async def search():
+        async with async_db:
+            return await asyncio.gather(
+                *(
+                    async_db.asearch_neural(text, k=3, score_threshold=-1)
+                    for text in TEXTS
+                )
+            )
+
+    ret = asyncio.run(search())
+    assert [[x["uri"] for x in hits] for hits in ret] == [
+        [x["uri"] for x in hits] for hits in expected
+    ]
+
+
+def test_asearch_many_matches_search_many(async_db):
+    """
+    Tests that an async batch search returns the same results
+    of the sync batch search, with filters.
+    """
+    params = {"k": 3, "score_threshold": -1, "filter": {"skillType": "skill"}}
+    expected = async_db.search_many(TEXTS, **params)
+
+    async def search():
+        async with async_db:
+            return await async_db.asearch_many(TEXTS, **params), (
+                await async_db.asearch_many([])
+            )
+
+    ret, empty = asyncio.run(search())
+    assert [[x["uri"] for x in hits] for hits in ret] == [
+        [x["uri"] for x in hits] for hits in expected
+    ]
+    assert empty == []
+
+
+class FakeAsyncClient:
+    """An async client recording whether it was closed."""
+
+    closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+def test_close_closes_the_async_client(tmpdir):
+    """
+    Tests that the sync close() releases the async client,
+    both outside and inside a running loop.
+    """
+    config = {
+        "path": tmpdir / f"deleteme-{uuid4()}",
+        "collection_name": "deleteme-esco-skills",
+        "embeddings": {"backend": "hashing"},
+    }
+    db = AsyncLocalDB()
+    db.skills = db.skills[:10]
+    db.create_vector_idx(config)
+
+    client = db.vector_idx._async_client = FakeAsyncClient()
+    db.create_vector_idx(config)
+    assert client.closed
+
+    async def close():
+        client = db.vector_idx._async_client = FakeAsyncClient()
+        db.close()
+        await asyncio.sleep(0)
+        return client
+
+    assert asyncio.run(close()).closed
+    assert db.vector_idx._async_client is None
@@ -90,3 +90,145 @@ def test_search_skill_label(db, products, expected_results):
     """
     skills = db.search_products(products)
     assert len(skills) >= expected_results
+
+
+def test_get_many(db):
+    """
+    Test retrieving many skills at once from the ESCO LocalDB.
+
+    Asserts that results are aligned with the requested entries,
+    and that missing entries are returned as None.
+    """
+    uris = [
+        "esco:b0096dc5-2e2d-4bc1-8172-05bf486c3968",
+        "esco:nonexistent",
+        db.skills.index[0],
+    ]
+    skills = db.get_many(uris)
+    assert len(skills) == 3
+    assert skills[0] == db.get(uris[0])
+    assert skills[1] is None
+    assert skills[2]["label"] == db.skills.label.iloc[0]
+
+
+def test_get_after_skills_change(db):
+    """
+    Test that lookups follow changes to the skills table.
+
+    Asserts that a removed skill cannot be retrieved anymore.
+    """
+    uri = db.skills.index[0]
+    assert db.get(uri)
+
+    db.skills = db.skills[1:]
+    assert db.get(uri) is None
+    assert db.get(db.skills.index[0])["label"] == db.skills.label.iloc[0]
+
+
+def test_search_products_batch(db):
+    """
+    Test resolving many product labels at once.
+
+    Asserts that each product is resolved like in search_products,
+    and that labels are matched ignoring case and whitespaces.
+    """
+    products = ["ansible", " JBoss ", "Bash", "nonexistent-product"]
+    skills = db.search_products_batch(products)
+    assert set(skills) == set(products)
+    for product in products:
+        expected = db.search_products({product})
+        assert sorted(x["uri"] for x in skills[product]) == sorted(
+            x["uri"] for x in expected
+        )
+    assert skills[" JBoss "]
+    assert skills["nonexistent-product"] == []
+
+
+def test_add_and_remove_skills(db):
+    """
+    Test that custom skills are added, replaced and removed in place,
+    updating the URI and label lookups.
+    """
+    count = len(db.skills)
+    uris = db.add_skills(
+        [
+            {"uri": "par-tec:acme-crm", "label": "ACME CRM", "altLabel": ["acmecrm"]},
+            {"uri": "par-tec:acme-erp", "label": "ACME ERP"},
+        ]
+    )
+    assert uris == [
+        "http://par-tec.it/esco/skill/acme-crm",
+        "http://par-tec.it/esco/skill/acme-erp",
+    ]
+    assert len(db.skills) == count + 2
+    assert db.get("par-tec:acme-crm")["text"] == "acme crm; acmecrm"
+    assert db.search_products({"AcmeCRM"}) == [{"uri": uris[0], "label": "ACME CRM"}]
+
+    db.add_skills([{"uri": uris[0], "label": "ACME CRM", "altLabel": ["acme"]}])
+    assert len(db.skills) == count + 2
+    assert db.search_products({"acmecrm"}) == []
+    assert db.search_products({"acme"}) == [{"uri": uris[0], "label": "ACME CRM"}]
+
+    first = db.skills.index[0]
+    assert db.remove_skills(["par-tec:acme-crm", first, "par-tec:unknown"]) == 2
+    assert db.get(uris[0]) is None
+    assert db.get(first) is None
+    assert db.search_products({"acme"}) == []
+    assert db.get("par-tec:acme-erp")["label"] == "ACME ERP"
+    assert len(db.skills) == count
+
+
+def test_labels_with_the_same_key(db):
+    """
+    Test that a skill with labels differing only in case or whitespaces
+    is returned once, and is removed from the label index.
+    """
+    (uri,) = db.add_skills(
+        [
+            {
+                "uri": "par-tec:data-lake",
+                "label": "Data Lake",
+                "altLabel": ["data  lake", "DATA LAKE"],
+            }
+        ]
+    )
+    expected = [{"uri": uri, "label": "Data Lake"}]
+    assert db.search_products_batch(["data lake"]) == {"data lake": expected}
+    assert db.search_products({"data lake"}) == expected
+
+    assert db.remove_skills([uri]) == 1
+    assert db.search_products_batch(["data lake"]) == {"data lake": []}
+
+
+def test_add_skills_many_times(db):
+    """
+    Test that skills added by many calls are found before and after
+    the table is concatenated, and that removing a skill
+    shifts the positions of the following ones.
+    """
+    count = len(db.skills)
+    uris = [
+        db.add_skills([{"uri": f"par-tec:many-{i}", "label": f"Many {i}"}])[0]
+        for i in range(3)
+    ]
+    assert [db.get_label(uri) for uri in uris] == ["Many 0", "Many 1", "Many 2"]
+    assert len(db.skills) == count + 3
+
+    assert db.remove_skills([uris[1]]) == 1
+    assert db.get(uris[2])["label"] == "Many 2"
+    assert db.get("par-tec:many-2")["label"] == "Many 2"
+    assert db.search_products({"many 2"}) == [{"uri": uris[2], "label": "Many 2"}]
+    assert db.remove_skills(uris) == 2
+    assert len(db.skills) == count
+
+
+def test_add_skills_requires_uri_and_label(db):
+    """
+    Test that invalid records are rejected without changing the table.
+    """
+    count = len(db.skills)
+    with pytest.raises(ValueError):
+        db.add_skills([{"label": "no uri"}])
+    with pytest.raises(ValueError):
+        db.add_skills([{"uri": "par-tec:no-label"}])
+    assert len(db.skills) == count
@@ -7,15 +7,19 @@ database instances and pytest functions to validate indexing, search functionali
 
 """
 
+import json
 from contextlib import contextmanager
 from pathlib import Path
 from uuid import uuid4
 
 import pytest
+from qdrant_client import QdrantClient
+from qdrant_client.models import Batch, Distance, VectorParams
 
 import esco
 from esco import LocalDB
-from esco.vector import VectorDB
+from esco.embeddings import HashingEmbeddings
+from esco.vector import SKILLS_MODEL_NAME, LegacyCollection, VectorDB
 
 TESTDIR = Path(__file__).parent
 DATADIR = TESTDIR / "data"
@@ -204,3 +208,366 @@ def test_localdb_can_recreate_idx(tmpdir, request, vector_idx_config):
     assert len(db.vector_idx.scroll(limit=10000)[0]) == 9
     ret = db.search_neural("haskell")
     assert not ret
+
+
+def test_search_many_matches_search(tmpdir):
+    """
+    Tests that a batched search returns the same results of single searches.
+    """
+    with TmpVectorIdx(
+        skills=skills_10,
+        force_recreate=True,
+        config={"path": tmpdir / f"deleteme-{uuid4()}", "collection_name": "esco"},
+    ) as idx:
+        texts = ["haskell", "software testing", "project management"]
+        ret = idx.search_many(texts, k=3)
+        expected = [idx.search(text, k=3) for text in texts]
+        assert [[x["uri"] for x in r] for r in ret] == [
+            [x["uri"] for x in r] for r in expected
+        ]
+
+
+def _create_collection(path, collection_name, size, empty=False, legacy=False):
+    """
+    Creates a collection with the payload layout of VectorDB,
+    without loading any embedding model.
+
+    @param legacy: omit the FILTER_FIELDS from the payload,
+        like the collections created by older versions.
+    """
+    client = QdrantClient(path=path)
+    client.create_collection(
+        collection_name,
+        vectors_config=VectorParams(size=size, distance=Distance.COSINE),
+    )
+    if empty:
+        client.close()
+        return
+    client.upsert(
+        collection_name,
+        points=Batch(
+            ids=[x.split("/")[-1] for x in skills_10.index],
+            payloads=[
+                {
+                    "metadata": {
+                        "label": label,
+                        "uri": uri,
+                        **({} if legacy else {"skillType": skill_type}),
+                        **({} if legacy else {"namespace": "esco:"}),
+                    },
+                    "page_content": text,
+                }
+                for uri, label, text, skill_type in zip(
+                    skills_10.index,
+                    skills_10.label,
+                    skills_10.text,
+                    skills_10.skillType,
+                )
+            ],
+            vectors=[list(v)[:size] for v in skills_10.vector],
+        ),
+    )
+    client.close()
+
+
+def test_attach_does_not_load_the_model(tmpdir):
+    """
+    Tests that opening an existing collection defers loading the embedding model.
+    """
+    path = tmpdir / f"deleteme-{uuid4()}"
+    _create_collection(path, "esco-skills", size=len(skills_10.vector.iloc[0]))
+
+    with TmpVectorIdx(
+        skills=skills_10,
+        config={"path": path, "collection_name": "esco-skills"},
+    ) as idx:
+        assert idx.count() == 10
+        assert not idx.embedding_function.loaded
+
+
+def test_attach_verifies_the_collection(tmpdir):
+    """
+    Tests that opening a missing collection, or a collection
+    with a different vector size, raises an error.
+    """
+    path = tmpdir / f"deleteme-{uuid4()}"
+    _create_collection(path, "esco-skills", size=3)
+
+    with pytest.raises(ValueError, match="size"):
+        VectorDB(
+            skills=skills_10, config={"path": path, "collection_name": "esco-skills"}
+        )
+    with pytest.raises(ValueError, match="not found"):
+        VectorDB(skills=skills_10, config={"path": path, "collection_name": "missing"})
+
+
+def test_attach_rejects_payload_without_filter_fields(tmpdir):
+    """
+    Tests that a collection without the FILTER_FIELDS in the payload
+    is rejected, instead of returning no hits on filtered searches.
+    """
+    path = tmpdir / f"deleteme-{uuid4()}"
+    size = len(skills_10.vector.iloc[0])
+    _create_collection(path, "esco-skills", size=size, legacy=True)
+
+    with pytest.raises(LegacyCollection, match="skillType"):
+        VectorDB(
+            skills=skills_10, config={"path": path, "collection_name": "esco-skills"}
+        )
+
+
+def test_localdb_sync_recreates_legacy_collection(tmpdir):
+    """
+    Tests that LocalDB.sync_vector_idx recreates a collection
+    without the FILTER_FIELDS in the payload.
+    """
+    path = tmpdir / f"deleteme-{uuid4()}"
+    size = len(skills_10.vector.iloc[0])
+    _create_collection(path, "esco-skills", size=size, legacy=True)
+
+    db = LocalDBShort()
+    try:
+        config = {
+            "path": path,
+            "collection_name": "esco-skills",
+            "embeddings": {"backend": "hashing"},
+        }
+        assert db.sync_vector_idx(config) == {"upserted": 10, "deleted": 0}
+        assert db.validate()
+        ret = db.search_neural(
+            skills_10.label.iloc[3], k=1, filter={"namespace": "esco:"}
+        )
+        assert ret[0]["uri"] == skills_10.index[3]
+    finally:
+        db.close()
+
+
+@pytest.mark.parametrize("batch_size", [3, 10, 100])
+def test_upsert_skills_in_chunks(tmpdir, batch_size):
+    """
+    Tests that skills are uploaded in chunks of any size.
+    """
+    path = tmpdir / f"deleteme-{uuid4()}"
+    _create_collection(path, "esco-skills", size=384, empty=True)
+
+    with TmpVectorIdx(
+        skills=skills_10,
+        config={"path": path, "collection_name": "esco-skills"},
+    ) as idx:
+        assert idx.count() == 0
+        assert idx.upsert_skills(skills_10, batch_size=batch_size) == 10
+        assert idx.count() == 10
+
+
+def test_upsert_skills_resumes_from_checkpoint(tmpdir):
+    """
+    Tests that an upload skips the chunks recorded in the checkpoint,
+    and that the checkpoint is removed when the upload completes.
+    """
+    path = tmpdir / f"deleteme-{uuid4()}"
+    checkpoint = tmpdir / f"deleteme-{uuid4()}.json"
+    _create_collection(path, "esco-skills", size=384, empty=True)
+    checkpoint.write_text(
+        json.dumps(
+            {
+                "collection_name": "esco-skills",
+                "size": 10,
+                "batch_size": 4,
+                "done": [0],
+            }
+        )
+    )
+
+    with TmpVectorIdx(
+        skills=skills_10,
+        config={"path": path, "collection_name": "esco-skills"},
+    ) as idx:
+        assert idx.upsert_skills(skills_10, batch_size=4, checkpoint=checkpoint) == 6
+        assert idx.count() == 6
+        assert not checkpoint.exists()
+
+
+def test_search_with_filter(tmpdir):
+    """
+    Tests that metadata filters are applied by Qdrant.
+    """
+    path = tmpdir / f"deleteme-{uuid4()}"
+    _create_collection(path, "esco-skills", size=384, empty=True)
+
+    with TmpVectorIdx(
+        skills=skills_10,
+        config={"path": path, "collection_name": "esco-skills"},
+    ) as idx:
+        idx.upsert_skills(skills_10)
+        knowledge = skills_10[skills_10.skillType == "knowledge"]
+        ret = idx.search_many_by_vector(
+            skills_10.vector.tolist(),
+            k=10,
+            score_threshold=-1,
+            filter={"skillType": "knowledge"},
+        )
+        assert len(ret) == 10
+        for hits in ret:
+            assert {x["uri"] for x in hits} == set(knowledge.index)
+
+
+def test_iter_points(tmpdir):
+    """
+    Tests that points are yielded in bounded batches,
+    fetching vectors and payloads only when requested.
+    """
+    path = tmpdir / f"deleteme-{uuid4()}"
+    _create_collection(path, "esco-skills", size=384, empty=True)
+
+    with TmpVectorIdx(
+        skills=skills_10,
+        config={"path": path, "collection_name": "esco-skills"},
+    ) as idx:
+        idx.upsert_skills(skills_10)
+        assert len(idx.scroll(limit=4)[0]) == 4
+
+        batches = list(idx.iter_points(batch_size=3))
+        assert [len(b) for b in batches] == [3, 3, 3, 1]
+        assert {p.payload["metadata"]["uri"] for b in batches for p in b} == set(
+            skills_10.index
+        )
+        assert batches[0][0].vector is None
+
+        batches = list(
+            idx.iter_points(batch_size=100, with_payload=False, with_vectors=True)
+        )
+        assert len(batches) == 1
+        assert not batches[0][0].payload
+        assert len(batches[0][0].vector) == 384
+
+        knowledge = skills_10[skills_10.skillType == "knowledge"]
+        batches = list(idx.iter_points(scroll_filter={"skillType": "knowledge"}))
+        assert sum(len(b) for b in batches) == len(knowledge)
+
+
+def test_create_idx_offline(tmpdir):
+    """
+    Tests creating and searching a Qdrant index with the hashing embeddings,
+    that do not need to download any model.
+    """
+    config = {
+        "path": tmpdir / "esco-hashing",
+        "collection_name": "esco-hashing",
+        "embeddings": {"backend": "hashing"},
+    }
+    with TmpVectorIdx(force_recreate=True, skills=skills_10, config=config) as idx:
+        assert idx.model_name == "hashing-384"
+        assert idx.count() == 10
+        label = skills_10.label.iloc[3]
+        ret = idx.search(label, k=3)
+        assert ret[0]["uri"] == skills_10.index[3]
+
+
+def test_sync_upserts_only_changed_skills(tmpdir):
+    """
+    Tests that sync upserts the changed skills and deletes the stale ones,
+    comparing the content hashes stored in the payload.
+    """
+    config = {
+        "path": tmpdir / "esco-sync",
+        "collection_name": "esco-sync",
+        "embeddings": {"backend": "hashing"},
+    }
+    with TmpVectorIdx(force_recreate=True, skills=skills_10, config=config) as idx:
+        assert idx.diff(skills_10) == ([], [])
+
+        skills = skills_10.drop(index=skills_10.index[5])
+        skills.loc[skills.index[2], "text"] = "a brand new description"
+        assert idx.diff(skills) == ([skills.index[2]], [skills_10.index[5]])
+
+        assert idx.sync(skills) == {"upserted": 1, "deleted": 1}
+        assert idx.diff(skills) == ([], [])
+        assert idx.count() == 9
+        assert idx.sync(skills) == {"upserted": 0, "deleted": 0}
+
+
+def test_localdb_sync_vector_idx(tmpdir):
+    """
+    Tests that LocalDB.sync_vector_idx creates a missing index,
+    and that validate detects content drift, not only count mismatches.
+    """
+    config = {
+        "path": tmpdir / "esco-localdb-sync",
+        "collection_name": "esco-sync",
+        "embeddings": {"backend": "hashing"},
+    }
+    db = LocalDBShort()
+    try:
+        assert db.sync_vector_idx(config) == {"upserted": 10, "deleted": 0}
+        assert db.validate()
+
+        skills = db.skills.copy()
+        skills.loc[skills.index[0], "label"] = "a renamed skill"
+        db.skills = skills
+        with pytest.raises(ValueError, match="out of sync"):
+            db.validate()
+        assert db.sync_vector_idx() == {"upserted": 1, "deleted": 0}
+        assert db.validate()
+    finally:
+        db.close()
+
+
+def test_localdb_add_and_remove_skills(tmpdir):
+    """
+    Tests that custom skills are upserted into and deleted from
+    a Qdrant index in place.
+    """
+    config = {
+        "path": tmpdir / "esco-custom",
+        "collection_name": "esco-custom",
+        "embeddings": {"backend": "hashing"},
+    }
+    db = LocalDBShort()
+    try:
+        db.create_vector_idx(config)
+        (uri,) = db.add_skills(
+            [{"uri": "par-tec:quokka", "label": "Quokka", "skillType": "knowledge"}]
+        )
+        assert db.validate()
+        ret = db.search_neural("quokka", k=1, filter={"namespace": "par-tec:"})
+        assert [x["uri"] for x in ret] == [uri]
+
+        db.remove_skills([uri])
+        assert db.validate()
+        assert db.vector_idx.count() == 10
+    finally:
+        db.close()
+
+
+def fake_skills_model(model_name, **kwargs):  # pylint: disable=unused-argument
+    """
+    An embedding backend posing as the model of the distributed skills,
+    so that the content hashes include the vectors.
+    """
+    return HashingEmbeddings(**kwargs)
+
+
+def test_sync_skills_added_without_vector(tmpdir):
+    """
+    Tests that skills added without a vector index are hashed
+    like in diff(), so that syncing them again is a no-op.
+    """
+    config = {
+        "path": tmpdir / f"deleteme-{uuid4()}",
+        "collection_name": "esco-vectorless",
+        "embeddings": {"backend": "test_localdb_vector:fake_skills_model"},
+    }
+    db = LocalDBShort()
+    try:
+        (uri,) = db.add_skills(
+            [{"uri": "par-tec:quokka", "label": "Quokka", "skillType": "knowledge"}]
+        )
+        assert db.get(uri)["vector"] is None
+        db.create_vector_idx(config)
+        assert db.vector_idx.model_name == SKILLS_MODEL_NAME
+        assert db.validate()
+        assert db.sync_vector_idx() == {"upserted": 0, "deleted": 0}
+        assert db.sync_vector_idx() == {"upserted": 0, "deleted": 0}
+        assert db.validate()
+    finally:
+        db.close()
@@ -0,0 +1,373 @@
+"""
+Module for Testing the batching of Ner.pipe.
+
+The tests use a small spaCy pipeline (see conftest.py),
+so that they do not need to download any model.
+"""
+
+import pytest
+import spacy
+
+from esco import LocalDB
+from esco.cv import resolve_sentence_skills
+from esco.ner import (
+    Ner,
+    load_model,
+    padded_size,
+    split_long_sentences,
+    split_windows,
+    transformer_lengths,
+)
+
+TEXTS = [
+    " ".join(["word"] * n) + (" python" if n % 3 else "") for n in (40, 2, 35, 3, 50, 1)
+] * 4
+
+
+@pytest.fixture(scope="module")
+def ner(model_path):
+    """
+    Fixture to create a Ner with the small spaCy pipeline and no vector index.
+    """
+    yield Ner(db=LocalDB(), model_name_or_path=model_path)
+
+
+def test_padded_size():
+    """
+    Tests the number of slots of padded batches,
+    where every span of a batch is padded to the longest one.
+    """
+    assert padded_size([[1], [3], [2]], 2) == 3 * 2 + 2
+    assert padded_size([[128, 20], [5], [2]], 2) == 128 * 3 + 2
+    assert padded_size([], 2) == 0
+
+
+class FakeTransformer:
+    """
+    The attributes of a spacy-transformers component used to measure
+    the padding: strided spans of 4 tokens, and a tokenizer
+    splitting words in 2 wordpieces, plus 2 special tokens.
+    """
+
+    class model:  # pylint: disable=invalid-name
+        attrs = {
+            "get_spans": lambda docs: [
+                [doc[i : i + 4] for i in range(0, len(doc), 4)] for doc in docs
+            ]
+        }
+
+        @staticmethod
+        def tokenizer(texts):
+            return {"input_ids": [[0] * (2 * len(t.split()) + 2) for t in texts]}
+
+    def __call__(self, doc):
+        return doc
+
+
+@spacy.Language.factory("fake_transformer")
+def make_fake_transformer(nlp, name):  # pylint: disable=unused-argument
+    return FakeTransformer()
+
+
+def test_transformer_lengths():
+    """
+    Tests that lengths are measured on the spans of the transformer.
+    """
+    nlp = spacy.blank("en")
+    docs = [nlp.make_doc("one two three four five"), nlp.make_doc("one")]
+    assert transformer_lengths(nlp, docs) is None
+
+    nlp.add_pipe("fake_transformer", name="transformer")
+    assert transformer_lengths(nlp, docs) == [[10, 4], [4]]
+
+
+def test_pipe_bucketed_preserves_order(ner):
+    """
+    Tests that bucketed batches yield the documents in the input order,
+    with the same results of the unbucketed pipe.
+    """
+    expected = [cv.ner_skills() for cv in ner.pipe(TEXTS, batch_size=2)]
+    cvs = list(ner.pipe(iter(TEXTS), batch_size=2, bucket_window=10))
+    assert [cv.text for cv in cvs] == TEXTS
+    assert [cv.ner_skills() for cv in cvs] == expected
+
+
+def test_pipe_reports_padding_ratio(ner):
+    """
+    Tests that sorting by length reduces the padding ratio.
+    """
+    ner.padding = dict.fromkeys(ner.padding, 0)
+    list(ner.pipe(TEXTS, batch_size=2, bucket_window=len(TEXTS)))
+    ratio = ner.padding_ratio()
+    assert ratio["unit"] == "tokens"
+    assert ner.padding["tokens"] == sum(len(ner.model.make_doc(t)) for t in TEXTS)
+    assert 0 <= ratio["padding_ratio"] < ratio["unsorted_padding_ratio"] < 1
+
+
+def test_pipe_resolves_entities_once_per_batch(ner, monkeypatch):
+    """
+    Tests that the entities of a batch are resolved in a single lookup,
+    with the same results of resolving each document.
+    """
+    expected = [ner(text).ner_skills() for text in TEXTS]
+    calls = []
+    search_products_batch = ner.db.search_products_batch
+
+    def spy(products):
+        products = list(products)
+        calls.append(products)
+        return search_products_batch(products)
+
+    monkeypatch.setattr(ner.db, "search_products_batch", spy)
+    cvs = list(ner.pipe(TEXTS, batch_size=12))
+    assert [cv.ner_skills() for cv in cvs] == expected
+    assert calls == [["python"], ["python"]]
+
+
+def test_resolve_sentence_skills(model_path):
+    """
+    Tests that the sentences of many documents are searched in a single batch,
+    with the same results of searching each document.
+    """
+    db = LocalDB(
+        vector_idx_config={"backend": "numpy", "embeddings": {"backend": "hashing"}}
+    )
+    ner = Ner(db=db, model_name_or_path=model_path, sentence_cache_size=0)
+    texts = [
+        "I develop web applications in python with a team of five people.",
+        "I manage the accounts of small companies. I write Haskell programs every day.",
+    ] * 2
+    expected = [ner(text).skills_by_sentence() for text in texts]
+
+    calls = []
+    search_many = db.search_many
+
+    def spy(sentences, **kwargs):
+        calls.append(sentences)
+        return search_many(sentences, **kwargs)
+
+    db.search_many = spy
+    cvs = list(ner.pipe(texts))
+    resolve_sentence_skills(cvs)
+    assert len(calls) == 1
+    assert len(calls[0]) == 3
+
+    def uris(cv):
+        return [[x["uri"] for x in s["skills"]] for s in cv.skills_by_sentence()]
+
+    assert [uris(cv) for cv in cvs] == [
+        [[x["uri"] for x in s["skills"]] for s in sentences] for sentences in expected
+    ]
+    cvs[0].skills()
+    assert "count" not in cvs[2].sentences[0]["skills"][0]
+
+
+def test_sentence_cache_searches_only_new_sentences(model_path):
+    """
+    Tests that a resubmitted CV searches only its new sentences,
+    ignoring whitespace changes.
+    """
+    db = LocalDB(
+        vector_idx_config={"backend": "numpy", "embeddings": {"backend": "hashing"}}
+    )
+    ner = Ner(db=db, model_name_or_path=model_path, sentence_cache_size=10)
+    text = "I develop web applications in python. I manage a team of five people."
+    expected = ner(text).skills_by_sentence()
+
+    calls = []
+    search_many = db.search_many
+
+    def spy(sentences, **kwargs):
+        calls.append(sentences)
+        return search_many(sentences, **kwargs)
+
+    db.search_many = spy
+    edited = (
+        "I develop web  applications in\npython. I write Haskell programs every day."
+    )
+    sentences = ner(edited).skills_by_sentence()
+    assert calls == [["I write Haskell programs every day."]]
+    assert sentences[0]["text"] == "I develop web  applications in\npython."
+    assert sentences[0]["skills"] == expected[0]["skills"]
+    assert ner.sentence_cache.stats() | {"hit_rate": None} == {
+        "size": 3,
+        "maxsize": 10,
+        "hits": 1,
+        "misses": 3,
+        "hit_rate": None,
+    }
+
+
+def test_forced_search_skips_the_sentence_cache(model_path):
+    """
+    Tests that skills(force=True) searches the cached sentences again,
+    and stores the new results in the cache.
+    """
+    db = LocalDB(
+        vector_idx_config={"backend": "numpy", "embeddings": {"backend": "hashing"}}
+    )
+    ner = Ner(db=db, model_name_or_path=model_path, sentence_cache_size=10)
+    text = "I develop web applications in python."
+    ner(text).skills()
+
+    calls = []
+    search_many = db.search_many
+
+    def spy(sentences, **kwargs):
+        calls.append(sentences)
+        return search_many(sentences, **kwargs)
+
+    db.search_many = spy
+    cv = ner(text)
+    cv.skills()
+    assert calls == []
+    cv.skills(force=True)
+    assert calls == [[text]]
+    assert ner.sentence_cache.stats()["size"] == 1
+
+
+def test_sentence_cache_follows_the_database(model_path):
+    """
+    Tests that cached sentences are searched again
+    once skills are added to or removed from the database.
+    """
+    db = LocalDB(
+        vector_idx_config={"backend": "numpy", "embeddings": {"backend": "hashing"}}
+    )
+    ner = Ner(db=db, model_name_or_path=model_path, sentence_cache_size=10)
+    text = "I breed quokkas on a quokka farm."
+    assert ner(text).skills_by_sentence()[0]["skills"]
+
+    (uri,) = db.add_skills(
+        [{"uri": "par-tec:quokka", "label": "Quokka farming", "altLabel": ["quokka"]}]
+    )
+    skills = ner(text).skills_by_sentence()[0]["skills"]
+    assert skills[0]["uri"] == uri
+
+    db.remove_skills([uri])
+    skills = ner(text).skills_by_sentence()[0]["skills"]
+    assert uri not in {x["uri"] for x in skills}
+
+
+@pytest.fixture(scope="module")
+def full_model_path(tmpdir):
+    """
+    Fixture to create an untrained pipeline with a tagger and a parser.
+    """
+    nlp = spacy.blank("en")
+    nlp.add_pipe("tagger").add_label("NN")
+    nlp.add_pipe("parser").add_label("nsubj")
+    nlp.add_pipe("entity_ruler")
+    nlp.initialize()
+    path = tmpdir / "full-model"
+    nlp.to_disk(path)
+    yield path.as_posix()
+
+
+def test_load_model_modes(full_model_path):
+    """
+    Tests that the trimmed modes exclude the unused components
+    and add a sentence splitter.
+    """
+    assert load_model(full_model_path).pipe_names == [
+        "tagger",
+        "parser",
+        "entity_ruler",
+    ]
+    for mode in ("senter", "sentencizer"):
+        nlp = load_model(full_model_path, mode=mode)
+        assert nlp.pipe_names == ["sentencizer", "entity_ruler"]
+        doc = nlp("I write Haskell. I write Python.")
+        assert [s.text for s in doc.sents] == ["I write Haskell.", "I write Python."]
+
+    with pytest.raises(ValueError):
+        load_model(full_model_path, mode="fast")
+
+
+def test_split_windows():
+    """
+    Tests that sentences are grouped in windows
+    with one sentence of overlapping context.
+    """
+    sentences = [(0, 10), (11, 20), (21, 30), (31, 60), (61, 65)]
+    assert split_windows(sentences, size=20) == [
+        (0, 0, 20),
+        (11, 21, 30),
+        (21, 31, 60),
+        (31, 61, 65),
+    ]
+    assert split_windows(sentences, size=100, overlap=0) == [(0, 0, 65)]
+    assert split_windows([], size=10) == []
+
+
+def test_split_long_sentences():
+    """
+    Tests that sentences longer than the window are split
+    at newlines, then at whitespaces, then at the limit.
+    """
+    text = "- haskell\n- python\n- java" + " web" * 5 + " " + "x" * 25
+    sentences = split_long_sentences(text, [(0, len(text))], size=20)
+    assert [text[start:end] for start, end in sentences] == [
+        "- haskell\n- python",
+        "\n- java web web web",
+        " web web",
+        " " + "x" * 19,
+        "x" * 6,
+    ]
+    assert split_long_sentences(text, [(0, 5), (6, 9)], size=20) == [(0, 5), (6, 9)]
+
+
+def test_windowed_cv_splits_long_sentences(model_path):
+    """
+    Tests that a long text without sentence punctuation
+    is processed in bounded windows, and that its sentences
+    cover the whole text.
+    """
+    text = "\n".join(["- I write Haskell and Python programs"] * 50)
+    ner = Ner(db=LocalDB(), model_name_or_path=model_path, window_size=100)
+    lengths = []
+    pipe = ner.model.pipe
+
+    def spy(texts, **kwargs):
+        texts = list(texts)
+        lengths.extend(map(len, texts))
+        return pipe(texts, **kwargs)
+
+    ner.model.pipe = spy
+    cv = ner(text)
+    assert max(lengths) <= 200
+    assert cv.entities()["count"] == 100
+    assert " ".join(cv.sentence_texts()).split() == text.split()
+
+
+def test_windowed_cv_matches_whole_text(model_path):
+    """
+    Tests that a long text processed in windows has the same results
+    of the whole text, without parsing it at once.
+    """
+    text = " ".join(
+        [
+            "I write Haskell programs every day.",
+            "Python is my favourite language.",
+            "I also know haskell and python.",
+            "Nothing to see here.",
+        ]
+        * 10
+    )
+    expected = Ner(db=LocalDB(), model_name_or_path=model_path)(text)
+    ner = Ner(db=LocalDB(), model_name_or_path=model_path, window_size=100)
+    lengths = []
+    pipe = ner.model.pipe
+
+    def spy(texts, **kwargs):
+        texts = list(texts)
+        lengths.extend(map(len, texts))
+        return pipe(texts, **kwargs)
+
+    ner.model.pipe = spy
+    for cv in [ner(text), list(ner.pipe([text, "I write Haskell."]))[0]]:
+        assert cv.entities() == expected.entities()
+        assert cv.ner_skills() == expected.ner_skills()
+        assert cv.sentence_texts() == expected.sentence_texts()
+        assert cv._doc is None  # pylint: disable=protected-access
+    assert max(lengths) <= 100 + len("Nothing to see here. ")
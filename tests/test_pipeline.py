@@ -0,0 +1,117 @@
+"""
+Module for Testing the bulk JSONL pipeline.
+
+The tests use a small spaCy pipeline with an entity ruler (see conftest.py)
+and the hashing embeddings, so that they do not need to download any model.
+"""
+
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from esco.pipeline import main, read_records, run_pipeline
+
+from conftest import HASKELL, PYTHON
+
+VECTOR_IDX_CONFIG = {"backend": "numpy", "embeddings": {"backend": "hashing"}}
+TEXTS = [
+    "I write Haskell and Python.",
+    "I develop web applications in python with a team of five people.",
+    "Nothing to see here.",
+] * 5
+
+
+def assert_same_skills(actual, expected):
+    """
+    Compare the skills of the results, ignoring the ids.
+    Scores depend on the batch composition up to rounding errors.
+    """
+
+    def content(result):
+        return {
+            k: {uri: {**skill, "score": None} for uri, skill in v.items()}
+            for k, v in result.items()
+            if k != "id"
+        }
+
+    def scores(result):
+        return [skill.get("score", 0) for skill in result.get("skills", {}).values()]
+
+    assert [content(r) for r in actual] == [content(r) for r in expected]
+    for a, e in zip(actual, expected):
+        assert scores(a) == pytest.approx(scores(e))
+
+
+def test_read_records():
+    """
+    Tests that records are parsed from objects and strings,
+    defaulting the id to the line number.
+    """
+    lines = ['{"cv": "a text", "key": "x"}', "", '"another text"', '{"cv": "text"}']
+    assert list(read_records(lines, text_key="cv", id_key="key")) == [
+        {"id": "x", "text": "a text"},
+        {"id": 3, "text": "another text"},
+        {"id": 4, "text": "text"},
+    ]
+
+
+@pytest.mark.parametrize("n_process", [1, 2])
+def test_run_pipeline(model_path, n_process):
+    """
+    Tests that results are returned in the input order,
+    with the same content regardless of the number of processes.
+    """
+    records = ({"id": i, "text": t} for i, t in enumerate(TEXTS))
+    ner_config = {"model": model_path, "vector_idx_config": VECTOR_IDX_CONFIG}
+    results = list(
+        run_pipeline(
+            records, ner_config, batch_size=2, n_process=n_process, max_pending=2
+        )
+    )
+    assert [r["id"] for r in results] == list(range(len(TEXTS)))
+    first, second, third = results[:3]
+    assert set(first["ner_skills"]) == {HASKELL, PYTHON}
+    assert first["ner_skills"][HASKELL]["source"] == "ner"
+    assert set(second["ner_skills"]) == {PYTHON}
+    assert second["skills"].keys() > {PYTHON}
+    assert third == {"id": 2, "ner_skills": {}, "skills": {}}
+
+    assert_same_skills(results[3:6], results[:3])
+
+
+def test_pipeline_cli(model_path, tmpdir):
+    """
+    Tests the command line interface, without a vector index.
+    """
+    source = tmpdir / "cvs.jsonl"
+    source.write_text("\n".join(json.dumps(t) for t in TEXTS[:3]))
+    target = tmpdir / "skills.jsonl"
+    result = CliRunner().invoke(
+        main, [str(source), str(target), "--model", model_path, "--batch-size", "2"]
+    )
+    assert result.exit_code == 0, result.output
+    results = [json.loads(line) for line in target.read_text().splitlines()]
+    assert [r["id"] for r in results] == [1, 2, 3]
+    assert all("skills" not in r for r in results)
+    assert set(results[0]["ner_skills"]) == {HASKELL, PYTHON}
+
+
+def test_run_pipeline_result_cache(model_path, tmpdir):
+    """
+    Tests that processes share the result cache,
+    returning the same results when the texts are processed again.
+    """
+    ner_config = {
+        "model": model_path,
+        "vector_idx_config": VECTOR_IDX_CONFIG,
+        "result_cache": str(tmpdir / "pipeline-results.sqlite"),
+    }
+
+    def run():
+        records = ({"id": i, "text": t} for i, t in enumerate(TEXTS))
+        return list(run_pipeline(records, ner_config, batch_size=2, n_process=2))
+
+    first = run()
+    assert [r["id"] for r in first] == list(range(len(TEXTS)))
+    assert_same_skills(run(), first)
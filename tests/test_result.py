@@ -0,0 +1,78 @@
+"""
+Module for Testing the compact CV results.
+
+The tests use a small spaCy pipeline (see conftest.py)
+and the hashing embeddings, so that they do not need to download any model.
+"""
+
+import json
+
+import pytest
+
+from esco import LocalDB
+from esco.ner import Ner
+from esco.result import CvResult, SkillHit, dumps
+
+from conftest import HASKELL, PYTHON
+
+TEXT = "I write Haskell and Python. I develop web applications with a team."
+
+
+@pytest.fixture(scope="module")
+def ner(model_path):
+    """
+    Fixture to create a Ner with the hashing embeddings.
+    """
+    db = LocalDB(
+        vector_idx_config={"backend": "numpy", "embeddings": {"backend": "hashing"}}
+    )
+    yield Ner(db=db, model_name_or_path=model_path)
+
+
+def test_cv_result_matches_cv(ner):
+    """
+    Tests that a result has the same content of the EscoCV,
+    and that it survives a JSON round trip.
+    """
+    cv = ner(TEXT)
+    result = CvResult.from_cv(cv)
+    cv.release()
+    assert cv._doc is None  # pylint: disable=protected-access
+
+    data = result.to_dict()
+    assert data["entities"] == cv.entities()["entities"]
+    assert data["count"] == 2
+    assert data["ner_skills"] == cv.ner_skills()
+    assert set(data["skills"]) == set(cv.skills())
+    assert [s["text"] for s in data["sentences"]] == [
+        "I write Haskell and Python.",
+        "I develop web applications with a team.",
+    ]
+    assert set(result.to_dict(keys=("ner_skills",))["ner_skills"]) == {
+        HASKELL,
+        PYTHON,
+    }
+    assert CvResult.from_dict(json.loads(dumps(data))) == result
+    assert not hasattr(result.skills[0], "__dict__")
+
+
+def test_cv_result_without_skills(ner):
+    """
+    Tests that the neural results are omitted when not requested.
+    """
+    result = CvResult.from_cv(ner(TEXT), skills=False)
+    assert set(result.to_dict()) == {"entities", "count", "ner_skills"}
+    assert SkillHit("uri", "label").to_dict() == {"uri": "uri", "label": "label"}
+
+
+def test_dumps_msgpack(ner):
+    """
+    Tests the msgpack serialization.
+    """
+    msgpack = pytest.importorskip("msgpack")
+    data = CvResult.from_cv(ner(TEXT)).to_dict()
+    assert CvResult.from_dict(msgpack.unpackb(dumps(data, "msgpack"))).to_dict() == (
+        data
+    )
+    with pytest.raises(ValueError):
+        dumps(data, "xml")
@@ -0,0 +1,185 @@
+"""
+Module for Testing the persistent result cache.
+
+The tests use a small spaCy pipeline (see conftest.py)
+and the hashing embeddings, so that they do not need to download any model.
+"""
+
+import pytest
+
+from esco import LocalDB
+from esco.cache import ResultCache
+from esco.ner import Ner
+
+from conftest import HASKELL, PYTHON
+
+TEXTS = [
+    "I write Haskell and Python.",
+    "I develop web applications in python with a team of five people.",
+    "Nothing to see here.",
+]
+
+
+class CountingModel:
+    """A spaCy model wrapper counting the processed texts."""
+
+    def __init__(self, nlp):
+        self.nlp = nlp
+        self.texts = []
+
+    def __getattr__(self, name):
+        return getattr(self.nlp, name)
+
+    def __call__(self, text):
+        self.texts.append(text)
+        return self.nlp(text)
+
+    def pipe(self, texts, **kwargs):
+        texts = list(texts)
+        self.texts.extend(texts)
+        return self.nlp.pipe(texts, **kwargs)
+
+
+@pytest.fixture
+def ner(model_path, tmpdir, request):
+    """
+    Fixture to create a Ner with a persistent result cache,
+    counting the texts processed by spaCy.
+    """
+    db = LocalDB(
+        vector_idx_config={"backend": "numpy", "embeddings": {"backend": "hashing"}}
+    )
+    cache = ResultCache(tmpdir / f"results-{request.node.name}.sqlite")
+    ner = Ner(db=db, model_name_or_path=model_path, result_cache=cache)
+    ner.model = CountingModel(ner.model)
+    yield ner
+    cache.close()
+
+
+def test_result_cache_evicts_least_recently_used(tmpdir):
+    """
+    Tests that entries are evicted by size, least recently used first,
+    and persisted on disk.
+    """
+    path = tmpdir / "eviction.sqlite"
+    cache = ResultCache(path, max_bytes=20)
+    cache.put("a", {"x": 1})
+    cache.put("b", {"x": 2})
+    assert cache.get("a") == {"x": 1}
+    cache.put("c", {"x": 3})
+    assert "b" not in cache
+    assert cache.get("b") is None
+    assert cache.stats() == {
+        "size": 2,
+        "nbytes": 16,
+        "max_bytes": 20,
+        "hits": 1,
+        "misses": 1,
+        "hit_rate": 0.5,
+    }
+    cache.close()
+
+    cache = ResultCache(path)
+    assert cache.get("c") == {"x": 3}
+    assert cache.key("text", {"k": 1}) == cache.key("text", {"k": 1})
+    assert cache.key("text", {"k": 1}) != cache.key("text", {"k": 2})
+    cache.close()
+
+
+def test_pipe_skips_cached_texts(ner):
+    """
+    Tests that cached texts are not processed by spaCy,
+    returning the same results.
+    """
+    expected = [cv.skills() for cv in ner.pipe(TEXTS)]
+    assert ner.model.texts == TEXTS
+
+    cvs = list(ner.pipe(TEXTS + ["I write Haskell."]))
+    assert ner.model.texts == TEXTS + ["I write Haskell."]
+    assert [cv.skills() for cv in cvs[:3]] == expected
+    assert set(cvs[3].ner_skills()) == {HASKELL}
+    assert ner.result_cache.hits == 3
+
+
+def test_cv_is_saved_once_complete(ner, monkeypatch):
+    """
+    Tests that a CV is stored once, when its results are complete,
+    and that a cached CV does not parse the text again.
+    """
+    puts = []
+    put = ner.result_cache.put
+    monkeypatch.setattr(ner.result_cache, "put", lambda *a: puts.append(put(*a)))
+    text = TEXTS[1]
+
+    cv = ner(text)
+    assert set(cv.ner_skills()) == {PYTHON}
+    cv.skills_by_sentence()
+    assert not puts
+    skills = cv.skills()
+    assert len(puts) == 1
+    cv.skills()
+    assert len(puts) == 1
+
+    cached = ner(text)
+    assert cached.skills() == skills
+    assert cached.skills_by_sentence() == cv.skills_by_sentence()
+    assert ner.model.texts == [text]
+    assert len(puts) == 1
+
+
+def test_result_cache_tracks_its_size(tmpdir):
+    """
+    Tests that the running size is updated on insert, replace and eviction,
+    and that it is loaded from the database.
+    """
+    path = tmpdir / "size.sqlite"
+    cache = ResultCache(path, max_bytes=100)
+    cache.put("a", "x" * 10)
+    cache.put("a", "x" * 20)
+    cache.put("b", "x" * 30)
+    assert cache.nbytes == 22 + 32
+    cache.put("c", "x" * 60)
+    assert cache.nbytes == 62
+    assert len(cache) == 1
+    cache.close()
+
+    cache = ResultCache(path)
+    assert cache.nbytes == 62
+    cache.clear()
+    assert cache.nbytes == 0
+    cache.close()
+
+
+def test_cache_key_depends_on_the_search_settings(ner):
+    """
+    Tests that the cache key changes with the search parameters,
+    the vector index configuration and the skills,
+    and that it does not depend on object addresses.
+    """
+
+    class Tokenizer:
+        def __call__(self, text):
+            return text.split(".")
+
+    key = ner.cache_key(TEXTS[0])
+    ner.tokenizer = Tokenizer()
+    with_tokenizer = ner.cache_key(TEXTS[0])
+    ner.tokenizer = Tokenizer()
+    assert ner.cache_key(TEXTS[0]) == with_tokenizer != key
+    ner.tokenizer = None
+    assert ner.cache_key(TEXTS[0]) == key
+
+    idx = ner.db.vector_idx
+    idx.model_params = {**idx.model_params, "score_threshold": 0.99}
+    assert ner.cache_key(TEXTS[0]) != key
+
+    key = ner.cache_key(TEXTS[0])
+    idx.config = {**idx.config, "quantization": "int8"}
+    assert ner.cache_key(TEXTS[0]) != key
+    idx.config = {**idx.config, "embedding_cache": {"maxsize": 10}}
+    key = ner.cache_key(TEXTS[0])
+    idx.config = {k: v for k, v in idx.config.items() if k != "embedding_cache"}
+    assert ner.cache_key(TEXTS[0]) == key
+
+    ner.db.add_skills([{"uri": "par-tec:quokka", "label": "Quokka"}])
+    assert ner.cache_key(TEXTS[0]) != key
@@ -0,0 +1,73 @@
+"""
+Module for Testing the ESCO entity ruler.
+
+The tests use a blank pipeline with a component recording
+the processed texts, to check that the phrase patterns
+are created with the tokenizer only.
+"""
+
+import pytest
+import spacy
+from spacy.language import Language
+
+import esco.ruler  # noqa: F401 pylint: disable=unused-import
+
+SEEN = []
+PATTERN = {"label": "SKILL", "pattern": "Machine Learning", "id": "esco:ml"}
+
+
+@Language.component("test_ruler_spy")
+def spy(doc):
+    """Record the texts processed by the pipeline."""
+    SEEN.append(doc.text)
+    return doc
+
+
+def make_nlp(attr: str):
+    nlp = spacy.blank("en")
+    nlp.add_pipe("test_ruler_spy")
+    ruler = nlp.add_pipe(
+        "esco_entity_ruler",
+        name="entity_ruler",
+        config={"phrase_matcher_attr": attr},
+        after="test_ruler_spy",
+    )
+    return nlp, ruler
+
+
+@pytest.fixture(autouse=True)
+def seen():
+    SEEN.clear()
+    yield SEEN
+
+
+def test_phrase_patterns_use_the_tokenizer(seen, tmp_path):
+    """
+    Tests that adding and loading the phrase patterns
+    does not run the preceding components.
+    """
+    nlp, ruler = make_nlp("LOWER")
+    ruler.add_patterns([PATTERN])
+    assert seen == []
+
+    nlp.to_disk(tmp_path)
+    nlp = spacy.load(tmp_path)
+    assert seen == []
+
+    doc = nlp("I like machine learning.")
+    assert [(e.text, e.label_, e.ent_id_) for e in doc.ents] == [
+        ("machine learning", "SKILL", "esco:ml")
+    ]
+    assert seen == ["I like machine learning."]
+
+
+def test_phrase_patterns_on_other_attrs(seen):
+    """
+    Tests that the phrase patterns on attributes not set by the tokenizer
+    are still processed by the preceding components:
+    the blank pipeline has no tagger, so the POS patterns are refused.
+    """
+    _, ruler = make_nlp("POS")
+    with pytest.raises(ValueError, match="E155"):
+        ruler.add_patterns([PATTERN])
+    assert seen == ["Machine Learning"]
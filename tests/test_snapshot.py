@@ -0,0 +1,71 @@
+"""
+Unit tests for the binary snapshots of the ESCO tables.
+
+This module verifies that a snapshot created from the `.json.gz` files
+contains the same data, and that the embedding matrix is memory-mapped.
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from esco import snapshot
+
+ESCODIR = Path(snapshot.__file__).parent
+
+
+@pytest.mark.parametrize("name", ["esco_s.json.gz", "esco_o.json.gz"])
+def test_snapshot_roundtrip(tmpdir, name):
+    """
+    Test that a snapshot preserves all the columns of the source table.
+    """
+    source = ESCODIR / name
+    expected = pd.read_json(source, orient="record")
+
+    path = snapshot.convert(source, tmpdir / name)
+    assert snapshot.is_fresh(path, source)
+
+    actual = snapshot.read_snapshot(path)
+    assert actual.columns.tolist() == expected.columns.tolist()
+    assert actual.drop(columns="vector", errors="ignore").equals(
+        expected.drop(columns="vector", errors="ignore")
+    )
+
+
+def test_snapshot_vectors_are_memory_mapped(tmpdir):
+    """
+    Test that the vector column is backed by a float32 memory-mapped matrix.
+    """
+    source = ESCODIR / "esco_s.json.gz"
+    expected = pd.read_json(source, orient="record")
+    path = snapshot.convert(source, tmpdir / "skills-mmap")
+
+    actual = snapshot.read_snapshot(path)
+    vector = actual.vector.iloc[0]
+    assert isinstance(vector, np.memmap)
+    assert vector.dtype == np.float32
+    np.testing.assert_allclose(
+        np.stack(actual.vector.values),
+        np.asarray(expected.vector.tolist()),
+        atol=1e-6,
+    )
+
+
+def test_stale_snapshot_is_detected(tmpdir):
+    """
+    Test that a snapshot is not used when its source file changes.
+    """
+    source = tmpdir / "esco_x.json.gz"
+    pd.read_json(ESCODIR / "esco_o.json.gz", orient="record")[:5].to_json(
+        source, orient="records", compression="gzip"
+    )
+    path = snapshot.convert(source)
+    assert path == tmpdir / "esco_x.snapshot"
+    assert snapshot.is_fresh(path, source)
+
+    pd.read_json(ESCODIR / "esco_o.json.gz", orient="record")[:3].to_json(
+        source, orient="records", compression="gzip"
+    )
+    assert not snapshot.is_fresh(path, source)
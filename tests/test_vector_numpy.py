@@ -0,0 +1,334 @@
+"""
+Module for Testing the in-process NumPy vector index.
+
+This module verifies that `NumpyVectorDB` returns the same result schema
+of `VectorDB.search`, and that it can be selected via `LocalDB(vector_idx_config=...)`.
+"""
+
+import numpy as np
+import pytest
+
+import esco
+from esco import LocalDB, snapshot
+from esco.embeddings import HashingEmbeddings
+from esco.vector import SKILLS_MODEL_NAME, NumpyVectorDB, recall_report
+
+skills = esco.load_table("skills")
+
+
+@pytest.fixture(scope="module")
+def numpy_db():
+    """
+    Fixture to create a LocalDB instance using the NumPy vector index.
+    """
+    db = LocalDB(vector_idx_config={"backend": "numpy"})
+    yield db
+    db.close()
+
+
+def test_localdb_selects_numpy_backend(numpy_db):
+    """
+    Tests that the NumPy backend is selected and indexes all the skills.
+    """
+    assert isinstance(numpy_db.vector_idx, NumpyVectorDB)
+    assert numpy_db.validate()
+
+
+def test_localdb_rejects_unknown_backend():
+    """
+    Tests that an unknown vector index backend raises an error.
+    """
+    with pytest.raises(ValueError):
+        LocalDB(vector_idx_config={"backend": "unknown"})
+
+
+@pytest.mark.parametrize("position", [0, 10, 100])
+def test_search_by_vector_finds_the_skill(numpy_db, position):
+    """
+    Tests that searching with the embedding of a skill returns that skill first,
+    sorted by score and with the same schema of VectorDB.search.
+    """
+    idx = numpy_db.vector_idx
+    ret = idx.search_by_vector(skills.vector.iloc[position], k=5)
+    assert len(ret) == 5
+    assert ret[0]["uri"] == skills.index[position]
+    assert ret[0]["label"] == skills.label.iloc[position]
+    assert ret[0]["score"] == pytest.approx(1, abs=1e-5)
+    assert [x["score"] for x in ret] == sorted((x["score"] for x in ret), reverse=True)
+    assert set(ret[0]) == {"uri", "label", "score"}
+
+
+def test_search_by_vector_score_threshold(numpy_db):
+    """
+    Tests that results below the score threshold are discarded.
+    """
+    ret = numpy_db.vector_idx.search_by_vector(
+        skills.vector.iloc[0], k=10, score_threshold=0.99
+    )
+    assert [x["uri"] for x in ret] == [skills.index[0]]
+
+
+def test_search_neural(numpy_db):
+    """
+    Tests a text search, that requires the sentence-transformers model.
+    """
+    ret = numpy_db.search_neural("haskell")
+    assert ret
+    assert "haskell" in ret[0]["label"].lower()
+
+
+def test_search_many_by_vector_matches_search_by_vector(numpy_db):
+    """
+    Tests that a batched search returns the same results of single searches.
+    """
+    idx = numpy_db.vector_idx
+    vectors = skills.vector.iloc[[0, 5, 7]].tolist()
+    ret = idx.search_many_by_vector(vectors, k=3, score_threshold=0.3)
+    expected = [idx.search_by_vector(v, k=3, score_threshold=0.3) for v in vectors]
+    assert len(ret) == len(expected)
+    for actual, single in zip(ret, expected):
+        assert [x["uri"] for x in actual] == [x["uri"] for x in single]
+        assert [x["score"] for x in actual] == pytest.approx(
+            [x["score"] for x in single], abs=1e-5
+        )
+
+
+@pytest.mark.parametrize(
+    "filter_",
+    [{"skillType": "skill"}, {"skillType": ["knowledge"], "namespace": "esco:"}],
+)
+def test_search_by_vector_filter(numpy_db, filter_):
+    """
+    Tests that metadata filters are applied inside the search,
+    returning k results matching the filter.
+    """
+    ret = numpy_db.vector_idx.search_by_vector(
+        skills.vector.iloc[0], k=7, filter=filter_
+    )
+    assert len(ret) == 7
+    skill_types = filter_["skillType"]
+    for skill in numpy_db.get_many(x["uri"] for x in ret):
+        assert skill["skillType"] in skill_types
+
+
+def test_search_by_vector_unknown_filter(numpy_db):
+    """
+    Tests that filtering on an unknown field raises an error.
+    """
+    with pytest.raises(ValueError):
+        numpy_db.vector_idx.search_by_vector(skills.vector.iloc[0], filter={"x": 1})
+
+
+@pytest.mark.parametrize(
+    "config",
+    [
+        {"quantization": "int8"},
+        {"quantization": "int8", "pca_dim": 96},
+        {"quantization": "binary", "oversampling": 10},
+    ],
+)
+def test_quantized_search_rescores_candidates(config):
+    """
+    Tests that the candidates of a quantized index are rescored
+    with a memory-mapped float32 copy of the vectors, that does not
+    reference the skills table nor count in the index memory.
+    """
+    exact = NumpyVectorDB(skills=skills, config={"backend": "numpy"})
+    idx = NumpyVectorDB(skills=skills, config={"backend": "numpy", **config})
+    assert idx.count() == len(skills)
+    assert isinstance(idx.vectors, np.memmap)
+    assert idx.vectors.dtype == np.float32
+    assert not np.shares_memory(idx.vectors, skills.vector.iloc[0])
+    assert idx.nbytes * 3 < exact.nbytes
+
+    vector = skills.vector.iloc[10]
+    ret = idx.search_by_vector(vector, k=5, filter={"skillType": "skill"})
+    expected = exact.search_by_vector(vector, k=5, filter={"skillType": "skill"})
+    assert ret[0]["uri"] == skills.index[10]
+    for actual in ret:
+        same = next((x for x in expected if x["uri"] == actual["uri"]), None)
+        if same:
+            assert actual["score"] == pytest.approx(same["score"], abs=1e-5)
+
+    assert idx.upsert_skills(skills[10:12]) == 2
+    assert isinstance(idx.vectors, np.memmap)
+    assert idx.search_by_vector(vector, k=1)[0]["uri"] == skills.index[10]
+
+
+def test_quantized_search_without_rescoring():
+    """
+    Tests that without rescoring the index only keeps the quantized codes.
+    """
+    exact = NumpyVectorDB(skills=skills, config={"backend": "numpy"})
+    idx = NumpyVectorDB(
+        skills=skills,
+        config={"backend": "numpy", "quantization": "int8", "rescore": False},
+    )
+    assert idx.vectors is None
+    assert idx.nbytes * 3 < exact.nbytes
+    assert (
+        idx.search_by_vector(skills.vector.iloc[10], k=5)[0]["uri"]
+        == (skills.index[10])
+    )
+
+
+@pytest.mark.parametrize(
+    "config",
+    [
+        {"quantization": "int8"},
+        {"quantization": "int8", "pca_dim": 96},
+        {"quantization": "binary", "pca_dim": 96},
+    ],
+)
+def test_quantized_scores_without_rescoring(config):
+    """
+    Tests that the approximate scores are cosine similarities,
+    so that a skill scores about 1.0 against itself
+    and the default score_threshold applies to them too.
+    """
+    idx = NumpyVectorDB(
+        skills=skills, config={"backend": "numpy", "rescore": False, **config}
+    )
+    (ret,) = idx.search_many_by_vector([skills.vector.iloc[10]], k=1)
+    assert ret[0]["uri"] == skills.index[10]
+    assert ret[0]["score"] == pytest.approx(1.0, abs=0.02)
+
+
+def test_quantized_search_uses_the_snapshot_vectors(tmp_path):
+    """
+    Tests that skills loaded from a snapshot are rescored
+    with the memory-mapped matrix, that is not copied in memory.
+    """
+    columns = ["label", "skillType", "text", "vector"]
+    snapshot.write_snapshot(skills[columns].reset_index(), tmp_path)
+    mapped = snapshot.read_snapshot(tmp_path).set_index("uri")
+    idx = NumpyVectorDB(
+        skills=mapped, config={"backend": "numpy", "quantization": "int8"}
+    )
+    assert isinstance(idx.vectors, np.memmap)
+    assert idx.nbytes * 3 < NumpyVectorDB(skills=skills).nbytes
+    assert (
+        idx.search_by_vector(skills.vector.iloc[10], k=5)[0]["uri"]
+        == (skills.index[10])
+    )
+
+
+@pytest.mark.parametrize(
+    "setting,floor",
+    [
+        ({"quantization": "int8"}, 0.99),
+        ({"quantization": "int8", "pca_dim": 96}, 0.95),
+        ({"quantization": "binary", "oversampling": 10}, 0.95),
+        ({"quantization": "int8", "rescore": False}, 0.95),
+    ],
+)
+def test_recall_floor(setting, floor):
+    """
+    Tests the recall@10 of the quantized settings against the exact search.
+    """
+    queries = skills.vector.iloc[::20].tolist()
+    (ret,) = recall_report(skills, [setting], k=10, queries=queries)
+    assert ret["recall@10"] >= floor
+
+
+def test_recall_report():
+    """
+    Tests that the recall report compares the quantized indexes
+    with the exact search.
+    """
+    queries = skills.vector.iloc[:50].tolist()
+    ret = recall_report(
+        skills,
+        [
+            {"quantization": "int8", "rescore": False},
+            {"quantization": "binary", "rescore": False},
+        ],
+        k=5,
+        queries=queries,
+    )
+    int8, binary = ret
+    assert int8["recall@5"] > 0.9
+    assert 0 < binary["recall@5"] <= int8["recall@5"]
+    assert binary["compression"] > int8["compression"] > 3
+
+
+def test_search_neural_offline():
+    """
+    Tests a text search with the hashing embeddings,
+    that re-embed the skills without downloading any model.
+    """
+    db = LocalDB(
+        vector_idx_config={"backend": "numpy", "embeddings": {"backend": "hashing"}}
+    )
+    assert db.vector_idx.model_name == "hashing-384"
+    ret = db.search_neural("haskell")
+    assert "haskell" in ret[0]["label"].lower()
+
+
+def test_sync_updates_the_index_in_place():
+    """
+    Tests that sync upserts the changed skills and deletes the stale ones,
+    and that validate detects the drift.
+    """
+    db = LocalDB(vector_idx_config={"backend": "numpy"})
+    db.skills = db.skills.drop(index=db.skills.index[:2])
+    with pytest.raises(ValueError):
+        db.validate()
+
+    skills = db.skills.copy()
+    skills.loc[skills.index[0], "vector"] = skills.vector.iloc[1]
+    db.skills = skills
+    assert db.sync_vector_idx() == {"upserted": 1, "deleted": 2}
+    assert db.validate()
+
+    ret = db.vector_idx.search_by_vector(skills.vector.iloc[1], k=2)
+    assert {x["uri"] for x in ret} == set(skills.index[:2])
+
+
+def test_add_and_remove_skills_update_the_index():
+    """
+    Tests that custom skills are embedded and searchable once added,
+    and not found once removed.
+    """
+    db = LocalDB(
+        vector_idx_config={"backend": "numpy", "embeddings": {"backend": "hashing"}}
+    )
+    (uri,) = db.add_skills(
+        [{"uri": "par-tec:quokka", "label": "Quokka", "description": "quokka farming"}]
+    )
+    assert db.validate()
+    assert db.search_neural("quokka farming")[0]["uri"] == uri
+
+    assert db.remove_skills([uri]) == 1
+    assert db.validate()
+    assert uri not in {x["uri"] for x in db.search_neural("quokka farming")}
+
+
+def fake_skills_model(model_name, **kwargs):  # pylint: disable=unused-argument
+    """
+    An embedding backend posing as the model of the distributed skills,
+    see test_index_embeds_skills_added_without_vector.
+    """
+    return HashingEmbeddings(**kwargs)
+
+
+def test_index_embeds_skills_added_without_vector():
+    """
+    Tests that skills added without a vector index are embedded
+    when the index is created.
+    """
+    db = LocalDB()
+    (uri,) = db.add_skills(
+        [{"uri": "par-tec:quokka", "label": "Quokka", "description": "quokka farming"}]
+    )
+    assert db.get(uri)["vector"] is None
+
+    db.create_vector_idx(
+        {
+            "backend": "numpy",
+            "embeddings": {"backend": "test_vector_numpy:fake_skills_model"},
+        }
+    )
+    assert db.vector_idx.model_name == SKILLS_MODEL_NAME
+    assert db.validate()
+    assert db.search_neural("quokka farming")[0]["uri"] == uri